@@ -9,9 +9,12 @@ __version__ = "beta"
 #        Brief description continued.
 # More details.
 
-import sys, inspect
+import sys, inspect, time
 import StringIO, traceback
-import threading, gtk
+import threading, collections
+import cProfile, pstats
+try:	import gtk		# optional; only needed for 'Thread(use_gtk=True)'
+except ImportError:	gtk = None
 
 
 class MultClass():
@@ -316,6 +319,350 @@ class Thread(threading.Thread):
 		#if wait: self.__cancel.wait()					# wait for clean finish
 
 
+# thanks to http://docs.python.org/library/collections.html#collections.deque
+# and http://docs.python.org/library/threading.html#condition-objects
+class RingBuffer(object):
+	"""Thread-safe bounded FIFO buffer between producer and consumer
+	thread(s), with explicit overflow policy and drop accounting.
+
+	Example:
+	   buf = RingBuffer(10000, RingBuffer.DROP_OLDEST)
+	   buf.append(item)		# producer thread(s)
+	   ...
+	   items = buf.drain()		# consumer thread; all items at once
+	"""
+
+	# overflow policies
+	DROP_OLDEST	= "drop-oldest"		# discard oldest entry to make room
+	DROP_NEWEST	= "drop-newest"		# discard the new entry
+	BLOCK		= "block"		# wait for the consumer (up to 'timeout')
+	policies	= (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+	# counters
+	appended	= 0
+	dropped		= 0
+
+	def __init__(self, capacity=100000, policy=DROP_OLDEST, timeout=None):
+		"""The constructor for the class.
+
+		capacity   maximum number of entries held
+		policy     one of 'policies', what to do when the buffer is full
+		timeout    seconds to block at most before dropping the new
+		           entry (policy BLOCK only, None: forever)"""
+
+		if policy not in self.policies:
+			raise ValueError("unknown overflow policy '%s' (known: %s)" % (policy, ", ".join(self.policies)))
+		if capacity < 1:
+			raise ValueError("capacity must be positive")
+		self.capacity, self.policy, self.timeout = capacity, policy, timeout
+		self.__items	= collections.deque()
+		self.__lock	= threading.Condition(threading.Lock())
+		self.__closed	= False
+		self.__waiting	= 0			# consumers waiting in 'drain'
+
+
+	def __len__(self):
+		return len(self.__items)
+
+	def append(self, item):
+		"""Add item (see 'dropped' for entries lost by overflow)."""
+
+		with self.__lock:
+			if (len(self.__items) < self.capacity) or self.__make_room():
+				self.__items.append( item )
+				self.appended += 1
+				if self.__waiting: self.__lock.notify()
+
+	def extend(self, items):
+		"""Add all items (in order)."""
+
+		with self.__lock:
+			for item in items:
+				if (len(self.__items) < self.capacity) or self.__make_room():
+					self.__items.append( item )
+					self.appended += 1
+			if self.__waiting: self.__lock.notify()
+
+	def drain(self, max_items=None, timeout=0):
+		"""Remove and return (up to max_items) entries as list, oldest
+		first. Waits up to timeout seconds (None: forever) while empty."""
+
+		with self.__lock:
+			if not self.__items and (timeout != 0) and not self.__closed:
+				self.__waiting += 1
+				self.__lock.wait(timeout)
+				self.__waiting -= 1
+			if (max_items is None) or (max_items >= len(self.__items)):
+				(result, self.__items) = (list(self.__items), collections.deque())
+			else:
+				result = [ self.__items.popleft() for i in range(max_items) ]
+			self.__lock.notify_all()				# wake blocked producers
+			return result
+
+	def close(self):
+		"""Consumer is gone; never block producers anymore (full buffer
+		drops like DROP_NEWEST)."""
+
+		with self.__lock:
+			self.__closed = True
+			if (self.policy == self.BLOCK): self.policy = self.DROP_NEWEST
+			self.__lock.notify_all()
+
+	def __make_room(self):
+		"""Apply overflow policy (lock held); returns True if the new
+		entry may be added."""
+
+		if (self.policy == self.BLOCK) and not self.__closed:
+			self.__wait_free()
+			if (len(self.__items) < self.capacity): return True
+		self.dropped += 1
+		if (self.policy != self.DROP_OLDEST): return False
+		self.__items.popleft()
+		return True
+
+	def __wait_free(self):
+		"""Wait (lock held) until there is room, closed or 'timeout'."""
+
+		deadline = None
+		if self.timeout is not None: deadline = time.time() + self.timeout
+		while (len(self.__items) >= self.capacity) and not self.__closed:
+			remaining = None
+			if deadline is not None:
+				remaining = deadline - time.time()
+				if (remaining <= 0): break
+			self.__lock.wait(remaining)
+
+
+class AsyncWriter(threading.Thread):
+	"""Write text to streams (files, console) from a background thread, so
+	slow disk or terminal output never blocks the writing thread. Queued
+	text is written in batches; the streams get flushed after 'flush_bytes'
+	bytes or 'flush_interval' seconds. If the queue is full text gets
+	dropped (see 'dropped'), 'lag' tells how far behind the writer is.
+
+	Example:
+	   out = AsyncWriter(["urls.log", sys.stdout])
+	   out.start()
+	   out.write("http://...\n")	# any thread; never blocks
+	   ...
+	   out.reopen()			# e.g. after log rotation
+	   out.close()			# write the rest and wait
+	"""
+
+	# counters
+	written		= 0			# entries written
+	written_bytes	= 0
+	batches		= 0			# batches written (write calls per stream)
+	error		= None			# last I/O error (writing goes on)
+
+	def __init__(self, streams, capacity=10000, flush_bytes=65536, flush_interval=1.):
+		"""The constructor for the class.
+
+		streams         file names (opened for appending) and/or open streams
+		capacity        maximum number of entries queued ('write' calls)
+		flush_bytes     flush the streams after that many bytes ...
+		flush_interval  ... or seconds (also the longest delay of output)"""
+
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+		self.names	= [ item for item in streams if isinstance(item, basestring) ]
+		self.streams	= [ item for item in streams if not isinstance(item, basestring) ]
+		self.flush_bytes, self.flush_interval = flush_bytes, flush_interval
+		self.__files	= [ open(name, 'a') for name in self.names ]
+		self.__queue	= RingBuffer(capacity, RingBuffer.DROP_NEWEST)
+		self.__oldest	= None			# time of oldest entry queued or being written
+		self.__reopen	= False
+		self.__closed	= False
+
+	def __get_dropped(self): return self.__queue.dropped
+	dropped = property(__get_dropped, doc="entries lost since the queue was full")
+
+	def write(self, text):
+		"""Queue text for writing (thread-safe, never blocks)."""
+
+		self.__queue.append( (time.time(), text) )
+
+	def lag(self):
+		"""Return (entries queued, seconds the oldest unwritten entry waits)."""
+
+		oldest = self.__oldest
+		return (len(self.__queue), oldest and max(time.time() - oldest, 0.) or 0.)
+
+	def reopen(self):
+		"""Reopen the named files (done by the writer thread, after the
+		text queued before)."""
+
+		self.__reopen = True
+		self.__queue.append( (time.time(), None) )	# marker (flag if dropped)
+
+	def close(self):
+		"""Write all queued text, flush and wait for the writer thread;
+		close the named files."""
+
+		self.__closed = True
+		self.__queue.close()
+		if self.is_alive(): self.join()
+		else:		    self.run()		# (never started)
+
+	def run(self):
+		""" Write queued text ad infinitum (until 'close'). """
+		pending = 0
+		last = time.time()
+		while True:
+			items = self.__queue.drain(timeout=self.flush_interval)
+			if items: self.__oldest = items[0][0]
+			try:
+				texts = [ item[1] for item in items ]
+				while None in texts:				# reopen marker
+					index = texts.index(None)
+					pending += self.__write(texts[:index])
+					del texts[:index+1]
+					self.__flush()
+					self.__open()
+				pending += self.__write(texts)
+				now = time.time()
+				if (pending >= self.flush_bytes) or (pending and (now - last >= self.flush_interval)) or self.__closed:
+					self.__flush()
+					(pending, last) = (0, now)
+				if self.__reopen: self.__open()
+			except (IOError, OSError), e:
+				self.error = e
+			self.__oldest = None
+			if self.__closed and not len(self.__queue): break
+		for stream in self.__files: stream.close()
+
+	def __write(self, texts):
+		"""Write texts to all streams at once; returns bytes written."""
+
+		if not texts: return 0
+		text = "".join(texts)
+		for stream in self.__files + self.streams:
+			stream.write(text)
+			self.batches += 1
+		self.written += len(texts)
+		self.written_bytes += len(text)
+		return len(text)
+
+	def __flush(self):
+		for stream in self.__files + self.streams: stream.flush()
+
+	def __open(self):
+		"""Reopen the named files (keeps the old ones on error)."""
+
+		files = [ open(name, 'a') for name in self.names ]
+		self.__reopen = False
+		for stream in self.__files: stream.close()
+		self.__files = files
+
+
+class Profiler(object):
+	"""Profile a function run in a thread (e.g. the pcap loop of a sniffer
+	thread) and write a text report: deterministic by 'cProfile' (every
+	call; exact counts, but slows the profiled code down) or by sampling
+	(the stack of the thread is looked at every 'interval' seconds from a
+	helper thread; low overhead, statistical).
+
+	Example:
+	   prof = Profiler(Profiler.SAMPLE, "profile.txt")
+	   prof.runcall(pcap.loop, 0, handler)	# in the thread to profile
+	   prof.dump(["extra report line", ...])
+	"""
+
+	# modes
+	CPROFILE	= "cprofile"
+	SAMPLE		= "sample"
+	modes		= (CPROFILE, SAMPLE)
+
+	# counters
+	samples		= 0			# stacks sampled (mode SAMPLE)
+	seconds		= 0.			# time spent in 'runcall'
+
+	def __init__(self, mode=CPROFILE, filename="profile.txt", interval=0.005, limit=40):
+		"""The constructor for the class.
+
+		mode        CPROFILE or SAMPLE
+		filename    file of the text report (mode CPROFILE: raw stats for
+		            'pstats' go to filename + '.pstats' too)
+		interval    seconds between samples (mode SAMPLE)
+		limit       functions listed in the report"""
+
+		if mode not in self.modes: raise ValueError("unknown profiling mode '%s'" % mode)
+		self.mode, self.filename, self.interval, self.limit = mode, filename, interval, limit
+		self.profile	= None
+		self.counts	= {}			# function: [self samples, cumulative samples]
+		self.__stop	= threading.Event()
+
+	def runcall(self, func, *args, **kwargs):
+		"""Run and profile func (call in the thread to profile)."""
+
+		start = time.time()
+		try:
+			if self.mode == self.CPROFILE:
+				self.profile = cProfile.Profile()
+				return self.profile.runcall(func, *args, **kwargs)
+			sampler = threading.Thread(target=self.__sample, args=(threading.current_thread().ident,))
+			sampler.setDaemon(True)
+			self.__stop.clear()
+			sampler.start()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				self.__stop.set()
+				sampler.join()
+		finally:
+			self.seconds += time.time() - start
+
+	def report(self):
+		"""Return the profile as text."""
+
+		output = StringIO.StringIO()
+		output.write("# profile (%s) of %.1f s\n" % (self.mode, self.seconds))
+		if self.mode == self.CPROFILE:
+			if self.profile: pstats.Stats(self.profile, stream=output).sort_stats("cumulative").print_stats(self.limit)
+		else:
+			output.write("# %i samples every %g s\n" % (self.samples, self.interval))
+			output.write("%8s %6s %8s %6s  %s\n" % ("self", "%", "cumul.", "%", "function"))
+			total = float(max(self.samples, 1))
+			ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:self.limit]
+			for ((filename, line, name), (own, cumulative)) in ranked:
+				output.write("%8i %6.1f %8i %6.1f  %s:%i(%s)\n" % (own, own*100/total, cumulative, cumulative*100/total,
+										filename, line, name))
+		text = output.getvalue()
+		output.close()
+		return text
+
+	def dump(self, lines=[]):
+		"""Write report (with extra lines appended) to 'filename'."""
+
+		report = open(self.filename, 'w')
+		report.write(self.report())
+		if lines: report.write("\n" + "".join([ line + "\n" for line in lines ]))
+		report.close()
+		if self.profile: self.profile.dump_stats(self.filename + ".pstats")
+
+	def __sample(self, ident):
+		"""Sampler thread: count functions on the stack of thread ident."""
+
+		counts = self.counts
+		while not self.__stop.wait(self.interval):
+			frame = sys._current_frames().get(ident)
+			if frame is None: continue
+			self.samples += 1
+			seen = set()
+			top = True
+			while frame is not None:
+				code = frame.f_code
+				key = (code.co_filename, code.co_firstlineno, code.co_name)
+				entry = counts.get(key)
+				if entry is None: entry = counts[key] = [0, 0]
+				if top: entry[0] += 1
+				if key not in seen:		# (recursion counted once)
+					entry[1] += 1
+					seen.add(key)
+				top = False
+				frame = frame.f_back
+
+
 # from 'runbotrun.py'
 def tb_info(exc_info=None):
 	"""Returns the same information as 'sys.exc_info' in the same format (tuple).
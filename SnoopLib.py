@@ -0,0 +1,2349 @@
+""" === PyURLSnooper Library/Module ===
+Shared capture and extraction helpers for 'pyurlsnooper.py' (console) and
+'pyurlsnooper-gtk.py' (GTK/GUI).
+"""
+
+__version__ = "beta"
+
+## Documentation for this module.
+#
+# \brief Code used by both PyURLSnooper scripts.
+# Everything in here must work without GTK, since the console script does
+# not need it.
+
+import re, os, time, struct, socket, heapq, threading, multiprocessing, ctypes, Queue, hashlib, array, bisect, stat
+import csv, json, gzip, sqlite3, urlparse, BaseHTTPServer, SocketServer, select
+from collections import OrderedDict, deque
+try:	import zstandard	# optional; only needed for '.zst' export
+except ImportError:	zstandard = None
+
+from pcapy import open_live, open_offline, DLT_EN10MB, DLT_LINUX_SLL, PcapError
+try:	from pcapy import create as pcap_create	# optional; pcapy >= 0.11 (capture profile settings)
+except ImportError:	pcap_create = None
+from impacket.ImpactDecoder import EthDecoder, LinuxSLLDecoder
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Variables / Constants
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# all schemes accepted by 'regex_links'
+schemes = ("https", "http", "ftp", "gopher", "telnet", "file", "notes", "ms-help", "rtmpe", "rtmp", "rtsp")
+
+# URLs found by the generic extraction (group 1 is the URL), used by both scripts
+# this regex should be improved, because it already caused some problems (e.g. on southpark.de, ...)
+regex_links = re.compile("((https?|ftp|gopher|telnet|file|notes|ms-help|rtmpe?|rtsp):((//)|(\\\\))[\w\d:#%/;$()~_?\-=\\\.&!]*)")
+
+# scheme marker, i.e. ':' followed by '//' or '\' (escaped links like 'http:\/\/...')
+regex_marker = re.compile(r":(?://|\\)")
+regex_scheme = re.compile("(?:%s)$" % "|".join([ re.escape(s) for s in schemes ]))
+scheme_maxlen = max([ len(s) for s in schemes ])
+# unfinished scheme at the very end of a segment (e.g. 'htt', 'rtmp:' or 'http:/')
+regex_partial = re.compile("(?:%s)$" % "|".join([ re.escape(s[:i]) for s in schemes for i in range(1, len(s)+1) ] +
+						  [ re.escape(s + end) for s in schemes for end in (":", ":/", ":\\") ]))
+
+# HTTP/1.x and RTSP requests (method and space at start of payload) and response headers
+http_methods = tuple([ method + " " for method in ("GET", "POST", "HEAD", "PUT", "DELETE", "OPTIONS", "PATCH",
+						   "DESCRIBE", "SETUP", "PLAY", "PAUSE", "TEARDOWN", "ANNOUNCE",
+						   "RECORD", "GET_PARAMETER", "SET_PARAMETER") ])
+http_initials = frozenset([ method[0] for method in http_methods ] + ["H"])	# (of methods and 'HTTP/1.')
+http_schemes = { "HTTP/1.": ("http", 80), "RTSP/1.": ("rtsp", 554) }	# version: (scheme, default port)
+regex_http_host	= re.compile(r"\r\nhost:[ \t]*([^\s]+)", re.I)
+regex_http_type	= re.compile(r"\r\ncontent-type:[ \t]*([^;\s]+)", re.I)
+regex_http_length = re.compile(r"\r\ncontent-length:[ \t]*(\d+)", re.I)
+regex_http_packed = re.compile(r"\r\ncontent-encoding:[ \t]*(?:x-)?(?:gzip|deflate|compress|br)", re.I)
+# response bodies not scanned for URLs (Content-Type prefixes; compressed bodies are skipped too)
+binary_types = ("image/", "audio/", "video/", "font/", "application/octet-stream", "application/zip",
+		"application/gzip", "application/x-gzip", "application/pdf")
+
+# link layer header length and offset of ethertype field
+link_layers = { DLT_EN10MB: (14, 12), DLT_LINUX_SLL: (16, 14) }
+ETH_P_IP, ETH_P_IPV6, ETH_P_8021Q, ETH_P_8021AD = 0x0800, 0x86dd, 0x8100, 0x88a8
+IPPROTO_TCP, IPPROTO_UDP = 6, 17
+TH_FIN, TH_RST = 0x01, 0x04
+struct_ethertype	= struct.Struct("!H")			# precompiled header layouts
+struct_ipv4		= struct.Struct("!BxHxxHxBxx4s4s")	# ver/ihl, length, frag, proto, src, dst
+struct_ipv6		= struct.Struct("!4xHBx16s16s")		# length, next header, src, dst
+struct_tcp		= struct.Struct("!HHL4xBB")		# ports, seq, data offset, flags
+struct_udp		= struct.Struct("!HH")			# ports
+
+# thanks to http://www.tcpdump.org/tcpdump_man.html
+# (IPv4 TCP segments carrying payload; tcp[] offsets do not work for IPv6, so all IPv6 TCP passes)
+bpf_tcp_payload = "((ip and tcp and (((ip[2:2] - ((ip[0]&0xf)<<2)) - ((tcp[12]&0xf0)>>2)) != 0)) or (ip6 and tcp))"
+
+# settings of live captures (name: settings; 'buffer_size' in bytes, 0: libpcap default,
+# 'timeout' in ms; 'buffer_size' and 'immediate' need pcapy >= 0.11, see 'open_capture')
+capture_profiles = OrderedDict([
+	("default",		{"snaplen": 65535, "promisc": False, "timeout": 100, "buffer_size": 0,		"immediate": False}),
+	("low-latency",		{"snaplen": 65535, "promisc": False, "timeout": 10,  "buffer_size": 4*1024*1024,	"immediate": True}),
+	("high-throughput",	{"snaplen": 65535, "promisc": False, "timeout": 250, "buffer_size": 64*1024*1024,	"immediate": False}),
+	("low-memory",		{"snaplen": 2048,  "promisc": False, "timeout": 100, "buffer_size": 512*1024,	"immediate": False}),
+])
+
+# well known ports of the protocols (used for kernel side filtering)
+protocol_ports = {	"http":	[80, 3128, 8000, 8080],
+			"ftp":	[21],
+			"rtmp":	[1935],
+			"rtsp":	[554, 8554],
+}
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Capture sources
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# thanks to http://oss.coresecurity.com/pcapy/doc/pt01.html
+# and http://www.tcpdump.org/manpages/pcap.3pcap.html (pcap_create, pcap_set_*, pcap_activate)
+# (libpcap >= 1.1 reads '.pcapng' files through 'open_offline' as well)
+def open_capture(dev=None, filename=None, profile=None):
+	""" Open a network device for live capturing or a saved capture file
+	    for offline replay (if filename is given, dev is ignored).
+	    A live capture gets the settings of profile (dict, see
+	    'capture_profiles'; missing ones from 'default'); without
+	    'pcapy.create' (pcapy < 0.11) buffer size and immediate mode
+	    are left to libpcap. """
+	if filename:
+		return open_offline(filename)
+	settings = dict(capture_profiles["default"])
+	settings.update( profile or {} )
+	if pcap_create is None:
+		return open_live(dev, settings["snaplen"], int(settings["promisc"]), settings["timeout"])
+	p = pcap_create(dev)
+	p.set_snaplen(settings["snaplen"])
+	p.set_promisc(int(settings["promisc"]))
+	p.set_timeout(settings["timeout"])
+	if settings["buffer_size"]: p.set_buffer_size(settings["buffer_size"])
+	if settings["immediate"] and hasattr(p, "set_immediate_mode"): p.set_immediate_mode(1)
+	p.activate()
+	return p
+
+def capture_profile(name, **settings):
+	""" Return settings of capture profile name (see 'capture_profiles'),
+	    updated by the settings given (None: keep); ValueError if unknown. """
+	if name not in capture_profiles:
+		raise ValueError("unknown capture profile '%s' (known: %s)" % (name, ", ".join(capture_profiles)))
+	profile = dict(capture_profiles[name])
+	profile.update([ (key, value) for (key, value) in settings.items() if value is not None ])
+	return profile
+
+class CaptureTuner:
+	"""
+	Drop-driven tuning of a live capture: when the kernel dropped more than
+	'threshold' of the packets since the last check (pcap stats), the
+	capture is reopened with the buffer doubled (up to 'max_buffer'), then
+	with the snaplen halved (down to 'min_snaplen'). Buffer size and snaplen
+	are fixed once a capture is active, so the new handle is handed to the
+	sniffer thread ('swap'), which goes on with it after the current batch.
+
+	Example:
+	   tuner = CaptureTuner("eth0", build_filter(), capture_profile("default"))
+	   info = tuner.check(sniffer)		# periodically; info if retuned
+	"""
+
+	# counters
+	retuned		= 0			# captures reopened
+
+	def __init__(self, dev, filter, profile, threshold=0.001, interval=5., min_packets=1000,
+		     max_buffer=256*1024*1024, min_snaplen=2048):
+		""" Tune capture on dev (with BPF filter, adapted to the link type
+		    of each new handle by 'link_filter') opened with profile
+		    (settings dict), checking every interval seconds (once
+		    min_packets were received). """
+		self.dev, self.filter, self.profile = dev, filter, dict(profile)
+		self.threshold, self.interval, self.min_packets = threshold, interval, min_packets
+		self.max_buffer, self.min_snaplen = max_buffer, min_snaplen
+		self.__last	= (time.time(), 0, 0)		# (time, received, dropped) of last check
+
+	def check(self, sniffer):
+		""" Look at the drops of sniffer (thread with 'pcap' and 'swap');
+		    return description if the capture got retuned, else None. """
+		now = time.time()
+		if now - self.__last[0] < self.interval: return None
+		stats = pcap_stats(sniffer.pcap)
+		if not stats: return None
+		(received, dropped) = (stats[0] + stats[1], stats[1])	# (kernel counts dropped ones apart)
+		(last, last_received, last_dropped) = self.__last
+		if received < last_received: (last_received, last_dropped) = (0, 0)	# (counters of a new handle)
+		if received - last_received < self.min_packets: return None
+		self.__last = (now, received, dropped)
+		rate = float(dropped - last_dropped) / (received - last_received)
+		if rate <= self.threshold: return None
+		profile = self.next_profile()
+		if profile is None: return None
+		try:
+			p = open_capture(self.dev, profile=profile)
+			p.setfilter(link_filter(self.filter, p.datalink()))
+		except PcapError, e:				# (e.g. buffer too large)
+			self.max_buffer = self.profile["buffer_size"]
+			return "%.2f%% dropped, retuning failed: %s" % (rate*100, e)
+		sniffer.swap(p)
+		self.profile = profile
+		self.__last = (now, 0, 0)
+		self.retuned += 1
+		return "%.2f%% dropped, reopened with buffer %i bytes, snaplen %i" % (rate*100, profile["buffer_size"], profile["snaplen"])
+
+	def next_profile(self):
+		""" Return profile with more buffer or smaller snaplen (None: at the limits). """
+		profile = dict(self.profile)
+		size = profile["buffer_size"] or 2*1024*1024		# (libpcap default on Linux)
+		if size < self.max_buffer:
+			profile["buffer_size"] = min(size*2, self.max_buffer)
+		elif profile["snaplen"] > self.min_snaplen:
+			profile["snaplen"] = max(profile["snaplen"]//2, self.min_snaplen)
+		else:
+			return None
+		return profile
+
+def build_filter(protocols=[], ports=[], payload_only=True, extra="", datalink=None):
+	""" Build a BPF filter expression (see tcpdump(3)) from the active
+	    protocol selection, so uninteresting traffic is dropped in the kernel.
+
+	protocols     names from 'protocol_ports' (e.g. ['http', 'rtsp']); all if empty
+	ports         additional TCP ports to capture (if protocols/ports given)
+	payload_only  capture TCP segments with non-empty payload only
+	extra         user supplied filter expression, combined by 'and'
+	datalink      link type of the capture, see 'link_filter' (None: any)
+	"""
+	parts = []
+	if payload_only: parts.append( bpf_tcp_payload )
+	allports = []
+	for proto in protocols:
+		proto = proto.strip().lower()
+		if proto not in protocol_ports:
+			raise ValueError, "unknown protocol '%s' (known: %s)" % (proto, ", ".join(sorted(protocol_ports)))
+		allports += protocol_ports[proto]
+	allports += [ int(port) for port in ports ]
+	if allports:
+		parts.append( "(%s)" % " or ".join([ "tcp port %i" % port for port in sorted(set(allports)) ]) )
+	if extra.strip(): parts.append( "(%s)" % extra.strip() )
+	return link_filter(" and ".join(parts), datalink)
+
+def link_filter(expr, datalink):
+	""" Adapt BPF filter expr (see 'build_filter') to a capture of link type
+	    datalink: on Ethernet 802.1Q tagged frames (one tag; 'parse_frame'
+	    handles them) match as well, e.g. on trunk or SPAN ports. libpcap
+	    supports 'vlan' on Ethernet only (not e.g. on Linux cooked captures). """
+	# 'vlan' shifts the offsets of everything after it, so the untagged test has to come first
+	if expr and (datalink == DLT_EN10MB): expr = "(%s) or (vlan and %s)" % (expr, expr)
+	return expr
+
+def split_list(text):
+	""" Split comma/space separated option string (e.g. 'http, rtsp') into a list. """
+	return [ item for item in text.replace(",", " ").split() ]
+
+def pcap_ts(hdr):
+	""" Return the capture timestamp of a pcap header in seconds (float). """
+	(sec, usec) = hdr.getts()
+	return sec + usec/1000000.
+
+class PcapHeader:
+	""" Minimal stand-in for a pcapy Pkthdr (e.g. for frames passed between processes). """
+
+	def __init__(self, ts):
+		self.ts = ts
+
+	def getts(self):
+		return (int(self.ts), int(round((self.ts % 1)*1000000)))
+
+class ReplayClock:
+	"""
+	Pace an offline replay to the original pcap timestamps.
+
+	Example:
+	   p = open_capture(filename="dump.pcap")
+	   dispatch_loop(p, ReplayClock().wrap(packetHandler), threading.Event(), live=False)
+	Without a clock an offline capture is replayed as fast as possible.
+	"""
+
+	def __init__(self, speed=1.0):
+		""" Create clock; speed > 1 replays faster than the original. """
+		self.speed = float(speed)
+		self.__start = None		# (first pcap timestamp, wall clock at that time)
+		self.__stopped = threading.Event()
+
+	def wait(self, hdr):
+		""" Sleep until the packet with header 'hdr' is due. """
+		ts = pcap_ts(hdr)
+		if self.__start is None:
+			self.__start = (ts, time.time())
+			return
+		delay = (ts - self.__start[0])/self.speed - (time.time() - self.__start[1])
+		if delay > 0: self.__stopped.wait(delay)
+
+	def stop(self):
+		""" Stop pacing (e.g. the capture gets stopped); no more waiting. """
+		self.__stopped.set()
+
+	def wrap(self, handler):
+		""" Return a pcap callback calling 'handler' at the original pace. """
+		def paced(hdr, data):
+			self.wait(hdr)
+			return handler(hdr, data)
+		return paced
+
+# thanks to http://www.tcpdump.org/manpages/pcap_dispatch.3pcap.html
+# and http://www.tcpdump.org/manpages/pcap_setnonblock.3pcap.html
+def dispatch_loop(pcap, handler, stopped, live=True, batch=256, idle=0.05):
+	""" Call handler (pcap callback) for the packets captured, by batches of
+	    up to batch packets ('dispatch'), until the threading.Event stopped
+	    is set or the end of a capture file is reached. A live capture is
+	    put into non-blocking mode and waits up to idle seconds (for
+	    stopped) while no packets arrive, so stopping takes that long at
+	    most, even on a quiet link. Returns the number of packets; raises
+	    PcapError if capturing fails (e.g. interface gone). """
+	if live: pcap.setnonblock(1)
+	total = 0
+	while not stopped.is_set():
+		count = pcap.dispatch(batch, handler)
+		if count > 0:
+			total += count
+		elif count < 0:						# (error, not idle)
+			raise PcapError(getattr(pcap, "geterr", lambda: "dispatch failed (%i)" % count)())
+		elif live:
+			stopped.wait(idle)
+		else:
+			break						# end of capture file
+	return total
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Header parsing
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# thanks to http://en.wikipedia.org/wiki/IPv4#Header
+# and http://en.wikipedia.org/wiki/Transmission_Control_Protocol#TCP_segment_structure
+def parse_frame(datalink, data):
+	""" Read Ethernet/SLL, IPv4/IPv6 and TCP/UDP headers by fixed offsets
+	    (no objects are built). Returns (src, dst, proto, sport, dport, start, end,
+	    seq, flags) with the payload being data[start:end] (seq and flags are
+	    None for UDP), or None for unusual frames
+	    (fragments, IPv6 extension headers, other protocols, truncated, ...)
+	    that should be handed to the ImpactDecoder instead. The addresses src
+	    and dst are packed (raw) bytes, see 'addr_str'. """
+	# should be a short/fast function since it is called for every packet!
+	try:
+		(off, typeoff) = link_layers[datalink]
+		(ethertype,) = struct_ethertype.unpack_from(data, typeoff)
+		while (ethertype == ETH_P_8021Q) or (ethertype == ETH_P_8021AD):	# skip VLAN tags
+			(ethertype,) = struct_ethertype.unpack_from(data, off + 2)
+			off += 4
+		if (ethertype == ETH_P_IP):
+			(verihl, length, frag, proto, src, dst) = struct_ipv4.unpack_from(data, off)
+			if (frag & 0x3fff): return None					# fragment (or more to follow)
+			end = min(len(data), off + length)				# strip ethernet padding
+			off += (verihl & 0x0f) << 2
+		elif (ethertype == ETH_P_IPV6):
+			(length, proto, src, dst) = struct_ipv6.unpack_from(data, off)
+			off += 40
+			end = min(len(data), off + length)
+		else:
+			return None
+		if (proto == IPPROTO_TCP):
+			(sport, dport, seq, doff, flags) = struct_tcp.unpack_from(data, off)
+			off += (doff >> 4) << 2
+		elif (proto == IPPROTO_UDP):
+			(sport, dport) = struct_udp.unpack_from(data, off)
+			(seq, flags) = (None, None)
+			off += 8
+		else:
+			return None
+	except (KeyError, struct.error):						# unknown link or truncated
+		return None
+	if (off > end): return None
+	return (src, dst, proto, sport, dport, off, end, seq, flags)
+
+def addr_str(addr):
+	""" Convert packed IPv4/IPv6 address (from 'parse_frame') to string. """
+	if (len(addr) == 4): return socket.inet_ntoa(addr)
+	try:	return socket.inet_ntop(socket.AF_INET6, addr)
+	except (AttributeError, socket.error, ValueError):	# no 'inet_ntop' (win)
+		return '?'
+
+def parse_headers(datalink, data):
+	""" Fast path instead of a full ImpactDecoder decode. Returns
+	    (src, dst, payload) with payload a zero-copy view (buffer) on data,
+	    or None if the frame has to be decoded by ImpactDecoder. """
+	info = parse_frame(datalink, data)
+	if not info: return None
+	return (addr_str(info[0]), addr_str(info[1]), buffer(data, info[5], info[6] - info[5]))
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# URL extraction
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+def has_url(data, pos=0, end=None):
+	""" Fast prefilter in front of 'regex_links'; True if data (from pos on,
+	    up to end) contains any known scheme followed by ':' and '//' or '\\'.
+	    One pass over the raw bytes for the marker (rare in binary payload),
+	    only the few hits are checked for a preceding scheme. """
+	# should be a short/fast function since it is called for every packet!
+	if end is None: end = len(data)
+	search = regex_marker.search
+	match = search(data, pos, end)
+	while match:
+		start = match.start()
+		if regex_scheme.search(data, max(pos, start - scheme_maxlen), start): return True
+		match = search(data, start + 1, end)
+	return False
+
+class Extractor:
+	"""
+	Base class of the URL extractors run by PacketProcessor (in registry
+	order, see 'extractors'). An extractor declares the TCP/UDP ports of
+	the flows it is called for (either side) and the schemes of the URLs
+	it finds; without ports it is called for the payloads naming one of
+	its schemes (any case, e.g. 'http:' or 'HTTP/1.1', see
+	'scheme_filter'), or for all payloads if it finds all 'schemes'. It
+	counts its calls, time spent, payload bytes scanned and URLs found
+	(hits).
+
+	'extract' gets the frame (with 'info' from 'parse_frame') and returns
+	(found, start, end): list of (link, src, dst, ts) and the part of the
+	payload data[start:end] left for the following extractors.
+	"""
+
+	name	= None
+	ports	= ()
+	schemes	= ()
+	stateful = False		# keeps state per flow (DecodePool keeps flows on one worker)
+	details	= ""			# format of extra counters in 'stats' (see 'describe')
+	latency	= None			# Histogram of the call latency (set by CaptureMetrics)
+
+	# counters
+	calls	= 0
+	seconds	= 0.
+	bytes	= 0
+	hits	= 0
+
+	def __init__(self, reassembler=None):
+		""" Create extractor; extractors scanning TCP streams use the
+		    StreamReassembler 'reassembler'. """
+		pass
+
+	def extract(self, hdr, data, info, start, end):
+		raise NotImplementedError
+
+	def flush(self, ts):
+		""" Return list of (link, src, dst, ts) still held at the end. """
+		return []
+
+	def stats(self):
+		""" Return counters as dict. """
+		return { "calls": self.calls, "seconds": self.seconds, "bytes": self.bytes, "hits": self.hits }
+
+	@classmethod
+	def describe(cls, stats):
+		""" Format counters (from 'stats') human readable. """
+		text = "%s: %i calls, %.3f s, %i bytes, %i URLs" % (cls.name, stats["calls"], stats["seconds"], stats["bytes"], stats["hits"])
+		try:	return text + (cls.details % stats)
+		except KeyError:	return text			# (extra counters missing)
+
+# registry of the extractors (name: Extractor class), in the order they run
+extractors = OrderedDict()
+
+def register_extractor(cls):
+	""" Add Extractor class to the registry (can be used as decorator). """
+	extractors[cls.name] = cls
+	return cls
+
+def create_extractors(names=None, reassembler=None, ports={}):
+	""" Instantiate the registered extractors in 'names' (all if None), in
+	    registry order. 'ports' maps names to ports replacing the default
+	    ones (empty list: all ports). """
+	for name in (names or []):
+		if name not in extractors:
+			raise ValueError, "unknown extractor '%s' (known: %s)" % (name, ", ".join(list_extractors()))
+	result = []
+	for (name, cls) in extractors.items():
+		if (names is not None) and (name not in names): continue
+		extractor = cls(reassembler)
+		if name in ports: extractor.ports = tuple([ int(port) for port in ports[name] ])
+		result.append( extractor )
+	return result
+
+def list_extractors():
+	""" Return the registered extractors as 'name[:ports] (schemes)' strings
+	    (registry order), e.g. for help texts. """
+	return [ "%s%s (%s)" % (name, "".join([ ":%i" % port for port in cls.ports ]), "/".join(cls.schemes))
+		 for (name, cls) in extractors.items() ]
+
+def scheme_filter(extractor):
+	""" Return regex searching the payload for the schemes of extractor
+	    (any case), or None if it runs by its ports or finds all 'schemes'
+	    (no filter). """
+	if extractor.ports or not extractor.schemes or set(schemes).issubset(extractor.schemes): return None
+	return re.compile("|".join([ re.escape(s) for s in extractor.schemes ]), re.IGNORECASE)
+
+def describe_extractors(stats):
+	""" Format extractor stats (name: stats dict, see 'PacketProcessor.stats')
+	    as list of lines, in registry order. """
+	return [ extractors[name].describe(stats[name]) for name in extractors if name in stats ]
+
+def parse_extractors(text):
+	""" Parse extractor selection like 'http:80:8080,regex' into (names,
+	    ports) for 'create_extractors' (all extractors for empty text). """
+	if not text.strip(): return (None, {})
+	(names, ports) = ([], {})
+	for item in split_list(text):
+		item = item.split(":")
+		names.append( item[0].strip().lower() )
+		if (len(item) > 1): ports[names[-1]] = [ port for port in item[1:] if port.strip() ]
+	return (names, ports)
+
+class RegexExtractor(Extractor):
+	"""
+	Generic extraction: absolute URLs anywhere in the payload, matched by
+	'regex_links' (behind the 'has_url' prefilter), optionally across TCP
+	segments by a StreamReassembler. Also used for the unusual frames
+	decoded by ImpactDecoder.
+	"""
+
+	name	= "regex"
+	schemes	= schemes
+	details	= "; TCP flows evicted: %(evicted_idle)i idle, %(evicted_memory)i memory; gaps: %(gaps)i, truncated URLs: %(truncated)i"
+
+	def __init__(self, reassembler=None, regex=regex_links):
+		self.regex		= regex
+		self.reassembler	= reassembler
+		self.stateful		= reassembler is not None
+
+	def extract(self, hdr, data, info, start, end, marker=None):
+		""" Search URLs in data[start:end] ('marker': result of 'has_url', if known). """
+		if marker is None: marker = has_url(data, start, end)
+		(src, dst, proto, sport, dport) = info[:5]
+		reasm = self.reassembler
+		if reasm and (proto == IPPROTO_TCP):
+			key = (src, sport, dst, dport)
+			if not (marker or (key in reasm.flows)): return ((), start, end)
+			seq = info[7]
+			if (start != info[5]): seq = (seq + start - info[5]) & 0xffffffffL	# (seq of the part scanned)
+			ts = pcap_ts(hdr)
+			found = reasm.feed( key, seq, info[8], data[start:end], ts, marker )
+			return ([ (link, addr_str(key[0]), addr_str(key[2]), ts) for (key, link) in found ], start, end)
+		if not marker: return ((), start, end)
+		(src, dst, ts) = (addr_str(src), addr_str(dst), pcap_ts(hdr))
+		return ([ (item.group(1), src, dst, ts) for item in self.regex.finditer(data, start, end) ], start, end)
+
+	def extract_decoded(self, hdr, src, dst, data):
+		""" Search URLs in payload of a frame decoded by ImpactDecoder. """
+		ts = pcap_ts(hdr)
+		return [ (item.group(1), src, dst, ts) for item in self.regex.finditer(data) ]
+
+	def flush(self, ts):
+		""" Return list of (link, src, dst, ts) still held by the reassembler. """
+		if not self.reassembler: return []
+		return [ (link, addr_str(key[0]), addr_str(key[2]), ts) for (key, link) in self.reassembler.flush() ]
+
+	def stats(self):
+		""" Return counters (and the ones of the reassembler) as dict. """
+		result = Extractor.stats(self)
+		if self.reassembler: result.update( self.reassembler.stats() )
+		return result
+
+class HttpExtractor(Extractor):
+	"""
+	Protocol aware URL extraction for HTTP/1.x and RTSP in front of the
+	generic regex. Requests in origin form ('GET /a.ts HTTP/1.1' with
+	'Host: example.com') give the full URL 'http://example.com/a.ts'; only
+	request line and headers are parsed (absolute URLs, e.g. RTSP or proxy
+	requests, are left to the regex). Bodies of responses known to be
+	binary (by 'Content-Type' or 'Content-Encoding') are not passed to the
+	following extractors, per flow up to 'Content-Length' or the next
+	response.
+
+	Example:
+	   http = HttpExtractor()
+	   info = parse_frame(datalink, data)
+	   (found, start, end) = http.extract(hdr, data, info, info[5], info[6])
+	"""
+
+	name	= "http"
+	ports	= tuple(protocol_ports["http"] + protocol_ports["rtsp"])
+	schemes	= ("http", "rtsp")
+	stateful = True
+	details	= "; request URLs: %(requests)i, binary body bytes skipped: %(skipped)i"
+
+	# counters
+	requests	= 0		# request URLs rebuilt
+	skipped		= 0		# body bytes not scanned
+
+	def __init__(self, reassembler=None, binary=binary_types, max_flows=16384):
+		""" Create extractor skipping bodies with Content-Type starting with
+		    any of 'binary', for at most 'max_flows' flows at once. """
+		self.binary	= tuple(binary)
+		self.max_flows	= max_flows
+		self.bodies	= OrderedDict()		# key: body bytes left (None: until next response) (LRU order)
+
+	def extract(self, hdr, data, info, start, end):
+		""" Parse TCP segment; returns request URL (if any) and the part of
+		    data left for the following extractors. """
+		# should be a short/fast function since it is called for every packet!
+		bodies = self.bodies
+		if not bodies and (data[start:start+1] not in http_initials): return ((), start, end)
+		(src, dst, proto, sport, dport) = info[:5]
+		flags = info[8]
+		if (proto != IPPROTO_TCP): return ((), start, end)
+		if bodies and ((src, sport, dst, dport) in bodies):
+			key = (src, sport, dst, dport)
+			left = bodies.pop(key)
+			if data.startswith("HTTP/1.", start):		# next response (e.g. after HEAD)
+				pass
+			elif left is None:				# (until next response)
+				if not (flags & (TH_FIN | TH_RST)): bodies[key] = None
+				self.skipped += end - start
+				return ((), end, end)
+			elif (left >= end - start):
+				if (left > end - start) and not (flags & (TH_FIN | TH_RST)): bodies[key] = left - (end - start)
+				self.skipped += end - start
+				return ((), end, end)
+			else:						# (next message follows body)
+				self.skipped += left
+				start += left
+		if data.startswith("HTTP/1.", start):
+			return ((), start, self.__response(info, data, start, end))
+		if data.startswith(http_methods, start):
+			links = self.__request(info, data, start, end)
+			if links:
+				ts = pcap_ts(hdr)
+				return ([ (link, addr_str(src), addr_str(dst), ts) for link in links ], start, end)
+		return ((), start, end)
+
+	def stats(self):
+		""" Return counters as dict. """
+		result = Extractor.stats(self)
+		result.update( { "requests": self.requests, "skipped": self.skipped, "bodies": len(self.bodies) } )
+		return result
+
+	def __request(self, info, data, start, end):
+		""" Rebuild URL from request line and 'Host' header (or server address). """
+		eol = data.find("\r\n", start, end)
+		if (eol < 0): return []
+		parts = data[start:eol].split(" ")
+		if (len(parts) != 3) or not parts[1].startswith("/"): return []
+		(scheme, port) = http_schemes.get(parts[2][:7], (None, None))
+		if not scheme: return []
+		head = data.find("\r\n\r\n", eol, end)		# end of headers
+		host = regex_http_host.search(data, eol, (head < 0) and end or (head + 2))
+		if host:
+			host = host.group(1)
+		elif (head < 0):					# 'Host' may be in next segment
+			return []
+		else:							# (HTTP/1.0)
+			(dst, dport) = (addr_str(info[1]), info[4])
+			if (len(info[1]) != 4): dst = "[%s]" % dst
+			host = (dport == port) and dst or ("%s:%i" % (dst, dport))
+		self.requests += 1
+		return [ "%s://%s%s" % (scheme, host, parts[1]) ]
+
+	def __response(self, info, data, start, end):
+		""" Check response headers; returns end of data to be scanned (start
+		    of a binary body) and remembers the body of the flow. """
+		head = data.find("\r\n\r\n", start, end)
+		if (head < 0): return end				# (headers continue)
+		status = data[start+9:start+12]
+		if status.startswith("1") or (status == "204") or (status == "304"): return end
+		ctype = regex_http_type.search(data, start, head + 2)
+		if not ((ctype and ctype.group(1).lower().startswith(self.binary)) or
+			regex_http_packed.search(data, start, head + 2)): return end
+		body = head + 4
+		left = None
+		length = regex_http_length.search(data, start, head + 2)
+		if length:
+			left = int(length.group(1)) - (end - body)
+			if (left < 0): return end			# (next response in segment, scan it)
+		if (left != 0) and not (info[8] & (TH_FIN | TH_RST)):
+			self.bodies[(info[0], info[3], info[1], info[4])] = left
+			while (len(self.bodies) > self.max_flows): self.bodies.popitem(last=False)
+		self.skipped += end - body
+		return body
+
+register_extractor(HttpExtractor)
+register_extractor(RegexExtractor)
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Stream reassembly
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+class StreamReassembler:
+	"""
+	Bounded-memory TCP stream reassembly, so URLs split across segments
+	are found.
+
+	Per flow (key is the tuple (src, sport, dst, dport)) only the overlap
+	window is held, i.e. the unfinished URL (or scheme) at the end of the
+	last segment. Every new segment is scanned together with this overlap
+	only. Flows without an overlap are not kept at all, so the flow table
+	stays small even on busy links. Memory is bounded by 'flow_bytes' per
+	flow, 'total_bytes' and 'max_flows' overall (least recently used flows
+	are evicted first) and by the idle timeout 'timeout' (in seconds of
+	capture time). URLs held by evicted flows are returned, not lost.
+
+	Example:
+	   reasm = StreamReassembler(regex_links)
+	   for (key, link) in reasm.feed(key, seq, flags, payload, ts):
+	      ...
+	"""
+
+	# counters
+	evicted_idle	= 0		# flows evicted by idle timeout
+	evicted_memory	= 0		# flows evicted by byte/flow caps (LRU)
+	truncated	= 0		# URLs longer than 'flow_bytes' (returned as is)
+	gaps		= 0		# lost/out-of-order segments (overlap dropped)
+
+	def __init__(self, regex, flow_bytes=4096, total_bytes=4*1024*1024, max_flows=16384, timeout=30.):
+		""" Create reassembler for URLs matched by 'regex' (group 1 is the URL). """
+		self.regex		= regex
+		self.flow_bytes		= flow_bytes
+		self.total_bytes	= total_bytes
+		self.max_flows		= max_flows
+		self.timeout		= timeout
+		self.flows		= OrderedDict()		# key: [next seq, overlap, last ts, overlap is URL?] (LRU order)
+		self.held		= 0			# bytes held in all overlaps
+		self.__expired		= 0.			# last idle check
+
+	def feed(self, key, seq, flags, payload, ts, marker=True):
+		""" Scan next segment of flow 'key' and return list of (key, link).
+		    Segments of flows not tracked are skipped unless 'marker' is set
+		    (i.e. the packet passed the 'has_url' prefilter). """
+		result = []
+		if (ts - self.__expired) > 1.: self.__expire(ts, result)
+		flow = self.flows.pop(key, None)
+		if flow is None:
+			if not marker: return result
+			buf = payload
+		else:
+			self.held -= len(flow[1])
+			diff = (seq - flow[0]) & 0xffffffffL
+			if (diff == 0):					# in order
+				buf = flow[1] + payload
+			elif (diff & 0x80000000L):			# (partly) retransmitted
+				overlap = (flow[0] - seq) & 0xffffffffL
+				if (overlap >= len(payload)):		# nothing new, keep state
+					self.flows[key] = flow
+					self.held += len(flow[1])
+					return result
+				(seq, payload) = (flow[0], payload[overlap:])
+				buf = flow[1] + payload
+			else:						# gap, segment(s) lost
+				self.gaps += 1
+				if flow[3]: result.append( (key, flow[1]) )
+				buf = payload
+
+		# scan overlap and new bytes, hold back an URL running until the end
+		last, pos, tail, isurl = None, 0, "", False
+		for match in self.regex.finditer(buf):
+			if last: result.append( (key, last.group(1)) )
+			last = match
+		if last:
+			if (last.end() < len(buf)) or (flags & (TH_FIN | TH_RST)):
+				result.append( (key, last.group(1)) )
+				pos = last.end()
+			elif (len(buf) - last.start() > self.flow_bytes):
+				result.append( (key, last.group(1)) )
+				self.truncated += 1
+				pos = len(buf)
+			else:
+				(tail, isurl) = (buf[last.start():], True)
+		if not isurl:						# maybe an unfinished scheme
+			partial = regex_partial.search(buf, max(pos, len(buf) - scheme_maxlen - 2))
+			if partial: tail = buf[partial.start():]
+		if not tail or (flags & (TH_FIN | TH_RST)): return result
+
+		# keep flow (most recently used at the end) and enforce caps
+		self.flows[key] = [ (seq + len(payload)) & 0xffffffffL, tail, ts, isurl ]
+		self.held += len(tail)
+		while (self.held > self.total_bytes) or (len(self.flows) > self.max_flows):
+			self.__evict(result)
+			self.evicted_memory += 1
+		return result
+
+	def flush(self):
+		""" Drop all flows and return list of (key, link) still held. """
+		result = []
+		while self.flows: self.__evict(result)
+		return result
+
+	def stats(self):
+		""" Return counters as dict. """
+		return { "flows": len(self.flows), "held": self.held, "evicted_idle": self.evicted_idle,
+			 "evicted_memory": self.evicted_memory, "truncated": self.truncated, "gaps": self.gaps }
+
+	def __evict(self, result):
+		""" Remove least recently used flow. """
+		(key, flow) = self.flows.popitem(last=False)
+		self.held -= len(flow[1])
+		if flow[3]: result.append( (key, flow[1]) )
+
+	def __expire(self, ts, result):
+		""" Remove flows idle for longer than 'timeout'. """
+		self.__expired = ts
+		while self.flows and (self.flows[next(iter(self.flows))][2] < (ts - self.timeout)):
+			self.__evict(result)
+			self.evicted_idle += 1
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Packet processing
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+class PacketProcessor:
+	"""
+	Hot path shared by both scripts: header parsing (fast path or
+	ImpactDecoder fallback) and the URL extractors (see 'extractors'),
+	each called for the flows on its ports only (port-less ones for the
+	payloads naming their schemes, see 'scheme_filter').
+	"""
+
+	timers	= None				# StageTimers of the hot path stages (None: not timed)
+
+	def __init__(self, datalink, extractors=None):
+		""" Query the type of the link and instantiate a decoder accordingly.
+
+		extractors   list of Extractor instances, run in order (default:
+		             RegexExtractor without stream reassembly)
+		"""
+		if DLT_EN10MB == datalink:
+			self.decoder = EthDecoder()
+		elif DLT_LINUX_SLL == datalink:
+			self.decoder = LinuxSLLDecoder()
+		else:
+			raise Exception("Datalink type not supported: %s" % datalink)
+		if extractors is None: extractors = [ RegexExtractor() ]
+		self.datalink		= datalink
+		self.extractors		= list(extractors)
+		self.routes		= [ (extractor, extractor.ports, scheme_filter(extractor)) for extractor in self.extractors ]
+		self.regex		= None			# RegexExtractor (for unusual frames too)
+		for extractor in self.extractors:
+			if isinstance(extractor, RegexExtractor): self.regex = extractor
+		self.reassembler	= self.regex and self.regex.reassembler
+		# regex on all ports only: prefilter before header parsing
+		self.simple		= (self.extractors == [ self.regex ]) and not self.regex.ports
+		self.last_ts		= 0.
+
+	def process(self, hdr, data):
+		""" Return list of (link, src, dst, ts) found in raw packet 'data'
+		    (ts: pcap timestamp of the packet completing the link). """
+		# should be a short/fast function since it is called for every packet!
+		timers = self.timers
+		marker = None
+		if self.simple:
+			regex = self.regex
+			t = time.time()
+			marker = has_url(data)
+			t = time.time() - t
+			regex.seconds += t
+			if timers: timers.add("prefilter", t)
+			if not (marker or (regex.reassembler and regex.reassembler.flows)):
+				if regex.latency is not None: regex.latency.observe(t)
+				regex.calls += 1
+				regex.bytes += len(data)
+				return []
+		if timers: t = time.time()
+		info = parse_frame(self.datalink, data)			# fast path; no object tree built
+		if timers: timers.lap("parse", t)
+		if info is None: return self.process_decoded(hdr, data)
+		if info[2] == IPPROTO_TCP: self.last_ts = pcap_ts(hdr)
+		(sport, dport, start, end) = info[3:7]
+		result = []
+		for (extractor, ports, named) in self.routes:
+			if ports:
+				if not ((sport in ports) or (dport in ports)): continue
+			elif named and not named.search(data, start, end): continue
+			(t, size) = (time.time(), end - start)
+			if self.simple: (found, start, end) = extractor.extract(hdr, data, info, start, end, marker)
+			else:		(found, start, end) = extractor.extract(hdr, data, info, start, end)
+			t = time.time() - t
+			extractor.seconds += t
+			if extractor.latency is not None: extractor.latency.observe(t)
+			if timers: timers.add("extract " + extractor.name, t)
+			extractor.calls += 1
+			extractor.bytes += size
+			if found:
+				extractor.hits += len(found)
+				result += found
+		return result
+
+	def process_decoded(self, hdr, data):
+		""" Unusual frame: decode by ImpactDecoder, search URLs by regex. """
+		regex = self.regex
+		if not regex: return []
+		timers = self.timers
+		t = time.time()
+		found = []
+		if has_url(data):
+			if timers: stage = time.time()
+			decoded = self.decoder.decode(data)
+			if timers: stage = timers.lap("decode", stage)
+			(src, dst, payload) = self.header_info(decoded)
+			if timers: stage = timers.lap("convert", stage)
+			found = regex.extract_decoded(hdr, src, dst, payload)
+			if timers: timers.lap("extract regex", stage)
+		t = time.time() - t
+		regex.seconds += t
+		if regex.latency is not None: regex.latency.observe(t)
+		regex.calls += 1
+		regex.bytes += len(data)
+		regex.hits += len(found)
+		return found
+
+	def flush(self):
+		""" Return list of (link, src, dst, ts) still held by the extractors
+		    (ts: of the last TCP segment seen). """
+		result = []
+		for extractor in self.extractors: result += extractor.flush(self.last_ts)
+		return result
+
+	def stats(self):
+		""" Return counters of the extractors as dict (name: stats dict). """
+		return dict([ (extractor.name, extractor.stats()) for extractor in self.extractors ])
+
+	# thanks to http://d.hatena.ne.jp/shoe16i/mobile?date=20090203&section=p1
+	def header_info(self, decoded_data):
+		""" Extract the header info completely (from ImpactDecoder object tree). """
+		ip = decoded_data.child()
+		tcp = ip.child()
+		#src = (ip.get_ip_src(), tcp.get_th_sport())
+		try:	src = ip.get_ip_src()
+		except:	src = '?'
+		#dst = (ip.get_ip_dst(), tcp.get_th_dport())
+		try:	dst = ip.get_ip_dst()
+		except:	dst = '?'
+		#data = tcp.get_data_as_string()
+		data = tcp.get_packet()
+		return (src, dst, data)
+
+class StageTimers:
+	"""
+	Calls, seconds and longest call per stage of the hot path (profiling).
+	"""
+
+	def __init__(self):
+		self.stages = OrderedDict()				# name: [calls, seconds, max. seconds]
+
+	def add(self, name, seconds):
+		""" Count call of stage name taking seconds. """
+		entry = self.stages.get(name)
+		if entry is None: entry = self.stages[name] = [0, 0., 0.]
+		entry[0] += 1
+		entry[1] += seconds
+		if seconds > entry[2]: entry[2] = seconds
+
+	def lap(self, name, start):
+		""" Count call of stage name since start (time.time()); return now. """
+		now = time.time()
+		self.add(name, now - start)
+		return now
+
+	def report(self):
+		""" Return report lines (one per stage, in order of first call). """
+		lines = [ "# stage timers", "%-16s %10s %10s %10s %10s" % ("stage", "calls", "seconds", "mean us", "max us") ]
+		for (name, (calls, seconds, longest)) in self.stages.items():
+			lines.append( "%-16s %10i %10.3f %10.2f %10.1f" % (name, calls, seconds, seconds*1e6/calls, longest*1e6) )
+		return lines
+
+class ProfiledProcessor(PacketProcessor):
+	"""
+	PacketProcessor timing every stage of the hot path in 'timers'
+	(StageTimers): prefilter, header parse, ImpactDecoder decode, payload
+	conversion to text and each extractor. Used instead of PacketProcessor
+	for profiling only (its 'timers' are None, so timing costs nothing).
+	"""
+
+	def __init__(self, datalink, extractors=None):
+		PacketProcessor.__init__(self, datalink, extractors)
+		self.timers = StageTimers()
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Multi-process decoding
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# thanks to http://docs.python.org/library/multiprocessing.html#shared-ctypes-objects
+class SharedRing:
+	"""
+	Single producer / single consumer ring of raw frames in shared memory
+	(no pickling per frame). Frames take their own length in a data area of
+	'size' bytes (up to 'slots' frames); frames longer than 'frame_size'
+	are truncated (counted).
+	"""
+
+	STOP = ()				# returned by 'get' after 'stop'
+
+	# counters
+	truncated	= 0			# frames cut to 'frame_size' (producer side)
+
+	def __init__(self, slots=4096, size=8*1024*1024, frame_size=65535):
+		""" Allocate ring with given number of slots and data bytes. """
+		self.slots, self.size = slots, size
+		self.frame_size	= min(frame_size, size//2)		# (a frame always fits once the ring is empty)
+		self.data	= multiprocessing.RawArray(ctypes.c_char, size)
+		self.seqs	= multiprocessing.RawArray(ctypes.c_longlong, slots)
+		self.times	= multiprocessing.RawArray(ctypes.c_double, slots)
+		self.lengths	= multiprocessing.RawArray(ctypes.c_int, slots)
+		self.offsets	= multiprocessing.RawArray(ctypes.c_longlong, slots)	# data position per slot (running)
+		self.head	= multiprocessing.RawValue(ctypes.c_longlong, 0)	# written by producer only
+		self.tail	= multiprocessing.RawValue(ctypes.c_longlong, 0)	# written by consumer only
+		self.freed	= multiprocessing.RawValue(ctypes.c_longlong, 0)	# data position released (consumer)
+		self.filled	= multiprocessing.Semaphore(0)
+		self.__setstate__( dict(self.__dict__) )
+
+	def __setstate__(self, state):
+		""" (Re)build process local state, e.g. after pickling to a worker. """
+		self.__dict__.update(state)
+		self.base = ctypes.addressof(self.data)		# mapped at another address in each process
+		(self.in_count, self.out_count) = (self.head.value, self.tail.value)	# local copies
+		self.in_pos = self.freed.value					# next data position (producer)
+
+	def full(self):
+		return (self.head.value - self.tail.value) >= self.slots
+
+	def put(self, seq, ts, data):
+		""" Copy frame into next slot (producer); False if ring is full. """
+		# should be a short/fast function since it is called for every packet!
+		head = self.in_count
+		if (head - self.tail.value) >= self.slots: return False
+		n = len(data)
+		cut = (n > self.frame_size)
+		if cut: n = self.frame_size
+		start = self.in_pos
+		if (start % self.size) + n > self.size: start += self.size - start % self.size	# (frames never wrap)
+		if (start + n - self.freed.value) > self.size: return False
+		if cut: self.truncated += 1
+		i = head % self.slots
+		ctypes.memmove(self.base + start % self.size, data, n)
+		self.seqs[i] = seq
+		self.times[i] = ts
+		self.lengths[i] = n
+		self.offsets[i] = start
+		self.in_pos = start + n
+		self.in_count = self.head.value = head + 1
+		self.filled.release()
+		return True
+
+	def stop(self):
+		""" Queue the stop marker (producer; waits for a free slot). """
+		while self.full(): time.sleep(0.01)
+		self.lengths[self.in_count % self.slots] = -1
+		self.in_count = self.head.value = self.in_count + 1
+		self.filled.release()
+
+	def get(self, block=True):
+		""" Return (seq, ts, data) from next slot (consumer), None if empty
+		    and not blocking, or STOP. """
+		if not self.filled.acquire(block): return None
+		i = self.out_count % self.slots
+		n = self.lengths[i]
+		if (n < 0):
+			item = self.STOP
+		else:
+			start = self.offsets[i]
+			item = (self.seqs[i], self.times[i], ctypes.string_at(self.base + start % self.size, n))
+			self.freed.value = start + n
+		self.out_count = self.tail.value = self.out_count + 1
+		return item
+
+def decode_worker(index, ring, results, datalink, extractors, batch=64):
+	""" Worker process of DecodePool: decode frames from ring and send
+	    (index, done seq, stats, [(seq, [(link, src, dst, ts), ...]), ...])
+	    messages to results (stats only in the final message). """
+	processor = PacketProcessor(datalink, extractors)
+	(found, count, done) = ([], 0, -1)
+	while True:
+		item = ring.get(block=not count)			# send results before going to sleep
+		if item is None or count >= batch:
+			results.put( (index, done, None, found) )
+			(found, count) = ([], 0)
+			if item is None: continue
+		if item is ring.STOP: break
+		(seq, ts, data) = item
+		links = processor.process(PcapHeader(ts), data)
+		if links: found.append( (seq, links) )
+		(count, done) = (count + 1, seq)
+	links = processor.flush()
+	if links: found.append( (done, links) )
+	results.put( (index, done, processor.stats(), found) )
+
+class DecodePool:
+	"""
+	Pool of worker processes decoding frames and extracting URLs, so the
+	capture thread only has to pull raw frames (no GIL limit on decoding).
+
+	Frames are handed over through one SharedRing per worker; with stateful
+	extractors (e.g. stream reassembly) all frames of a flow go to the same
+	worker. Results are
+	given to 'output' (list of (link, src, dst, ts)) in capture order, by a
+	collector thread.
+
+	Example:
+	   pool = DecodePool(p.datalink(), create_extractors(), 4, output=buffer.extend)
+	   pool.start()
+	   dispatch_loop(p, pool.submit, stopped)	# (until the threading.Event stopped is set)
+	   pool.close()
+	"""
+
+	# counters
+	submitted	= 0		# frames handed to workers
+	dropped		= 0		# frames dropped (ring full)
+
+	def __init__(self, datalink, extractors, workers=2, output=None, slots=4096, ring_size=8*1024*1024, frame_size=65535):
+		""" Create pool (call 'start' to run it).
+
+		extractors   list of Extractor templates (every worker gets its own copies)
+		output       callable receiving lists of (link, src, dst, ts)
+		ring_size    bytes of frame data per worker (see SharedRing)
+		frame_size   longer frames get truncated (see 'truncated')
+		"""
+		self.datalink, self.extractors = datalink, extractors
+		self.stateful	= bool([ extractor for extractor in extractors if extractor.stateful ])
+		self.output	= output or (lambda found: None)
+		self.rings	= [ SharedRing(slots, ring_size, frame_size) for i in range(workers) ]
+		self.results	= multiprocessing.Queue()
+		self.workers	= []
+		self.__stats	= dict([ (extractor.name, dict.fromkeys(extractor.stats(), 0))	# summed worker stats
+				     for extractor in extractors ])
+		self.__seq	= -1						# last assigned sequence number
+		self.__assigned	= [ -1 ] * workers				# last seq per worker
+		self.__done	= [ -1 ] * workers				# last seq processed per worker
+		self.__finished	= 0
+		self.__heap	= []
+		self.__collector = threading.Thread(target=self.__collect)
+		self.__collector.setDaemon(True)
+
+	def start(self):
+		""" Start worker processes and collector thread. """
+		for (i, ring) in enumerate(self.rings):
+			worker = multiprocessing.Process(target=decode_worker,
+							 args=(i, ring, self.results, self.datalink, self.extractors))
+			worker.daemon = True
+			worker.start()
+			self.workers.append( worker )
+		self.__collector.start()
+
+	def submit(self, hdr, data):
+		""" Hand raw frame to a worker (pcap callback); False if dropped. """
+		# should be a short/fast function since it is called for every packet!
+		seq = self.__seq + 1
+		index = seq % len(self.rings)
+		if self.stateful:					# keep flows on one worker
+			info = parse_frame(self.datalink, data)
+			if info: index = hash((info[0], info[3], info[1], info[4])) % len(self.rings)
+		if not self.rings[index].put(seq, pcap_ts(hdr), data):
+			self.dropped += 1
+			return False
+		self.__assigned[index] = seq				# (order matters, see '__collect')
+		self.__seq = seq
+		self.submitted += 1
+		return True
+
+	def close(self):
+		""" Stop workers after all submitted frames are done, wait for results. """
+		for ring in self.rings: ring.stop()
+		for worker in self.workers: worker.join()
+		self.__collector.join()
+
+	def stats(self):
+		""" Return extractor stats (name: stats dict, like 'PacketProcessor.stats')
+		    summed over the workers (complete after 'close'). """
+		return dict([ (name, dict(stats)) for (name, stats) in self.__stats.items() ])
+
+	@property
+	def truncated(self):
+		""" Frames truncated to 'frame_size' (summed over the rings). """
+		return sum([ ring.truncated for ring in self.rings ])
+
+	def backlog(self):
+		""" Number of frames waiting in the rings. """
+		return sum([ ring.head.value - ring.tail.value for ring in self.rings ])
+
+	def __collect(self):
+		""" Collector thread: merge worker results back into capture order. """
+		while self.__finished < len(self.rings):
+			try:	(index, done, stats, found) = self.results.get(timeout=0.1)
+			except Queue.Empty:	continue
+			for item in found: heapq.heappush(self.__heap, item)
+			self.__done[index] = done
+			if stats is not None:
+				self.__finished += 1
+				for (name, values) in stats.items():
+					summed = self.__stats.setdefault(name, {})
+					for (key, value) in values.items(): summed[key] = summed.get(key, 0) + value
+			# results up to 'safe' are complete: every worker with frames pending is past it
+			last = self.__seq
+			pending = [ self.__done[i] for i in range(len(self.rings)) if self.__assigned[i] > self.__done[i] ]
+			safe = min(pending + [ last ])
+			result = []
+			while self.__heap and (self.__heap[0][0] <= safe):
+				result += heapq.heappop(self.__heap)[1]
+			if result: self.output(result)
+		result = []
+		while self.__heap: result += heapq.heappop(self.__heap)[1]
+		if result: self.output(result)
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Multi-interface capture
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+
+class CaptureMerger(threading.Thread):
+	"""
+	Merge the URLs found by several sniffer threads (one per interface, each
+	with its own buffer) into one stream ordered by pcap timestamp, tagged
+	with the adapter they were captured on: (link, src, dst, ts, adapter).
+
+	URLs are held back until every running sniffer has reported a later
+	timestamp, but 'holdback' seconds (wall clock) at most, so an idle
+	interface does not stall the stream (live capture: timestamps are
+	about the capture time). The merger stands in for the sniffer thread
+	towards the consumer ('buffer', 'packets', 'bytes', 'stop', 'stats';
+	alive until the sniffers finished and all URLs are passed on).
+
+	Example:
+	   merger = CaptureMerger([sniffer1, sniffer2], ["eth0", "eth1"], output=PyLib.RingBuffer())
+	   for sniffer in merger.sniffers: sniffer.start()
+	   merger.start()					# (after the sniffers)
+	   items = merger.buffer.drain()
+	"""
+
+	offline	= False			# (live capture only)
+	held	= 0			# URLs held back for timestamp order
+
+	def __init__(self, sniffers, adapters, output, holdback=0.5, interval=0.05):
+		""" Merge URLs of sniffers (threads with a 'buffer', not started
+		    yet) capturing on adapters into output (PyLib.RingBuffer),
+		    polling their buffers every interval seconds. """
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+		self.sniffers	= list(sniffers)
+		self.adapters	= list(adapters)
+		self.buffer	= output
+		self.holdback	= holdback
+		self.interval	= interval
+
+	@property
+	def packets(self):
+		return sum([ sniffer.packets for sniffer in self.sniffers ])
+
+	@property
+	def bytes(self):
+		return sum([ sniffer.bytes for sniffer in self.sniffers ])
+
+	def stop(self):
+		""" Let the sniffers return (after their current batch of packets;
+		    within 'dispatch_loop' idle time on a quiet link). """
+		for sniffer in self.sniffers: sniffer.stop()
+
+	def stats(self):
+		""" Return extractor stats (name: stats dict) summed over the sniffers. """
+		result = {}
+		for sniffer in self.sniffers:
+			for (name, values) in sniffer.stats().items():
+				summed = result.setdefault(name, {})
+				for (key, value) in values.items(): summed[key] = summed.get(key, 0) + value
+		return result
+
+	def run(self):
+		heap, seq = [], 0
+		marks = [ 0. ] * len(self.sniffers)			# latest timestamp per sniffer
+		while True:
+			alive = [ sniffer.is_alive() for sniffer in self.sniffers ]	# (before draining; nothing missed)
+			for (i, sniffer) in enumerate(self.sniffers):
+				items = sniffer.buffer.drain()
+				for item in items:
+					heapq.heappush(heap, (item[3], seq, item[:4] + (self.adapters[i],)))
+					seq += 1
+				if items: marks[i] = max(marks[i], items[-1][3])
+			if not any(alive): break
+			limit = time.time() - self.holdback
+			watermark = min([ max(marks[i], limit) for i in range(len(self.sniffers)) if alive[i] ])
+			result = []
+			while heap and (heap[0][0] <= watermark): result.append( heapq.heappop(heap)[2] )
+			if result: self.buffer.extend(result)
+			self.held = len(heap)
+			time.sleep(self.interval)
+		result = [ heapq.heappop(heap)[2] for i in range(len(heap)) ]
+		if result: self.buffer.extend(result)
+		self.held = 0
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Result handling
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# thanks to http://en.wikipedia.org/wiki/Bloom_filter
+class BloomFilter:
+	"""
+	Fixed size set membership test with false positives (but no false
+	negatives); 'bits' should be a power of 2.
+	"""
+
+	def __init__(self, bits=2**23, hashes=4):
+		self.bits, self.hashes = bits, min(hashes, 4)
+		self.array = bytearray(bits/8)
+		self.count = 0
+
+	def __indexes(self, key):
+		return struct.unpack("<4L", hashlib.md5(key).digest())[:self.hashes]
+
+	def add(self, key):
+		for i in self.__indexes(key):
+			i %= self.bits
+			self.array[i >> 3] |= (1 << (i & 7))
+		self.count += 1
+
+	def __contains__(self, key):
+		for i in self.__indexes(key):
+			i %= self.bits
+			if not (self.array[i >> 3] & (1 << (i & 7))): return False
+		return True
+
+class DedupIndex:
+	"""
+	Session-wide index of seen URLs (or any string keys) with hit count and
+	first/last seen time per key.
+
+	Exact for the 'max_entries' most recently seen keys (LRU); keys evicted
+	from there are only remembered by a Bloom filter (no counts, rare false
+	positives). With 'window' (seconds) a key not seen for that long counts
+	as new again (the Bloom filter is then rotated every 'window').
+
+	Example:
+	   index = DedupIndex(100000, window=3600.)
+	   (dup, entry) = index.add(url, time.time())
+	   if not dup: entry[DedupIndex.DATA] = row	# new; keep a row reference
+	   elif entry: update(entry[DedupIndex.DATA], entry[DedupIndex.HITS])
+	"""
+
+	# entry fields
+	(HITS, FIRST, LAST, DATA) = range(4)
+
+	# counters
+	hits		= 0		# duplicates found (exact)
+	bloom_hits	= 0		# duplicates found (Bloom filter only)
+	evicted		= 0		# entries moved to Bloom filter
+
+	def __init__(self, max_entries=100000, window=None, bloom_bits=2**23):
+		""" Create empty index.
+
+		max_entries  entries held exactly
+		window       seconds after which a key counts as new again (None: never)
+		bloom_bits   size of Bloom filter for evicted keys (0: forget them)
+		"""
+		self.max_entries, self.window, self.bloom_bits = max_entries, window, bloom_bits
+		self.entries	= OrderedDict()				# key -> [hits, first, last, data]
+		self.clear()
+
+	def clear(self):
+		""" Forget all keys. """
+		self.entries.clear()
+		self.__bloom	= [ BloomFilter(self.bloom_bits) ] if self.bloom_bits else []
+		self.__rotated	= None
+
+	def __len__(self):
+		return len(self.entries)
+
+	def get(self, key):
+		""" Return entry of key (or None), without counting a hit. """
+		return self.entries.get(key)
+
+	def add(self, key, ts=None):
+		""" Count key seen at ts (default now); return (dup, entry) with
+		    entry None for duplicates only known to the Bloom filter. """
+		if ts is None: ts = time.time()
+		entry = self.entries.pop(key, None)
+		if entry and self.window and (entry[self.LAST] < ts - self.window):
+			entry = None						# out of window; new again
+		if entry:
+			entry[self.HITS] += 1
+			entry[self.LAST] = ts
+			self.entries[key] = entry				# (most recently used at the end)
+			self.hits += 1
+			return (True, entry)
+		if self.__bloom:
+			self.__rotate(ts)
+			for bloom in self.__bloom:
+				if key in bloom:
+					self.bloom_hits += 1
+					return (True, None)
+		entry = [ 1, ts, ts, None ]
+		self.entries[key] = entry
+		while (len(self.entries) > self.max_entries):
+			(old, item) = self.entries.popitem(last=False)
+			if self.__bloom: self.__bloom[0].add(old)
+			self.evicted += 1
+		return (False, entry)
+
+	def stats(self):
+		""" Return counters as dict. """
+		return { "entries": len(self.entries), "hits": self.hits, "bloom_hits": self.bloom_hits,
+			 "evicted": self.evicted }
+
+	def __rotate(self, ts):
+		""" Start new Bloom filter generation every 'window' (keep the last one). """
+		if not self.window: return
+		if self.__rotated is None: self.__rotated = ts
+		if (ts - self.__rotated) >= self.window:
+			self.__bloom = [ BloomFilter(self.bloom_bits) ] + self.__bloom[:1]
+			self.__rotated = ts
+
+class CategoryIndex:
+	"""
+	Classifies URLs once into categories (e.g. for a list filter), given as
+	dict name -> pattern: a pattern that is (the beginning of) a scheme
+	matches the scheme of a URL, any other pattern a substring of the URL
+	(case insensitive); the empty pattern matches everything. Each URL gets
+	a bitmask, so filtering is one AND per row; rows per category are
+	counted incrementally ('add'/'remove').
+
+	Example:
+	   categories = CategoryIndex({'(all)': '', 'Flash Video': '.flv'})
+	   mask = categories.classify(url)
+	   categories.add(mask)
+	   visible = mask & categories.bits['Flash Video']
+	"""
+
+	def __init__(self, categories):
+		""" Assign a bit to each category (0 to the empty pattern). """
+		self.bits, self.__tests = {}, []
+		for name in sorted(categories):
+			pattern = categories[name].lower()
+			if not pattern:
+				self.bits[name] = 0
+				continue
+			self.bits[name] = 1 << len(self.__tests)
+			isscheme = bool([ s for s in schemes if s.startswith(pattern) ])
+			self.__tests.append( (self.bits[name], pattern, isscheme) )
+		self.clear()
+
+	def classify(self, url):
+		""" Return bitmask of all categories matching url. """
+		url = url.lower()
+		scheme = url.split(":", 1)[0]
+		mask = 0
+		for (bit, pattern, isscheme) in self.__tests:
+			if isscheme:
+				if scheme.startswith(pattern): mask |= bit
+			elif pattern in url:
+				mask |= bit
+		return mask
+
+	def add(self, mask):
+		""" Count a row with bitmask. """
+		self.total += 1
+		for (bit, pattern, isscheme) in self.__tests:
+			if (mask & bit): self.__counts[bit] += 1
+
+	def remove(self, mask):
+		""" Uncount a row with bitmask. """
+		self.total -= 1
+		for (bit, pattern, isscheme) in self.__tests:
+			if (mask & bit): self.__counts[bit] -= 1
+
+	def count(self, name):
+		""" Return number of rows in category. """
+		bit = self.bits[name]
+		if not bit: return self.total
+		return self.__counts[bit]
+
+	def clear(self):
+		""" Reset counts. """
+		self.total = 0
+		self.__counts = dict.fromkeys([ test[0] for test in self.__tests ], 0)
+
+# thanks to http://en.wikipedia.org/wiki/N-gram and http://swtch.com/~rsc/regexp/regexp4.html
+class NgramIndex:
+	"""
+	Incremental substring index (case insensitive) over texts like URLs:
+	each n-gram maps to the (increasing) keys of texts containing it.
+	Searching scans the rarest n-gram of the needle only and verifies the
+	candidates, so a lookup stays fast over a million texts. Removed keys
+	are skipped lazily and purged when more than half of the index is
+	stale.
+
+	Example:
+	   index = NgramIndex()
+	   index.add(1, "http://example.com/video.flv")
+	   index.search("video")		# -> [1]
+	"""
+
+	def __init__(self, n=3):
+		self.n = n
+		self.clear()
+
+	def __len__(self):
+		return len(self.texts)
+
+	def __grams(self, text):
+		n = self.n
+		return set([ text[i:i+n] for i in xrange(len(text) - n + 1) ])
+
+	def add(self, key, text):
+		""" Index text under key (int, increasing with every call). """
+		text = text.lower()
+		self.texts[key] = text
+		postings = self.postings
+		for gram in self.__grams(text):
+			try:	postings[gram].append(key)
+			except KeyError: postings[gram] = array.array('l', (key,))
+		self.__size += 1
+
+	def remove(self, key):
+		""" Remove text of key from index. """
+		if self.texts.pop(key, None) is None: return
+		self.__stale += 1
+		if (self.__stale > self.__size/2): self.__purge()
+
+	def search(self, needle, limit=None):
+		""" Return keys of texts containing needle (increasing, at most limit). """
+		needle = needle.lower()
+		if (len(needle) < self.n):
+			candidates = sorted(self.texts)				# too short; scan all
+		else:
+			shortest = None
+			for gram in self.__grams(needle):
+				postings = self.postings.get(gram)
+				if postings is None: return []
+				if (shortest is None) or (len(postings) < len(shortest)): shortest = postings
+			candidates = shortest
+		result = []
+		texts = self.texts
+		for key in candidates:
+			text = texts.get(key)
+			if (text is not None) and (needle in text):
+				result.append( key )
+				if limit and (len(result) >= limit): break
+		return result
+
+	def clear(self):
+		""" Remove everything. """
+		self.texts	= {}						# key -> text (lower case)
+		self.postings	= {}						# n-gram -> array of keys
+		self.__size	= 0						# texts indexed (incl. removed)
+		self.__stale	= 0						# ... removed
+
+	def __purge(self):
+		""" Rebuild postings from texts still indexed. """
+		texts = self.texts
+		self.clear()
+		for key in sorted(texts): self.add(key, texts[key])
+
+class RowStore:
+	"""
+	Bookkeeping for a capped table of result rows (e.g. the rows of a GUI
+	list), so only the working set is held: past 'max_rows' rows get evicted
+	oldest first ('fifo') or least hit first ('least-hit', oldest of equal
+	hits first). Evicted rows can be spilled to a file, one tab separated
+	line per row (fields and hits).
+
+	Example:
+	   store = RowStore(50000, RowStore.LEAST_HIT, spill="evicted.txt")
+	   for (key, row, hits, data) in store.add(index, (index, url), rowref):
+	       remove(data)
+	   store.hit(index, 5)
+	"""
+
+	# eviction policies
+	FIFO		= "fifo"
+	LEAST_HIT	= "least-hit"
+	policies	= (FIFO, LEAST_HIT)
+
+	# counters
+	evicted		= 0
+	spilled		= 0
+
+	def __init__(self, max_rows=0, policy=FIFO, spill=None):
+		""" Create empty store.
+
+		max_rows  rows held at most (0: no limit)
+		policy    one of 'policies'
+		spill     file name to append evicted rows to (None: drop them)
+		"""
+		if policy not in self.policies:
+			raise ValueError("unknown eviction policy '%s' (known: %s)" % (policy, ", ".join(self.policies)))
+		self.max_rows, self.policy, self.spill = max_rows, policy, spill
+		self.rows	= OrderedDict()				# key -> [row, hits, data] (oldest first)
+		self.__heap	= []					# (hits, key); stale items skipped lazily
+		self.__file	= None
+
+	def __len__(self):
+		return len(self.rows)
+
+	def add(self, key, row, data=None, hits=1):
+		""" Add row (tuple of fields) under unique, increasing key with any
+		    data attached; return list of evicted (key, row, hits, data). """
+		self.rows[key] = [ row, hits, data ]
+		if (self.policy == self.LEAST_HIT): heapq.heappush(self.__heap, (hits, key))
+		return self.__enforce()
+
+	def hit(self, key, hits):
+		""" Update hit count of row (if still held). """
+		entry = self.rows.get(key)
+		if not entry: return
+		entry[1] = hits
+		if (self.policy == self.LEAST_HIT):
+			heapq.heappush(self.__heap, (hits, key))
+			if (len(self.__heap) > 2*len(self.rows) + 1024):	# too many stale items
+				self.__heap = [ (entry[1], key) for (key, entry) in self.rows.iteritems() ]
+				heapq.heapify(self.__heap)
+
+	def get(self, key):
+		""" Return [row, hits, data] of key (or None). """
+		return self.rows.get(key)
+
+	def remove(self, key):
+		""" Remove row without evicting it. """
+		self.rows.pop(key, None)
+
+	def clear(self):
+		""" Remove all rows (without evicting them). """
+		self.rows.clear()
+		self.__heap = []
+
+	def close(self):
+		""" Close spill file. """
+		if self.__file: self.__file.close()
+		self.__file = None
+
+	def __enforce(self):
+		""" Evict rows past 'max_rows'. """
+		result = []
+		while self.max_rows and (len(self.rows) > self.max_rows):
+			if (self.policy == self.FIFO):
+				(key, entry) = self.rows.popitem(last=False)
+			else:
+				(hits, key) = heapq.heappop(self.__heap)
+				entry = self.rows.get(key)
+				if (entry is None) or (entry[1] != hits): continue	# stale
+				del self.rows[key]
+			self.evicted += 1
+			if self.spill: self.__write(entry)
+			result.append( (key, entry[0], entry[1], entry[2]) )
+		return result
+
+	def __write(self, entry):
+		""" Append evicted row to spill file. """
+		if not self.__file: self.__file = open(self.spill, "a")
+		self.__file.write( "\t".join([ str(field) for field in entry[0] ] + [ str(entry[1]) ]) + "\n" )
+		self.spilled += 1
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Capture store
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+store_fields = ("url", "scheme", "host", "src", "dst", "adapter", "first_ts", "last_ts", "hits")
+
+store_schema = """
+CREATE TABLE IF NOT EXISTS urls (
+	url TEXT NOT NULL, scheme TEXT, host TEXT, src TEXT, dst TEXT, adapter TEXT,
+	first_ts REAL, last_ts REAL, hits INTEGER DEFAULT 1);
+CREATE UNIQUE INDEX IF NOT EXISTS urls_key ON urls (url, src, dst, adapter);
+CREATE INDEX IF NOT EXISTS urls_first ON urls (first_ts);
+CREATE INDEX IF NOT EXISTS urls_last ON urls (last_ts);
+CREATE INDEX IF NOT EXISTS urls_host ON urls (host);
+CREATE INDEX IF NOT EXISTS urls_scheme ON urls (scheme);
+"""
+
+def store_text(value):
+	""" Byte string (e.g. from packet) as unicode for sqlite3. """
+	if isinstance(value, str): return value.decode("utf-8", "replace")
+	return value
+
+def store_connect(filename):
+	""" Open capture store database (created if needed) in WAL mode. """
+	db = sqlite3.connect(filename)
+	db.text_factory = str
+	db.execute("PRAGMA journal_mode=WAL")		# readers do not block the writer (and v.v.)
+	db.execute("PRAGMA synchronous=NORMAL")
+	db.executescript(store_schema)
+	return db
+
+# thanks to http://www.sqlite.org/wal.html and http://www.sqlite.org/lang_expr.html#like
+def query_store(filename, since=None, until=None, host=None, scheme=None, text=None, limit=None):
+	""" Yield rows (dicts with 'store_fields') of capture store seen in time
+	    range [since, until] (pcap timestamps), from host (or subdomain),
+	    with scheme and/or containing text (case insensitive), by first seen.
+	    Rows are streamed from the database, not loaded all at once. """
+	(where, args) = ([], [])
+	if since is not None:
+		where.append("last_ts >= ?")
+		args.append(since)
+	if until is not None:
+		where.append("first_ts <= ?")
+		args.append(until)
+	if host:
+		where.append("(host = ? OR host LIKE ? ESCAPE '\\')")
+		args += [ host.lower(), "%." + like_escape(host.lower()) ]
+	if scheme:
+		where.append("scheme = ?")
+		args.append(scheme.lower())
+	if text:
+		where.append("url LIKE ? ESCAPE '\\'")
+		args.append("%" + like_escape(text) + "%")
+	sql = "SELECT %s FROM urls" % ", ".join(store_fields)
+	if where: sql += " WHERE " + " AND ".join(where)
+	sql += " ORDER BY first_ts"
+	if limit: sql += " LIMIT %i" % limit
+	db = store_connect(filename)
+	try:
+		for row in db.execute(sql, [ store_text(arg) for arg in args ]):
+			yield dict(zip(store_fields, row))
+	finally:
+		db.close()
+
+def like_escape(text):
+	""" Escape SQL LIKE wildcards (with '\\'). """
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+class CaptureStore(threading.Thread):
+	"""
+	Persistent capture store: SQLite database (WAL mode) with one row per
+	URL, src, dst and adapter (scheme, host, first/last pcap timestamp and
+	hits). Found URLs are queued by 'add' (from any thread; bounded, never
+	blocks) and written in batches, one transaction each, by this thread.
+	If writing fails, the thread stops and 'error' is set (check it while
+	capturing); later URLs are dropped. Query with 'query' or 'query_store'
+	(also while capturing, or later on).
+
+	Example:
+	   store = CaptureStore("session.db")
+	   store.start()
+	   store.add( [(link, src, dst, ts, "eth0")] )
+	   store.close()
+	   for row in query_store("session.db", host="example.com"): ...
+	"""
+
+	# counters
+	written	= 0			# URLs written (hits)
+	batches	= 0			# transactions
+	dropped	= 0			# URLs not written (queue full or writing failed)
+	error	= None			# exception (if writing failed)
+
+	def __init__(self, filename, batch=1000, queue=1000):
+		""" Open (or create) store; call 'start' to run the writer. Up to
+		    queue lists of URLs ('add' calls) wait for the writer. """
+		self.filename, self.batch = filename, batch
+		store_connect(filename).close()				# (fail early, in the caller)
+		self.__queue = Queue.Queue(queue)
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def add(self, found):
+		""" Queue list of (link, src, dst, ts, adapter) for writing (dropped
+		    if the queue is full or writing failed). """
+		if not found: return
+		if self.error is None:
+			try:
+				self.__queue.put_nowait(found)
+				return
+			except Queue.Full:
+				pass
+		self.dropped += len(found)
+
+	def close(self):
+		""" Write everything queued and stop writer. """
+		while self.is_alive():
+			try:
+				self.__queue.put(None, timeout=0.1)	# (writer may have stopped on error)
+				break
+			except Queue.Full:
+				continue
+		if self.is_alive(): self.join()
+
+	def query(self, **kwargs):
+		""" See 'query_store'. """
+		return query_store(self.filename, **kwargs)
+
+	def run(self):
+		""" Writer: collect queued URLs up to 'batch', write, repeat. """
+		db = store_connect(self.filename)
+		batch = []
+		try:
+			stop = False
+			while not stop:
+				batch = self.__queue.get()
+				if batch is None: break
+				batch = list(batch)			# (not the caller's list)
+				while (len(batch) < self.batch):
+					try:	more = self.__queue.get_nowait()
+					except Queue.Empty: break
+					if more is None:
+						stop = True
+						break
+					batch.extend(more)
+				self.__write(db, batch)
+				batch = []
+		except Exception, e:
+			self.error = e
+			self.dropped += len(batch)
+			while True:					# (queued ones get lost too)
+				try:	more = self.__queue.get_nowait()
+				except Queue.Empty: break
+				if more: self.dropped += len(more)
+		finally:
+			db.close()
+
+	def __write(self, db, batch):
+		""" Write batch of URLs (merged by key) in one transaction. """
+		merged = OrderedDict()
+		for (link, src, dst, ts, adapter) in batch:
+			key = (link.replace('\\', ''), src, dst, adapter)	# (remove backslashes, like the GUI)
+			entry = merged.get(key)
+			if entry:
+				entry[0] = min(entry[0], ts)
+				entry[1] = max(entry[1], ts)
+				entry[2] += 1
+			else:
+				merged[key] = [ ts, ts, 1 ]
+		with db:
+			for (key, (first, last, hits)) in merged.iteritems():
+				key = tuple([ store_text(item) for item in key ])
+				if db.execute("UPDATE urls SET hits = hits + ?, first_ts = min(first_ts, ?), last_ts = max(last_ts, ?) "
+					      "WHERE url = ? AND src = ? AND dst = ? AND adapter = ?", (hits, first, last) + key).rowcount:
+					continue
+				parts = urlparse.urlsplit(key[0])
+				db.execute("INSERT INTO urls (url, scheme, host, src, dst, adapter, first_ts, last_ts, hits) "
+					   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+					   (key[0], parts.scheme.lower(), (parts.hostname or "")) + key[1:] + (first, last, hits))
+		self.written += len(batch)
+		self.batches += 1
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Export
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# thanks to http://docs.python.org/library/csv.html and http://jsonlines.org/
+def export_open(filename, compression=None):
+	""" Open file for appending, compressed by 'gzip' or 'zstd' (default by
+	    extension '.gz'/'.zst'); returns (file object, raw file or None). """
+	if compression is None:
+		compression = { ".gz": "gzip", ".zst": "zstd" }.get(os.path.splitext(filename)[1].lower())
+	if (compression == "gzip"):
+		return (gzip.open(filename, "ab"), None)
+	if (compression == "zstd"):
+		if not zstandard: raise ImportError("zstd compression needs the 'zstandard' module")
+		raw = open(filename, "ab")
+		return (zstandard.ZstdCompressor().stream_writer(raw), raw)
+	if compression:
+		raise ValueError("unknown compression '%s' (known: gzip, zstd)" % compression)
+	return (open(filename, "ab"), None)
+
+def export_format(filename):
+	""" Guess export format ('csv' or 'jsonl') from file extension (ignoring
+	    a compression extension). """
+	(name, ext) = os.path.splitext(filename.lower())
+	if ext in (".gz", ".zst"): ext = os.path.splitext(name)[1]
+	if ext in (".jsonl", ".json", ".ndjson"): return "jsonl"
+	return "csv"
+
+class ExportThread(threading.Thread):
+	"""
+	Writes rows (tuples matching 'fields') to a file in a background thread,
+	as CSV (with header line for a new file) or JSON Lines, optionally gzip
+	or zstd compressed (see 'export_open'). First the given rows (snapshot)
+	are written; with 'follow' rows passed to 'append' are written as well,
+	until 'stop' is called.
+
+	Example:
+	   export = ExportThread("urls.csv.gz", ("index", "url"), rows, follow=True)
+	   export.start()
+	   export.append( [(7, "http://...")] )	# while capturing
+	   export.stop()
+	"""
+
+	formats = ("csv", "jsonl")
+
+	# counters
+	written	= 0			# rows done so far
+	error	= None			# exception (if writing failed)
+
+	def __init__(self, filename, fields, rows=(), format=None, compression=None, follow=False, select=None):
+		""" Prepare export (call 'start' to run it).
+
+		rows     snapshot of rows (list) written first
+		format   one of 'formats' (default by file extension)
+		select   function returning False for rows to skip (e.g. a filter)
+		"""
+		self.filename, self.fields, self.rows, self.select = filename, tuple(fields), rows, select
+		self.format = format or export_format(filename)
+		if self.format not in self.formats:
+			raise ValueError("unknown export format '%s' (known: %s)" % (self.format, ", ".join(self.formats)))
+		self.total = len(rows)
+		self.follow = follow
+		self.header = (self.format == "csv") and not (os.path.exists(filename) and os.path.getsize(filename))
+		(self.outfile, self.__raw) = export_open(filename, compression)	# (fail early, in the caller)
+		self.__queue = Queue.Queue()
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def progress(self):
+		""" Return fraction of snapshot rows done (0. .. 1.). """
+		if not self.total: return 1.
+		return min(1., float(self.written)/self.total)
+
+	def append(self, rows):
+		""" Write rows too (after the snapshot; 'follow' only). """
+		if self.follow: self.__queue.put(rows)
+
+	def stop(self, wait=True):
+		""" Finish after rows given so far have been written. """
+		self.__queue.put(None)
+		if wait: self.join()
+
+	def run(self):
+		""" Write snapshot, then follow until stopped. """
+		try:
+			if (self.format == "csv"):
+				writer = csv.writer(self.outfile)
+				if self.header: writer.writerow(self.fields)
+				write = writer.writerows
+			else:
+				write = self.__write_jsonl
+			for i in xrange(0, len(self.rows), 1000):		# in chunks (progress)
+				write(self.__selected( self.rows[i:i+1000] ))
+				self.written = min(i + 1000, self.total)
+			self.rows = ()
+			while self.follow:
+				rows = self.__queue.get()
+				if rows is None: break
+				write(self.__selected(rows))
+				self.written += len(rows)
+				if self.__queue.empty(): self.outfile.flush()
+		except Exception, e:
+			self.error = e
+		finally:
+			self.outfile.close()
+			if self.__raw: self.__raw.close()
+
+	def __selected(self, rows):
+		if not self.select: return rows
+		return [ row for row in rows if self.select(row) ]
+
+	def __write_jsonl(self, rows):
+		fields = self.fields
+		self.outfile.write( "".join([ json.dumps(OrderedDict(zip(fields, map(store_text, row)))) + "\n" for row in rows ]) )
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Metrics
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+
+# upper bounds (seconds) of the latency histogram buckets
+latency_buckets = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2, 0.1, 1., 10.)
+
+# metrics of CaptureMetrics.sample (name: (Prometheus type, help text))
+metric_info = OrderedDict([
+	("packets_total",		("counter", "Packets captured.")),
+	("bytes_total",			("counter", "Bytes captured.")),
+	("kernel_received_total",	("counter", "Packets received by the kernel filter (live capture only).")),
+	("kernel_dropped_total",	("counter", "Packets dropped by the kernel, buffer full (live capture only).")),
+	("interface_dropped_total",	("counter", "Packets dropped by the interface or driver (live capture only).")),
+	("urls_total",			("counter", "URLs found.")),
+	("buffer_depth",		("gauge",   "URLs waiting in the buffer for output.")),
+	("buffer_dropped_total",	("counter", "URLs dropped, buffer full.")),
+	("decoder_backlog",		("gauge",   "Frames waiting for the decoder processes.")),
+	("decoder_dropped_total",	("counter", "Frames dropped, decoder processes busy.")),
+	("decoder_truncated_total",	("counter", "Frames truncated when handed to the decoder processes.")),
+	("merge_held",			("gauge",   "URLs held back for timestamp order (several interfaces).")),
+	("store_written_total",		("counter", "URLs recorded in the capture store.")),
+	("store_dropped_total",		("counter", "URLs not recorded, store queue full or writing failed.")),
+	("store_failed",		("gauge",   "1 if writing to the capture store failed (recording stopped).")),
+	("uptime_seconds",		("gauge",   "Seconds since the capture started.")),
+])
+
+def pcap_stats(pcap):
+	""" Return (received, dropped by kernel, dropped by interface) packet
+	    counts of a live capture; None if not available (capture files). """
+	try:	return tuple(pcap.stats())
+	except PcapError:	return None
+
+def prometheus_label(text):
+	""" Escape label value for the Prometheus text format. """
+	return str(text).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class Histogram:
+	"""
+	Latency histogram with fixed buckets (upper bounds in seconds), counting
+	like Prometheus histograms (value <= bound; plus sum and count).
+	"""
+
+	def __init__(self, buckets=latency_buckets):
+		self.buckets	= tuple(buckets)
+		self.counts	= [ 0 ] * (len(self.buckets) + 1)	# (last: above all bounds)
+		self.sum	= 0.
+		self.count	= 0
+
+	def observe(self, value):
+		""" Count value (seconds). """
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def quantile(self, q):
+		""" Return upper bound of the bucket holding quantile q (0..1; None
+		    if empty, infinity if above all bounds). """
+		if not self.count: return None
+		rank, total = q * self.count, 0
+		for (bound, count) in zip(self.buckets + (float("inf"),), self.counts):
+			total += count
+			if total >= rank: return bound
+		return float("inf")
+
+	def prometheus(self, name, labels):
+		""" Return lines of the Prometheus text format (name without suffix,
+		    labels as 'key="value",...'). """
+		lines, total = [], 0
+		for (bound, count) in zip([ "%g" % bound for bound in self.buckets ] + [ "+Inf" ], self.counts):
+			total += count
+			lines.append( '%s_bucket{%s,le="%s"} %i' % (name, labels, bound, total) )
+		lines.append( "%s_sum{%s} %s" % (name, labels, repr(self.sum)) )
+		lines.append( "%s_count{%s} %i" % (name, labels, self.count) )
+		return lines
+
+class CaptureMetrics:
+	"""
+	Live metrics of a running capture, collected on demand from the sniffer
+	thread of either script (its 'pcap', 'processor', 'pool', 'buffer' and
+	'packets'/'bytes' counters; for a CaptureMerger per interface): packets
+	and bytes captured, kernel drops, URL buffer depth and drops, decoder
+	backlog, extractor counters and latency histograms, and the delay of
+	URLs from capture to output (as reported by the consumer through
+	'observe_output').
+
+	'summary' returns a status line with rates, 'prometheus' the Prometheus
+	text format (see MetricsServer).
+
+	Example:
+	   metrics = CaptureMetrics(sniffer, "eth0")
+	   items = sniffer.buffer.drain()
+	   metrics.observe_output(items)
+	   print metrics.summary()
+	"""
+
+	def __init__(self, sniffer, adapter="", live=True, histograms=True, store=None):
+		""" Collect metrics of sniffer (or CaptureMerger) capturing on
+		    adapter (and of the CaptureStore recording it, if any). Kernel
+		    drops and output delay are measured for live capture only (not
+		    replay).
+		    With histograms the extractors time every call (capture thread
+		    decoding only; workers keep their own copies). """
+		self.sniffer	= sniffer
+		self.adapter	= adapter
+		self.store	= store
+		self.live	= live
+		self.started	= time.time()
+		self.delay	= Histogram()				# capture to output of URLs
+		self.sources	= [ (sniffer, adapter) ]		# (sniffer, adapter) per interface
+		if isinstance(sniffer, CaptureMerger): self.sources = zip(sniffer.sniffers, sniffer.adapters)
+		for (source, name) in self.sources:
+			if histograms and not source.pool:
+				for extractor in source.processor.extractors: extractor.latency = Histogram()
+		self.__last	= (self.started, 0, 0, 0)		# (time, packets, bytes, URLs) of last 'summary'
+
+	def observe_output(self, items, now=None):
+		""" Count delay of URLs (list of (link, src, dst, ts, ...)) handed
+		    to output now. """
+		if not self.live: return
+		now = now or time.time()
+		observe = self.delay.observe
+		for item in items: observe(max(now - item[3], 0.))
+
+	def sample(self):
+		""" Return current values as OrderedDict (name: value, see
+		    'metric_info'; summed over the interfaces). """
+		values = OrderedDict()
+		for (sniffer, adapter) in self.sources:
+			for (name, value) in self.__capture(sniffer).items(): values[name] = values.get(name, 0) + value
+		values.update( self.__output() )
+		return values
+
+	def summary(self):
+		""" Return status line: rates since the last call, buffer depth and drops. """
+		now = time.time()
+		values = self.sample()
+		(last, packets, size, urls) = self.__last
+		elapsed = max(now - last, 1e-3)
+		self.__last = (now, values["packets_total"], values["bytes_total"], values["urls_total"])
+		info = "%.0f packets/s, %.1f kB/s, %.1f URLs/s, %i buffered" % \
+		       ((values["packets_total"] - packets)/elapsed, (values["bytes_total"] - size)/elapsed/1024.,
+			(values["urls_total"] - urls)/elapsed, values["buffer_depth"])
+		drops = [ "%s %i" % (name, values[key]) for (name, key) in (("kernel", "kernel_dropped_total"),
+									    ("interface", "interface_dropped_total"),
+									    ("buffer", "buffer_dropped_total"),
+									    ("decoder", "decoder_dropped_total"),
+									    ("truncated", "decoder_truncated_total"),
+									    ("store", "store_dropped_total")) if values.get(key) ]
+		if drops: info += "; dropped: %s" % ", ".join(drops)
+		if values.get("store_failed"): info += "; recording failed: %s" % self.store.error
+		delay = self.delay.quantile(0.9)
+		if delay is not None: info += "; URL delay (90%%) <= %g s" % delay
+		return info
+
+	def prometheus(self, prefix="urlsnooper_"):
+		""" Return metrics in the Prometheus text format (version 0.0.4);
+		    capture metrics per interface. """
+		samples = [ ('adapter="%s"' % prometheus_label(adapter), self.__capture(sniffer)) for (sniffer, adapter) in self.sources ]
+		labels = 'adapter="%s"' % prometheus_label(self.adapter)
+		samples.append( (labels, self.__output()) )
+		lines = []
+		for (name, (kind, text)) in metric_info.items():
+			present = [ (source, values[name]) for (source, values) in samples if name in values ]
+			if not present: continue
+			lines += [ "# HELP %s%s %s" % (prefix, name, text), "# TYPE %s%s %s" % (prefix, name, kind) ]
+			for (source, value) in present:
+				lines.append( "%s%s{%s} %s" % (prefix, name, source, repr(value) if isinstance(value, float) else value) )
+		for (key, kind, text) in (("calls", "counter", "Extractor calls."), ("seconds", "counter", "Seconds spent by extractor."),
+					  ("bytes", "counter", "Payload bytes scanned by extractor."), ("hits", "counter", "URLs found by extractor.")):
+			name = "%sextractor_%s_total" % (prefix, key)
+			lines += [ "# HELP %s %s" % (name, text), "# TYPE %s %s" % (name, kind) ]
+			for (sniffer, adapter) in self.sources:
+				stats = (sniffer.pool or sniffer.processor).stats()	# (workers: complete after the end)
+				for (extractor, values) in sorted(stats.items()):
+					lines.append( '%s{adapter="%s",extractor="%s"} %s' % (name, prometheus_label(adapter),
+											  prometheus_label(extractor), repr(values[key])) )
+		name = "%sstage_latency_seconds" % prefix
+		lines += [ "# HELP %s Latency of the extractors (per call) and of URLs from capture to output." % name,
+			   "# TYPE %s histogram" % name ]
+		for (sniffer, adapter) in self.sources:
+			for extractor in sniffer.processor.extractors:
+				if extractor.latency is not None:
+					lines += extractor.latency.prometheus(name, 'adapter="%s",stage="%s"' % (prometheus_label(adapter),
+													       prometheus_label(extractor.name)))
+		if self.live: lines += self.delay.prometheus(name, '%s,stage="output"' % labels)
+		return "\n".join(lines) + "\n"
+
+	def __capture(self, sniffer):
+		""" Return values of one interface (sniffer thread). """
+		values = OrderedDict([ ("packets_total", sniffer.packets), ("bytes_total", sniffer.bytes) ])
+		kernel = self.live and pcap_stats(sniffer.pcap)
+		if kernel:
+			(values["kernel_received_total"], values["kernel_dropped_total"], values["interface_dropped_total"]) = kernel[:3]
+		if sniffer.pool:
+			values["decoder_backlog"]	= sniffer.pool.backlog()
+			values["decoder_dropped_total"]	= sniffer.pool.dropped
+			values["decoder_truncated_total"] = sniffer.pool.truncated
+		return values
+
+	def __output(self):
+		""" Return values of the URL stream (buffers of the interfaces included). """
+		buffers = [ self.sniffer.buffer ] + [ sniffer.buffer for (sniffer, adapter) in self.sources
+						      if sniffer.buffer is not self.sniffer.buffer ]
+		values = OrderedDict()
+		values["urls_total"]		= sum([ sniffer.buffer.appended for (sniffer, adapter) in self.sources ])
+		values["buffer_depth"]		= sum([ len(buffer) for buffer in buffers ])
+		values["buffer_dropped_total"]	= sum([ buffer.dropped for buffer in buffers ])
+		if isinstance(self.sniffer, CaptureMerger): values["merge_held"] = self.sniffer.held
+		if self.store:
+			values["store_written_total"]	= self.store.written
+			values["store_dropped_total"]	= self.store.dropped
+			values["store_failed"]		= int(self.store.error is not None)
+		values["uptime_seconds"]	= time.time() - self.started
+		return values
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	""" Answer 'GET /metrics' with the metrics of the server (MetricsServer). """
+
+	def do_GET(self):
+		if self.path.split("?")[0] not in ("/", "/metrics"):
+			self.send_error(404)
+			return
+		body = self.server.metrics.prometheus()
+		self.send_response(200)
+		self.send_header("Content-Type", "text/plain; version=0.0.4")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass						# (no line per scrape on stderr)
+
+class UnixHTTPServer(SocketServer.UnixStreamServer):
+	""" HTTP server on a Unix socket (e.g. 'curl --unix-socket PATH http://localhost/metrics'). """
+	pass
+
+class MetricsServer(threading.Thread):
+	"""
+	Thread serving CaptureMetrics over HTTP in the Prometheus text format
+	(e.g. for headless runs), on a local TCP port or a Unix socket.
+
+	Example:
+	   server = MetricsServer(metrics, "localhost:9207")
+	   server.start()
+	   ...
+	   server.close()
+	"""
+
+	def __init__(self, metrics, address):
+		""" Serve metrics at address: '[host:]port' (TCP, default host
+		    'localhost') or path of a Unix socket (containing '/').
+		    Raises socket.error (or ValueError) if that fails. """
+		self.address = address
+		self.unix = "/" in address
+		if self.unix:
+			if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+				os.unlink(address)			# (left over by an earlier run)
+			self.server = UnixHTTPServer(address, MetricsHandler)
+		else:
+			(host, port) = ("", address)
+			if ":" in address: (host, port) = address.rsplit(":", 1)
+			self.server = BaseHTTPServer.HTTPServer((host or "localhost", int(port)), MetricsHandler)
+		self.server.metrics = metrics
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def run(self):
+		self.server.serve_forever(poll_interval=0.5)
+
+	def close(self):
+		""" Stop serving (and remove the Unix socket). """
+		if self.is_alive(): self.server.shutdown()	# (waits for 'serve_forever' to return)
+		self.server.server_close()
+		if self.unix:
+			try:	os.unlink(self.address)
+			except OSError:	pass
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Pub/sub feed
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+# thanks to http://docs.python.org/2/howto/sockets.html#non-blocking-sockets
+class FeedServer(threading.Thread):
+	"""
+	Thread publishing events (found URLs, GUI 'ext' toggles) to any number
+	of local subscribers, as newline-delimited JSON objects over long-lived
+	connections, on a TCP port or a Unix socket (mode 0666, so programs
+	without root rights can subscribe to a capture running as root).
+	Subscribers just connect and read. Each has a bounded queue: lines a
+	slow subscriber did not read in time get dropped (oldest first,
+	counted), publishing never blocks the capture.
+
+	Example:
+	   feed = FeedServer("localhost:50301")
+	   feed.start()
+	   feed.publish_urls(items)		# {"event": "url", "url": ..., "src": ..., ...}
+	   feed.publish({"event": "toggle", "url": url, "ext": True})
+	   ...
+	   feed.close()
+
+	   $ nc localhost 50301			# (subscriber)
+	"""
+
+	# counters
+	published	= 0			# events published
+	dropped		= 0			# lines dropped (slow subscribers, summed)
+
+	def __init__(self, address, queue=10000, interval=0.05):
+		""" Listen at address: '[host:]port' (TCP, default host
+		    'localhost') or path of a Unix socket (containing '/'). Up to
+		    queue lines are kept per subscriber; new lines go out within
+		    interval seconds. Raises socket.error (or ValueError) if that
+		    fails. """
+		self.address = address
+		self.unix = "/" in address
+		if self.unix:
+			if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+				os.unlink(address)			# (left over by an earlier run)
+			self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.sock.bind(address)
+			os.chmod(address, 0666)				# (any local user may subscribe)
+		else:
+			(host, port) = ("", address)
+			if ":" in address: (host, port) = address.rsplit(":", 1)
+			self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.sock.bind((host or "localhost", int(port)))
+		self.sock.listen(16)
+		self.sock.setblocking(0)
+		self.queue	= queue
+		self.interval	= interval
+		self.subscribers = {}				# socket -> [queue (deque of lines), unsent data]
+		self.lock	= threading.Lock()
+		self.stopped	= threading.Event()
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+	def publish(self, event):
+		""" Publish event (dict, JSON serializable; byte strings decoded
+		    as UTF-8, see 'store_text') to all subscribers. """
+		self.__publish([ json.dumps(OrderedDict([ (key, store_text(value)) for (key, value) in event.items() ])) + "\n" ])
+
+	def publish_urls(self, items, adapter=""):
+		""" Publish URLs (link, src, dst, ts[, adapter]) as 'url' events
+		    (adapter given for untagged ones). """
+		self.__publish([ json.dumps(OrderedDict([ ("event", "url"), ("url", store_text(item[0])),
+							  ("src", store_text(item[1])), ("dst", store_text(item[2])),
+							  ("ts", item[3]), ("adapter", store_text(item[4] if len(item) > 4 else adapter)) ])) + "\n"
+				 for item in items ])
+
+	def __publish(self, lines):
+		""" Queue lines for every subscriber (dropping their oldest ones). """
+		with self.lock:
+			self.published += len(lines)
+			for (queue, unsent) in self.subscribers.values():
+				size = len(queue)
+				queue.extend(lines)
+				self.dropped += size + len(lines) - len(queue)
+
+	def run(self):
+		""" Accept subscribers and send them their queued lines, until closed. """
+		while not self.stopped.is_set():
+			with self.lock:
+				writers = [ sock for (sock, state) in self.subscribers.items() if state[0] or state[1] ]
+			readers = [ self.sock ] + list(self.subscribers)
+			try:	(readable, writable, errors) = select.select(readers, writers, [], self.interval)
+			except (select.error, socket.error):	# (socket closed meanwhile)
+				continue
+			for sock in readable:
+				if sock is self.sock:	self.__accept()
+				else:			self.__receive(sock)
+			for sock in writable:
+				if sock in self.subscribers: self.__send(sock)
+
+	def __accept(self):
+		""" Add a new subscriber. """
+		try:	(sock, address) = self.sock.accept()
+		except socket.error:
+			return
+		sock.setblocking(0)
+		with self.lock:
+			self.subscribers[sock] = [ deque(maxlen=self.queue), "" ]
+
+	def __receive(self, sock):
+		""" Read (and ignore) subscriber input; drop it on disconnect. """
+		try:	data = sock.recv(4096)
+		except socket.error:
+			data = ""
+		if not data: self.__remove(sock)
+
+	def __send(self, sock):
+		""" Send as much queued data to subscriber as it takes. """
+		state = self.subscribers[sock]
+		if not state[1]:
+			with self.lock:
+				state[1] = "".join(state[0])		# (at most 'queue' lines unsent)
+				state[0].clear()
+		try:	sent = sock.send(state[1])
+		except socket.error:
+			self.__remove(sock)
+			return
+		state[1] = state[1][sent:]
+
+	def __remove(self, sock):
+		""" Drop subscriber. """
+		with self.lock:
+			self.subscribers.pop(sock, None)
+		sock.close()
+
+	def close(self):
+		""" Stop publishing, disconnect the subscribers (and remove the
+		    Unix socket). """
+		self.stopped.set()
+		if self.is_alive(): self.join()
+		for sock in list(self.subscribers): self.__remove(sock)
+		self.sock.close()
+		if self.unix:
+			try:	os.unlink(self.address)
+			except OSError:	pass
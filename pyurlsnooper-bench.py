@@ -0,0 +1,287 @@
+#!/usr/bin/python
+
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Packet-processing benchmark for PyURLSnooper.
+#
+# Generates a reproducible synthetic traffic corpus (Ethernet or Linux SLL
+# frames carrying TCP payloads with a chosen URL density, payload size and
+# scheme mix) and drives the packet handlers of both scripts directly:
+#  * 'SnifferThread.__packetHandler' of 'pyurlsnooper-gtk.py' (needs GTK)
+#  * 'DecoderThread.packetHandler' of 'pyurlsnooper.py'
+# Reported are packets/s, MB/s and URLs/s, as well as the time spent in each
+# stage of the hot path (prefilter, fixed offset header parser, ImpactDecoder
+# decode and header extraction, str() conversion and 'regex_links.finditer').
+#
+# No root/admin permissions and no network adapter are needed. The corpus can
+# also be written to a '.pcap' file and replayed with 'pyurlsnooper.py -r'.
+#
+# Run this script:
+#     - run "python pyurlsnooper-bench.py" (see "--help" for options)
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Imports
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+import sys, os, imp, time, random, struct, optparse
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Variables / Constants
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+DLT_EN10MB	= 1		# same values as pcapy.DLT_EN10MB and pcapy.DLT_LINUX_SLL
+DLT_LINUX_SLL	= 113		# (defined here to generate corpora without pcapy)
+
+script_path = os.path.realpath(os.path.dirname(sys.argv[0]))
+
+url_chars = "abcdefghijklmnopqrstuvwxyz0123456789-_"
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Classes
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+class FakeHeader:
+	""" Stand-in for the pcapy Pkthdr handed to the packet handlers. """
+
+	def __init__(self, ts, caplen):
+		self.ts, self.caplen = ts, caplen
+
+	def getts(self):
+		return (int(self.ts), int((self.ts % 1)*1000000))
+
+	def getcaplen(self):
+		return self.caplen
+
+	def getlen(self):
+		return self.caplen
+
+class FakePcap:
+	""" Stand-in for a pcapy Reader, enough to construct the sniffer threads. """
+
+	def __init__(self, datalink):
+		self.__datalink = datalink
+
+	def datalink(self):
+		return self.__datalink
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Functions
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+def parse_mix(text):
+	""" Parse scheme mix 'http:8,rtmp:1,...' into a weighted list. """
+	mix = []
+	for item in text.split(","):
+		(scheme, weight) = (item.split(":") + ["1"])[0:2]
+		mix += [scheme.strip()] * int(weight)
+	return mix
+
+def make_url(rnd, scheme):
+	""" Create a random URL for given scheme. """
+	host = "".join([ rnd.choice(url_chars) for i in range(rnd.randint(4, 12)) ])
+	path = "/".join([ "".join([ rnd.choice(url_chars) for i in range(rnd.randint(3, 10)) ])
+			  for j in range(rnd.randint(1, 6)) ])
+	return "%s://www.%s.com/%s.%s" % (scheme, host, path, rnd.choice(["mp4", "flv", "ts", "m3u8", "html"]))
+
+def make_flow(rnd):
+	""" Create random TCP flow (src, dst, sport, dport, seq). """
+	return (struct.pack("!4B", 10, 0, rnd.randint(0, 255), rnd.randint(1, 254)),
+		struct.pack("!4B", 192, 168, rnd.randint(0, 255), rnd.randint(1, 254)),
+		rnd.randint(1024, 65535), rnd.choice([80, 1935, 554, 8080]), rnd.randint(0, 0xffffffffL))
+
+def make_frame(rnd, datalink, payload, flow=None):
+	""" Wrap payload into TCP, IPv4 and link layer (Ethernet or Linux SLL) headers. """
+	(src, dst, sport, dport, seq) = flow or make_flow(rnd)
+	tcp = struct.pack("!HHLLBBHHH", sport, dport, seq, 0, 5 << 4, 0x18, 65535, 0, 0)
+	ip  = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp) + len(payload), rnd.randint(0, 65535),
+			  0x4000, 64, 6, 0, src, dst)
+	if (datalink == DLT_LINUX_SLL):
+		link = struct.pack("!HHH8sH", 0, 1, 6, "\x00\x11\x22\x33\x44\x55\x00\x00", 0x0800)
+	else:
+		link = "\x00\x11\x22\x33\x44\x55" + "\x66\x77\x88\x99\xaa\xbb" + struct.pack("!H", 0x0800)
+	return link + ip + tcp + payload
+
+def make_corpus(count=10000, size=1400, density=0.1, urls=2, mix="http", datalink=DLT_EN10MB, seed=0, split=False):
+	""" Create a reproducible list of (header, frame) tuples.
+
+	count     number of frames
+	size      TCP payload size in bytes
+	density   fraction of frames containing URLs
+	urls      number of URLs in frames containing URLs
+	mix       scheme mix, e.g. 'http:8,rtmp:1,rtsp:1'
+	split     split frames with URLs into 2 TCP segments, cut inside an URL
+	"""
+	rnd = random.Random(seed)
+	schemes = parse_mix(mix)
+	noise = "".join([ chr(rnd.randint(0, 255)) for i in range(size + 4096) ])	# binary (TLS, media) like payload
+	corpus, ts = [], 1265046600.
+	for i in range(count):
+		start = rnd.randint(0, 4096)
+		payload = noise[start:start+size]
+		if (rnd.random() < density):
+			text = "".join([ 'GET / HTTP/1.1\r\nReferer: %s\r\n' % make_url(rnd, rnd.choice(schemes))
+					 for j in range(urls) ])
+			pos = rnd.randint(0, max(0, size - len(text)))
+			payload = (payload[:pos] + text + payload[pos+len(text):])[:max(size, len(text))]
+			if split:
+				cut = pos + text.index("://") + rnd.randint(-3, 20)
+				flow = make_flow(rnd)
+				frame = make_frame(rnd, datalink, payload[:cut], flow)
+				ts += rnd.expovariate(10000.)
+				corpus.append( (FakeHeader(ts, len(frame)), frame) )
+				(payload, flow) = (payload[cut:], flow[:4] + ((flow[4] + cut) & 0xffffffffL,))
+				frame = make_frame(rnd, datalink, payload, flow)
+				ts += rnd.expovariate(10000.)
+				corpus.append( (FakeHeader(ts, len(frame)), frame) )
+				continue
+		frame = make_frame(rnd, datalink, payload)
+		ts += rnd.expovariate(10000.)
+		corpus.append( (FakeHeader(ts, len(frame)), frame) )
+	return corpus
+
+# thanks to http://wiki.wireshark.org/Development/LibpcapFileFormat
+def write_pcap(filename, corpus, datalink=DLT_EN10MB):
+	""" Write corpus to a libpcap file (for replay with 'pyurlsnooper.py -r'). """
+	outfile = open(filename, "wb")
+	outfile.write( struct.pack("<LHHlLLL", 0xa1b2c3d4L, 2, 4, 0, 0, 65535, datalink) )
+	for (hdr, frame) in corpus:
+		(sec, usec) = hdr.getts()
+		outfile.write( struct.pack("<LLLL", sec, usec, len(frame), len(frame)) )
+		outfile.write( frame )
+	outfile.close()
+
+def load_script(name, filename):
+	""" Import one of the scripts as module (returns None if not possible, e.g. no GTK). """
+	try:
+		return imp.load_source(name, os.path.join(script_path, filename))
+	except (ImportError, SystemExit), e:
+		print "Skipping '%s': %s" % (filename, e)
+		return None
+
+def report(name, corpus, elapsed, urls):
+	""" Print throughput line. """
+	nbytes = sum([ len(frame) for (hdr, frame) in corpus ])
+	print "%-28s %10.0f packets/s %8.2f MB/s %10.0f URLs/s (%i URLs)" % \
+	      (name, len(corpus)/elapsed, nbytes/elapsed/1e6, urls/elapsed, urls)
+
+def bench_gtk(module, corpus, datalink):
+	""" Drive 'SnifferThread.__packetHandler' of the GTK/GUI script. """
+	sniffer = module.SnifferThread(FakePcap(datalink))
+	handler = sniffer._SnifferThread__packetHandler
+	start = time.time()
+	for (hdr, frame) in corpus:
+		handler(hdr, frame)
+	report("SnifferThread (gtk)", corpus, time.time() - start, len(sniffer.buffer))
+
+def make_extractors(module, names, reassembly=False):
+	""" Create the extractors named (list) of the console script. """
+	reasm = None
+	if reassembly: reasm = module.SnoopLib.StreamReassembler(module.regex_links)
+	return module.SnoopLib.create_extractors(names, reasm)
+
+def bench_cli(module, corpus, datalink, names, reassembly=False):
+	""" Drive 'DecoderThread.packetHandler' of the console script (with
+	    the extractors named); reports the cost of each extractor too. """
+	sniffer = module.DecoderThread(FakePcap(datalink), None, make_extractors(module, names, reassembly))
+	start = time.time()
+	for (hdr, frame) in corpus:
+		sniffer.packetHandler(hdr, frame)
+	elapsed = time.time() - start
+	report("DecoderThread (console)", corpus, elapsed, len(sniffer.buffer) + len(sniffer.processor.flush()))
+	for line in module.SnoopLib.describe_extractors(sniffer.stats()):
+		print "  extractor %s" % line
+
+def bench_pool(module, corpus, datalink, workers, names, reassembly=False):
+	""" Drive a SnoopLib.DecodePool with given number of worker processes
+	    (time includes waiting for the workers to finish). """
+	found = []
+	pool = module.SnoopLib.DecodePool(datalink, make_extractors(module, names, reassembly), workers, output=found.extend)
+	pool.start()
+	start = time.time()
+	for (hdr, frame) in corpus:
+		while not pool.submit(hdr, frame):			# ring full; wait instead of dropping
+			time.sleep(0.0005)
+	pool.close()
+	report("DecodePool (%i workers)" % workers, corpus, time.time() - start, len(found))
+
+def bench_stages(module, corpus, datalink):
+	""" Time each stage of the hot path separately (later stages see only
+	    the frames passing the prefilter). """
+	sniffer = module.DecoderThread(FakePcap(datalink))
+	frames = [ frame for (hdr, frame) in corpus ]
+
+	stages = []
+	start = time.time()
+	frames = [ frame for frame in frames if module.SnoopLib.has_url(frame) ]
+	stages.append( ("prefilter (has_url)", time.time() - start) )
+	print "  prefilter passed %i of %i frames" % (len(frames), len(corpus))
+	start = time.time()
+	views = [ module.SnoopLib.parse_headers(datalink, frame)[2] for frame in frames ]
+	stages.append( ("parse_headers (fast path)", time.time() - start) )
+	start = time.time()
+	for view in views:
+		for item in module.regex_links.finditer(view): pass
+	stages.append( ("regex_links.finditer", time.time() - start) )
+	start = time.time()
+	decoded = [ sniffer.processor.decoder.decode(frame) for frame in frames ]
+	stages.append( ("decode (fallback)", time.time() - start) )
+	start = time.time()
+	payloads = [ item.child().child().get_packet() for item in decoded ]
+	stages.append( ("header extraction (fallback)", time.time() - start) )
+	start = time.time()
+	texts = [ str(item) for item in payloads ]
+	stages.append( ("str() conversion (fallback)", time.time() - start) )
+
+	total = sum([ t for (name, t) in stages[:3] ])			# fallback stages not on hot path
+	for (name, t) in stages[:3]:
+		print "  %-30s %8.3f s %6.1f %% %8.2f us/packet" % (name, t, 100*t/total, 1e6*t/len(corpus))
+	for (name, t) in stages[3:]:
+		print "  %-30s %8.3f s          %8.2f us/packet" % (name, t, 1e6*t/len(corpus))
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+# Main
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
+#
+if __name__ == '__main__':
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("-n", "--packets", type="int", default=20000, help="number of frames [%default]")
+	parser.add_option("-s", "--size", type="int", default=1400, help="TCP payload size in bytes [%default]")
+	parser.add_option("-d", "--density", type="float", default=0.05, help="fraction of frames with URLs [%default]")
+	parser.add_option("-u", "--urls", type="int", default=2, help="URLs per frame with URLs [%default]")
+	parser.add_option("-m", "--mix", default="http:8,rtmp:1,rtsp:1", help="scheme mix [%default]")
+	parser.add_option("-l", "--linktype", choices=["eth", "sll"], default="eth", help="eth or sll [%default]")
+	parser.add_option("--seed", type="int", default=0, help="random seed [%default]")
+	parser.add_option("--split", action="store_true", help="split URLs across 2 TCP segments")
+	parser.add_option("--reassembly", action="store_true", help="use TCP stream reassembly (console script)")
+	parser.add_option("-x", "--extractors", default="regex", metavar="LIST", help="URL extractors to run (console script), e.g. 'http,regex' [%default]")
+	parser.add_option("-w", "--write", metavar="FILE", help="write corpus to pcap FILE and quit")
+	parser.add_option("--workers", default="", metavar="LIST", help="also run DecodePool with each worker count in LIST, e.g. '1,2,4'")
+	(options, args) = parser.parse_args()
+
+	datalink = { "eth": DLT_EN10MB, "sll": DLT_LINUX_SLL }[options.linktype]
+	corpus = make_corpus(options.packets, options.size, options.density, options.urls,
+			     options.mix, datalink, options.seed, options.split)
+	if options.write:
+		write_pcap(options.write, corpus, datalink)
+		print "Corpus written to %s (%i frames)." % (options.write, len(corpus))
+		sys.exit()
+
+	print "Corpus: %i frames, %i bytes payload, density %.3f, %i URLs/frame, mix '%s', %s" % \
+	      (len(corpus), options.size, options.density, options.urls, options.mix, options.linktype)
+	cli = load_script("pyurlsnooper", "pyurlsnooper.py")
+	gui = load_script("pyurlsnooper_gtk", "pyurlsnooper-gtk.py")
+	if gui: bench_gtk(gui, corpus, datalink)
+	if cli:
+		names = [ name.strip() for name in cli.SnoopLib.split_list(options.extractors) ]
+		bench_cli(cli, corpus, datalink, names, options.reassembly)
+		for workers in cli.SnoopLib.split_list(options.workers):
+			bench_pool(cli, corpus, datalink, int(workers), names, options.reassembly)
+		print "Stages (console script hot path):"
+		bench_stages(cli, corpus, datalink)
@@ -46,52 +46,51 @@ __version__ = '$Id: pyurlsnooper-gtk.py,v 1.4 2010/02/01 18:50:00 drtrigon $'
 # Imports
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
 #
-# python standard modules
-import sys, string, os, re, warnings, socket, PyLib, urlparse
-from threading import Thread
-
+# python standard modules
+import sys, string, os, re, warnings, socket, PyLib, SnoopLib, urlparse, optparse, time
+from threading import Thread, Event
+
 # package capture modules
 import pcapy
 from pcapy import findalldevs, open_live
 import impacket
-from impacket.ImpactDecoder import EthDecoder, LinuxSLLDecoder
 
-# GTK, PyGTK, GLADE (GNOME) modules
-try:				# all imports needed?!?!
+# GTK, PyGTK, GLADE (GNOME) modules
+try:				# all imports needed?!?!
 	import pygtk
 	pygtk.require('2.0')
-	import gtk
-	import gtk.glade
+	import gtk
+	import gtk.glade
 	import gobject
-except:
-	print "No GTK could be found! Under Windows, please install GTK together with pygtk, pygobject and pycairo."
-	sys.exit()
-
-# os dependent imports
-imported = []
-if	 (os.name == 'posix') or (os.name == 'mac'):
+except:
+	print "No GTK could be found! Under Windows, please install GTK together with pygtk, pygobject and pycairo."
+	sys.exit()
+
+# os dependent imports
+imported = []
+if	 (os.name == 'posix') or (os.name == 'mac'):
 	import fcntl, struct
-elif (os.name == 'nt'):
-	try:					# optional (and very recommended)
-		import wmi
-		imported.append( "wmi" )
-		print "'wmi' found and imported."
-	except: pass
-	try:					# optional (and recommended)
-		import dnet
-		imported.append( "dnet" )
-		print "'dnet' found and imported."
-	except: pass
-else:	# 'os2', 'ce', 'java', 'riscos'
-	pass
+elif (os.name == 'nt'):
+	try:					# optional (and very recommended)
+		import wmi
+		imported.append( "wmi" )
+		print "'wmi' found and imported."
+	except: pass
+	try:					# optional (and recommended)
+		import dnet
+		imported.append( "dnet" )
+		print "'dnet' found and imported."
+	except: pass
+else:	# 'os2', 'ce', 'java', 'riscos'
+	pass
 
 
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
 # Variables / Constants
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
 #
-# this regex should be improved, because it already caused some problems (e.g. on southpark.de, ...)
-regex_links = re.compile("((https?|ftp|gopher|telnet|file|notes|ms-help|rtmpe?|rtsp):((//)|(\\\\))[\w\d:#%/;$()~_?\-=\\\.&!]*)")
+# shared by both scripts (see SnoopLib.RegexExtractor)
+regex_links = SnoopLib.regex_links
 
 dict_filter = {	'(all)':					'', 
 		'Hypertext Transfer Protocol (http/https)':	'http', 
@@ -112,7 +111,10 @@ raw_path = os.path.join(os.path.realpath(os.path.dirname(sys.argv[0])), os.path.
 # read until here! You can use this trick to integrate PyURLSnooper with your own application by direct communication.
 # This is also a permission safe way to process the results further, because of the other applications can be runned
 # without root/admin rights.
+# The 'ext' column toggles (and the URLs found) are published by a SnoopLib.FeedServer at 'feed_address' (setting)
+# or else 'ext_address'; subscribe by connecting and reading JSON lines, e.g. {"event": "toggle", "url": ..., "ext": true}.
 ext_sup = False
+ext_address = "localhost:50301"
 
 
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
@@ -124,97 +126,192 @@ class SnifferThread(Thread):
 	Main decoder/network sniffer class (running in separate thread).
 	"""
 
-	# initialization
-	#
-	def __init__(self, pcapObj):
-		""" Query the type of the link and instantiate a decoder accordingly. """
-		datalink = pcapObj.datalink()
-		if pcapy.DLT_EN10MB == datalink:
-			self.decoder = EthDecoder()
-		elif pcapy.DLT_LINUX_SLL == datalink:
-			self.decoder = LinuxSLLDecoder()
-		else:
-			raise Exception("Datalink type not supported: " % datalink)
+	packets	= 0				# packets seen
+	bytes	= 0				# bytes seen
+	tuner	= None				# SnoopLib.CaptureTuner (live capture)
+
+	# initialization
+	#
+	def __init__(self, pcapObj, offline=False, clock=None, extractors=None, workers=0, buffer=None, profiler=None, idle=0.05):
+		""" Query the type of the link and instantiate a decoder accordingly.
+		    For replay of a capture file set offline, and give a
+		    SnoopLib.ReplayClock to replay at the original pace. Give the
+		    URL extractors to run (list, see SnoopLib.create_extractors;
+		    default: regex only).
+		    With workers > 0 decode in a SnoopLib.DecodePool. Found URLs
+		    go to buffer (PyLib.RingBuffer, default capacity if None).
+		    With a PyLib.Profiler the capture loop gets profiled (report
+		    written when the thread returns). A quiet live capture is
+		    polled every idle seconds. """
+		if profiler:	self.processor = SnoopLib.ProfiledProcessor(pcapObj.datalink(), extractors)	# (stage timers)
+		else:		self.processor = SnoopLib.PacketProcessor(pcapObj.datalink(), extractors)
+		self.pool = None
+		self.profiler	= profiler
+		self.buffer	= buffer			# init internal buffer (thread-safe)
+		if buffer is None: self.buffer = PyLib.RingBuffer()
 
 		self.pcap = pcapObj
-		self.buffer	= []			# init internal buffer
-		self.quit	= False			# quit thread?
+		self.offline	= offline		# replaying a capture file?
+		self.handler	= self.__packetHandler	# pcap callback (paced if clock given)
+		if workers:
+			self.pool = SnoopLib.DecodePool(pcapObj.datalink(), self.processor.extractors, workers,
+							output=self.buffer.extend)
+			self.handler = self.__submitHandler
+		if profiler: self.handler = self.__profiledHandler
+		if clock: self.handler = clock.wrap(self.handler)
+		self.clock	= clock
+		self.idle	= idle
+		self.pending	= None			# capture to go on with (see 'swap')
+		self.stopped	= Event()		# quit thread?
+		self.wakeup	= Event()		# leave the current capture loop
 		Thread.__init__(self)
 
 	def run(self):
-		""" Sniff ad infinitum.
-		    PacketHandler shall be invoked by pcap for every packet.
-		    When returning with error, decide  """
-		while not self.quit:
+		""" Sniff ad infinitum (or until the end of a capture file or 'stop').
+		    PacketHandler shall be invoked by pcap for every packet, pcap
+		    gets called for batches of packets (SnoopLib.dispatch_loop).
+		    When returning with error, warn and go on. """
+		if self.pool: self.pool.start()
+		while not self.stopped.is_set():
 			try:
-				self.pcap.loop(0, self.__packetHandler)
-			except SystemExit:	# raised by '__packetHandler' to force quit
-				pass
-				# is there a direct (simpler?) way to force return from waiting 'self.pcap.loop' ?!?
+				if self.profiler:	self.profiler.runcall(self.__capture)
+				else:			self.__capture()
+				if self.offline: break			# end of capture file reached
 			except:			# generic error
 				#warnings.warn( "%s %s" % sys.exc_info()[0:2] )
 				#print "\n".join(inspect.getframeinfo(sys.exc_info()[2]).code_context)
 				#print "".join([ 'File "%s", line %i, in %s (%s)\n%s\n' % (f[1:4]+("\n".join(f[4]),)) for f in inspect.getinnerframes(sys.exc_info()[2]) ])
 				warnings.warn( "\n".join(PyLib.tb_info()[2]) )
 				sys.exc_clear()
+				self.stopped.wait(1.)			# (no busy loop on persistent errors)
+		if self.pool:	self.pool.close()			# wait for the workers to finish
+		else:		self.buffer.extend(self.processor.flush())	# URLs still held by stream reassembly
+		if self.profiler:
+			stats = self.stats()
+			try:	self.profiler.dump(self.processor.timers.report() + [""] + SnoopLib.describe_extractors(stats))
+			except IOError:				# ... turn exception into warning
+				warnings.warn("Could not write profile.\n%s" % "\n".join(PyLib.tb_info()[2]))
+
+	def __capture(self):
+		""" Dispatch packets of pcap (and of the captures swapped in)
+		    until stopped or the end of the capture file. """
+		while not self.stopped.is_set():
+			SnoopLib.dispatch_loop(self.pcap, self.handler, self.wakeup, not self.offline, idle=self.idle)
+			if self.pending is None: break		# stopped or end of capture file
+			self.wakeup.clear()
+			(self.pcap, self.pending) = (self.pending, None)
+
+	def swap(self, pcapObj):
+		""" Go on capturing with pcapObj (same device and link type, e.g.
+		    reopened by a SnoopLib.CaptureTuner) after the current batch. """
+		self.pending = pcapObj
+		self.wakeup.set()
+
+	def stop(self):
+		""" Let the thread return (after the current batch of packets;
+		    within 'SnoopLib.dispatch_loop' idle time on a quiet link). """
+		self.stopped.set()
+		self.wakeup.set()
+		if self.clock: self.clock.stop()
+
+	def stats(self):
+		""" Return extractor stats (summed over the workers, if any). """
+		return (self.pool or self.processor).stats()
 
 	def __packetHandler(self, hdr, data):
-		""" Use the ImpactDecoder to turn the rawpacket into a hierarchy
-		    of ImpactPacket instances.
-		    Then search for URLs in packet by regex and log them to list. """
-		if self.quit: raise SystemExit('capture on interface stoped.')
-
-		decoded_data = self.decoder.decode(data)
-		(src, dst, data) = self.__getHeaderInfo(decoded_data)
-		for item in regex_links.finditer(str(data)):
-			if not item: continue
-			#pos = item.start()
-			link = item.groups()[0]
-			#self.buffer.append( (link,) )
-			self.buffer.append( (link,src,dst,) )	# append to internal buffer
-
-	# thanks to http://d.hatena.ne.jp/shoe16i/mobile?date=20090203&section=p1
-	def __getHeaderInfo(self, decoded_data):
-		""" Extract the header info completely. """
-		ip = decoded_data.child()
-		tcp = ip.child()
-		#src = (ip.get_ip_src(), tcp.get_th_sport())
-		try:	src = ip.get_ip_src()
-		except:	src = '?'
-		#dst = (ip.get_ip_dst(), tcp.get_th_dport())
-		try:	dst = ip.get_ip_dst()
-		except:	dst = '?'
-		#data = tcp.get_data_as_string()
-		data = tcp.get_packet()
-		return (src, dst, data)
+		""" Let the SnoopLib.PacketProcessor decode the rawpacket (header
+		    info by fixed offsets, or ImpactDecoder for unusual packets) and
+		    search for URLs in packet (stream) by regex; log them to list. """
+		self.packets += 1
+		self.bytes += len(data)
+		found = self.processor.process(hdr, data)	# list of (link, src, dst, ts)
+		if found: self.buffer.extend(found)		# append to internal buffer
+
+	def __submitHandler(self, hdr, data):
+		""" Hand the rawpacket to the SnoopLib.DecodePool (results get
+		    appended to internal buffer by the pool). """
+		self.packets += 1
+		self.bytes += len(data)
+		self.pool.submit(hdr, data)
+
+	def __profiledHandler(self, hdr, data):
+		""" Like '__packetHandler' (or '__submitHandler'), timing the
+		    buffer push (or hand-over to the pool) too. """
+		self.packets += 1
+		self.bytes += len(data)
+		timers = self.processor.timers
+		if self.pool:
+			t = time.time()
+			self.pool.submit(hdr, data)
+			timers.add("submit", time.time() - t)
+			return
+		found = self.processor.process(hdr, data)
+		if found:
+			t = time.time()
+			self.buffer.extend(found)
+			timers.add("buffer", time.time() - t)
 
 
 # MainWindow
 # The GUI was created/designed using GLADE
 #
-class MainWindowGTK:
+class MainWindowGTK:
 	"""
 	Main GUI class providing cross-platform GTK+ frontend.
 	"""
 
-	# initialization
-	#
+	# initialization
+	#
 	sniffer = None			# SnifferThread class
 	capture_trigger = False		# capture URL?
 	capture_index   = 0		# capture index
-	capture_last    = None		# capture last entry
-	settings 	= { "del_dups": False, "min_icon": False }
+	dedup		= None		# SnoopLib.DedupIndex of captured URLs
+	rows		= None		# SnoopLib.RowStore of rows in list (working set)
+	categories	= None		# SnoopLib.CategoryIndex of 'dict_filter' (bits and row counts)
+	filter_name	= '(all)'	# selected filter and ...
+	filter_bit	= 0		# ... its category bit
+	search_index	= None		# SnoopLib.NgramIndex of listed URLs (key: Index)
+	search_cache	= (None, ())	# last interactive search (text, set of Index)
+	exporter	= None		# running SnoopLib.ExportThread
+	store		= None		# SnoopLib.CaptureStore recording the capture
+	store_error	= None		# recording error already reported (statusbar)
+	metrics		= None		# SnoopLib.CaptureMetrics of the capture (shown in statusbar)
+	metrics_server	= None		# SnoopLib.MetricsServer (if enabled)
+	metrics_shown	= 0.		# time of last metrics statusbar update
+	metrics_interval = 1.		# seconds between metrics statusbar updates
+	feed		= None		# SnoopLib.FeedServer publishing URLs and 'ext' toggles (if enabled)
+	profiling	= False		# profile next capture? (statusbar menu)
+	profiler	= None		# PyLib.Profiler of the running capture
+	stop_timeout	= 2.		# seconds to wait for the capture thread on stop
+	settings 	= { "del_dups": False, "min_icon": False,
+			    "bpf_payload": True, "bpf_protocols": "", "bpf_ports": "", "bpf_extra": "",
+			    "reasm": True, "http": True, "extractors": "", "workers": 0, "dedup_window": 0,
+			    "buffer_size": 100000, "buffer_policy": PyLib.RingBuffer.DROP_OLDEST,
+			    "max_rows": 0, "evict_policy": SnoopLib.RowStore.FIFO, "spill_file": "",
+			    "export_follow": False, "store_file": "", "metrics_address": "", "interfaces": "",
+			    "profile_mode": PyLib.Profiler.SAMPLE, "profile_file": "urlsnooper-profile.txt",
+			    "capture_profile": "default", "promisc": False, "auto_tune": False, "feed_address": "" }
+	replay_file	= None		# capture file to replay (instead of live capture)
+	replay_clock	= None		# pace replay to original timestamps?
+
+	update_interval	= (50, 1000)	# refresh interval range in ms (adapted to load)
+	update_load	= 5		# refresh interval is ~ 'update_load' times the time spent inserting
+	update_budget	= 0.04		# max. seconds per refresh spent inserting (rest waits in buffer)
+	update_batch	= 200		# rows per insert batch (larger batches are inserted detached)
 
 	__update_timer = None
 
-	def __init__(self, saved_settings={}):
-		""" Initialize and setup GTK+ window and widgets (with help from glade). """
+	def __init__(self, saved_settings={}, replay_file=None, replay_clock=None, profile=None):
+		""" Initialize and setup GTK+ window and widgets (with help from glade).
+		    With profile (mode, see PyLib.Profiler) captures get profiled. """
 		self.settings.update( saved_settings )		# overwrite default settings with users config
+		self.replay_file  = replay_file
+		self.replay_clock = replay_clock
 
 		# retrieve widgets
 		self.gladefile		= raw_path + ".glade"
-		self.xml		= gtk.glade.XML(self.gladefile)
-		self.window1		= self.xml.get_widget('window1')
+		self.xml		= gtk.glade.XML(self.gladefile)
+		self.window1		= self.xml.get_widget('window1')
 		self.combobox1		= self.xml.get_widget('combobox1')
 		self.combobox2		= self.xml.get_widget('combobox2')
 		self.togglebutton1	= self.xml.get_widget('togglebutton1')
@@ -222,21 +319,42 @@ class MainWindowGTK:
 		self.scrolledwindow1	= self.xml.get_widget('scrolledwindow1')
 		self.treeview1		= self.xml.get_widget('treeview1')
 		self.statusbar1		= self.xml.get_widget('statusbar1')
-		self.filechooserdialog1	= self.xml.get_widget('filechooserdialog1')
+		self.filechooserdialog1	= self.xml.get_widget('filechooserdialog1')
 		self.menu1		= self.xml.get_widget('menu1')
 		self.aboutdialog1       = self.xml.get_widget('aboutdialog1')
-		self.window2		= self.xml.get_widget('window2')
-		self.window2.treeview2	= self.xml.get_widget('treeview2')
+		self.window2		= self.xml.get_widget('window2')
+		self.window2.treeview2	= self.xml.get_widget('treeview2')
+
+		# statusbar menu (not in glade file; reachable without any rows listed)
+		self.menu2		= gtk.Menu()
+		self.menuitem_profile	= gtk.CheckMenuItem("_profile next capture")
+		self.menuitem_profile.connect("toggled", self.on_menuitem_profile_toggled)
+		menuitem_about		= gtk.MenuItem("_about")
+		menuitem_about.connect("activate", self.on_menuitem_about_activate)
+		for item in (self.menuitem_profile, menuitem_about):
+			item.show()
+			self.menu2.append(item)
+		if profile:
+			self.settings["profile_mode"] = profile
+			self.menuitem_profile.set_active(True)
 
 		# init treeview
-		self.__treeview_init()
-
+		self.__treeview_init()
+		self.dedup = SnoopLib.DedupIndex()				# session-wide duplicate detection
+		self.__rows_init()						# row cap
+		self.categories = SnoopLib.CategoryIndex(dict_filter)		# classification for filter
+		self.search_index = SnoopLib.NgramIndex()			# substring search
+
 		# init comboboxes
-		self.devs = findalldevs()
+		try:	self.devs = findalldevs()
+		except pcapy.PcapError:	self.devs = []		# no permissions (replay still works)
 		(self.dev_dict, default_dev) = self.getdevips(self.devs)
+		if self.replay_file:					# offer capture file as first 'device'
+			self.devs = [ self.replay_file ] + self.devs
+			default_dev = self.replay_file
 
-		self.combobox1.get_model().clear()
-		for i, item in enumerate(self.devs):
+		self.combobox1.get_model().clear()
+		for i, item in enumerate(self.devs):
 			self.combobox1.append_text ( item )
 			if (item == default_dev): self.combobox1.set_active(i)
 		self.combobox2.get_model().clear()
@@ -253,22 +371,23 @@ class MainWindowGTK:
 		# http://bytes.com/topic/python/answers/580047-pygtk-statusicon-tray-icon
 		self.stateico = gtk.StatusIcon()
 		self.stateico.set_visible(False)
-		if not (os.name == 'nt'):
-			icon_name = self.window1.get_icon_name()			# get (and set) icon from window1
-			icon = gtk.icon_theme_get_default().load_icon(icon_name, 48, 0)	#
+		if not (os.name == 'nt'):
+			icon_name = self.window1.get_icon_name()			# get (and set) icon from window1
+			icon = gtk.icon_theme_get_default().load_icon(icon_name, 48, 0)	#
 			self.stateico.set_from_pixbuf(icon)
 		else:
 			self.stateico.set_from_stock(gtk.STOCK_MISSING_IMAGE)
 		self.stateico.set_tooltip('PyURLSnooper')
 
 		# connect signal handlers
-		# (so late since we don't want to have effects during init of comboxes, etc...)
+		# (so late since we don't want to have effects during init of comboxes, etc...)
 		self.xml.signal_autoconnect( self )
 		self.window1.drag_dest_set(	gtk.DEST_DEFAULT_MOTION |
 						gtk.DEST_DEFAULT_HIGHLIGHT |
 						gtk.DEST_DEFAULT_DROP,
 						[ ( "text/plain", 0, 80 ) ], gtk.gdk.ACTION_COPY)
-		self.stateico.connect("activate", self.on_stateico_clicked)
+		self.stateico.connect("activate", self.on_stateico_clicked)
+		self.__feed_open()
 
 		# display window
 		self.window1.show()
@@ -282,18 +401,52 @@ class MainWindowGTK:
 	def run(self):
 		""" Run gtk mainloop and with it THIS APP. """
 		gtk.gdk.threads_init()			# (!) important for multi-threading to work with GTK+
-		self.__update_timer = gobject.timeout_add(250, self.__update, self)
-		self.statusbar1.push(0, "Ready (for about dialog; right-click to lower right corner).")
+		self.__update_timer = gobject.timeout_add(self.update_interval[0], self.__update, self)
+		self.statusbar1.push(0, "Ready (for profiling and about; right-click to lower right corner).")
 		gtk.main()
 
 	def __update(self, data=None):
-		""" Refresh callback to keep the GUI in sync with background thread. """
-		if self.sniffer and self.sniffer.buffer:
-			buffer = self.sniffer.buffer	# retrieve buffer and ...
-			self.sniffer.buffer = []	# ... reset it (maybe a lock would be good?!)
-			if self.capture_trigger:
-				self.__treeview_append( buffer )
-		return True				# keep running continous
+		""" Refresh callback to keep the GUI in sync with background thread.
+		    Inserts batches of rows within a time budget and re-schedules
+		    itself with an interval adapted to the load (short while idle for
+		    low latency, longer under load for bigger batches). """
+		start = time.time()
+		if self.sniffer and self.sniffer.offline and not self.sniffer.is_alive() and not self.sniffer.buffer:
+			self.togglebutton1.set_active(False)	# replay finished; stop capture
+		if self.exporter: self.__export_progress()
+		detached = None
+		if self.sniffer and self.capture_trigger and (len(self.sniffer.buffer) >= self.update_batch):
+			detached = self.__treeview_detach()	# bulk insert
+		try:
+			while self.sniffer and (time.time() - start < self.update_budget):
+				buffer = self.sniffer.buffer.drain(self.update_batch)	# retrieve from buffer (locked)
+				if not buffer: break
+				self.__deliver( buffer )
+		finally:
+			if detached: self.__treeview_attach(detached)
+		if self.metrics and (start - self.metrics_shown >= self.metrics_interval):
+			self.metrics_shown = start
+			self.statusbar1.pop(1)			# (own context; replace last metrics line)
+			self.statusbar1.push(1, "Capturing on %s: %s" % (self.metrics.adapter, self.metrics.summary()))
+		if self.store and self.store.error and not self.store_error:	# report once, when it happens
+			self.store_error = self.store.error
+			self.statusbar1.push(0, "Recording URLs failed, recording stopped: %s" % self.store.error)
+			warnings.warn("Could not write capture store, not recording anymore.\n%s" % self.store.error)
+		for sniffer in (self.sniffer and getattr(self.sniffer, "sniffers", [ self.sniffer ])) or []:	# (merged: per interface)
+			info = sniffer.tuner and sniffer.tuner.check(sniffer)
+			if info: self.statusbar1.push(0, "Capture on %s retuned (%s)." % (sniffer.tuner.dev, info))
+		spent = int((time.time() - start)*1000*self.update_load)
+		interval = min(max(spent, self.update_interval[0]), self.update_interval[1])
+		self.__update_timer = gobject.timeout_add(interval, self.__update, self)
+		return False				# (re-scheduled above)
+
+	def __deliver(self, buffer):
+		""" Pass URLs found to metrics, feed and (while capturing) list,
+		    store and export. """
+		self.metrics.observe_output(buffer)
+		if self.feed: self.feed.publish_urls(buffer, self.metrics.adapter)
+		if self.capture_trigger:
+			self.__treeview_append( buffer )
 
 	# signals / glade callbacks
 	#	
@@ -301,7 +454,10 @@ class MainWindowGTK:
 		""" Button: 'clear'. """
 		#self.treeview1.get_model().clear()
 		self.model1.clear()
-		self.capture_last = None		# reset last entry capture
+		self.dedup.clear()			# reset duplicate detection
+		self.rows.clear()			# (list cleared; nothing evicted)
+		self.categories.clear()
+		self.search_index.clear()
 		self.statusbar1.push(0, "List cleared.")
 
 	# thanks to http://www.pygtk.org/pygtk2tutorial/sec-ToggleButtons.html#togglefig
@@ -309,36 +465,136 @@ class MainWindowGTK:
 		""" Button: 'capture!'. """
 		if (widget.get_active() == 1):							# capture ON
 			self.combobox1.set_sensitive(False)					# lock combobox
-			#dev = self.combobox1.get_child().get_text()
+			#dev = self.combobox1.get_child().get_text()
 			dev = self.combobox1.get_model()[self.combobox1.get_active()][0]
 			(self.dev_dict, default_dev) = self.getdevips(self.devs)		# refresh dict
-			p = open_live(dev, 1500, 0, 100)					# open interface for catpuring
-			#p.setfilter(filter)							# set the BPF filter, see tcpdump(3)
-			p.setfilter('')								#
-			self.sniffer = SnifferThread(p)						# Create sniffing thread and ...
-			self.sniffer.start()							# ... start it
+			offline = (dev == self.replay_file)					# replay capture file?
+			devs = [ dev ]
+			if not offline: devs = SnoopLib.split_list(self.settings["interfaces"]) or devs	# several interfaces?
+			clock = None
+			if offline and self.replay_clock: clock = SnoopLib.ReplayClock(self.replay_clock)
+			try:	buffer = PyLib.RingBuffer(int(self.settings["buffer_size"]), self.settings["buffer_policy"], timeout=1.)
+			except ValueError:							# ... turn exception into warning
+				warnings.warn("Invalid URL buffer option, using defaults.\n%s" % "\n".join(PyLib.tb_info()[2]))
+				buffer = PyLib.RingBuffer()					#
+			if self.settings["store_file"]:						# record URLs in database
+				try:
+					self.store = SnoopLib.CaptureStore(self.settings["store_file"])
+					self.store.start()
+					self.store_error = None
+				except SnoopLib.sqlite3.Error:					# ... turn exception into warning
+					warnings.warn("Could not open capture store, not recording.\n%s" % "\n".join(PyLib.tb_info()[2]))
+					self.store = None
+			profiler = None
+			if self.profiling:							# profile capture thread
+				try:	profiler = PyLib.Profiler(self.settings["profile_mode"], self.settings["profile_file"])
+				except ValueError:						# ... turn exception into warning
+					warnings.warn("Invalid profiling mode, using '%s'.\n%s" % (PyLib.Profiler.SAMPLE, "\n".join(PyLib.tb_info()[2])))
+					profiler = PyLib.Profiler(PyLib.Profiler.SAMPLE, self.settings["profile_file"])
+			self.profiler = profiler
+			self.__feed_open()							# (address setting may have changed)
+			if len(devs) == 1:							# Create sniffing thread and ...
+				self.sniffer = self.__sniffer_create(dev, offline, clock, buffer, profiler)
+				sniffers = [ self.sniffer ]
+			else:									# ... one per interface, merged
+				sniffers = [ self.__sniffer_create(item, False, None, PyLib.RingBuffer(buffer.capacity, buffer.policy, buffer.timeout),
+								   (item == devs[0]) and profiler or None) for item in devs ]
+				self.sniffer = SnoopLib.CaptureMerger(sniffers, devs, buffer)
+				dev = ", ".join(devs)
+			self.metrics = SnoopLib.CaptureMetrics(self.sniffer, dev, live=not offline,
+							       histograms=bool(self.settings["metrics_address"]), store=self.store)
+			if self.settings["metrics_address"]:					# serve metrics (Prometheus)
+				try:
+					self.metrics_server = SnoopLib.MetricsServer(self.metrics, self.settings["metrics_address"])
+					self.metrics_server.start()
+				except (socket.error, ValueError):				# ... turn exception into warning
+					warnings.warn("Could not serve metrics, not serving.\n%s" % "\n".join(PyLib.tb_info()[2]))
+					self.metrics_server = None
+			for sniffer in sniffers: sniffer.start()				# ... start it
+			if self.sniffer not in sniffers: self.sniffer.start()			# (merger after the sniffers)
 
 			self.capture_trigger = True
 			widget.set_label("stop")
-			self.statusbar1.push(0, "Listening on %s: net=%s, mask=%s, linktype=%d" % (dev, p.getnet(), p.getmask(), p.datalink()))
+			p = sniffers[0].pcap
+			if len(devs) == 1: self.statusbar1.push(0, "Listening on %s: net=%s, mask=%s, linktype=%d" % (dev, p.getnet(), p.getmask(), p.datalink()))
+			else:		   self.statusbar1.push(0, "Listening on %s (merged)." % dev)
 		else:										# capture OFF
 			#self.sniffer.pcap.close()
-			self.sniffer.quit = True
+			self.sniffer.stop()
+			self.sniffer.buffer.close()						# never block sniffer anymore
+			self.sniffer.join(self.stop_timeout)					# (returns after the current batch)
+			if self.sniffer.is_alive(): warnings.warn("Capture thread did not stop within %.1fs." % self.stop_timeout)
+			buffer = self.sniffer.buffer.drain()					# URLs left (incl. flushed on return)
+			if buffer:
+				detached = None
+				if len(buffer) >= self.update_batch: detached = self.__treeview_detach()	# bulk insert
+				try:	self.__deliver( buffer )
+				finally:
+					if detached: self.__treeview_attach(detached)
+			if self.exporter: self.exporter.stop(wait=False)			# stop appending to saved list
+			info = "URLs dropped: %i" % self.metrics.sample()["buffer_dropped_total"]	# (all buffers)
+			if self.store:
+				self.store.close()						# write rest of recorded URLs
+				info += "; URLs recorded: %i, not recorded: %i" % (self.store.written, self.store.dropped)
+				self.store = None
+			info = "; ".join(SnoopLib.describe_extractors(self.sniffer.stats()) + [info])	# (summed over workers/interfaces)
+			if self.profiler: info += "; profile (%s) goes to %s" % (self.profiler.mode, self.profiler.filename)
+			self.profiler = None
+			if self.metrics_server:
+				self.metrics_server.close()
+				self.metrics_server = None
+			self.metrics = None
+			self.statusbar1.pop(1)							# (last metrics line)
 			del self.sniffer
 			self.sniffer = None
 
 			self.capture_trigger = False
 			widget.set_label("capture!")
 			self.combobox1.set_sensitive(True)					# unlock combobox (again)
-			self.statusbar1.push(0, "Capture stopped.")
+			self.statusbar1.push(0, "Capture stopped (%s)." % info)
+
+	def __sniffer_create(self, dev, offline, clock, buffer, profiler):
+		""" Open interface (or capture file) dev and create SnifferThread
+		    with the filter and URL extractors of the settings. """
+		try:	capture = SnoopLib.capture_profile(self.settings["capture_profile"], promisc=self.settings["promisc"])
+		except ValueError:							# ... turn exception into warning
+			warnings.warn("Invalid capture profile, using 'default'.\n%s" % "\n".join(PyLib.tb_info()[2]))
+			capture = SnoopLib.capture_profile("default", promisc=self.settings["promisc"])
+		if offline:	p = SnoopLib.open_capture(filename=dev)			# open file for replay
+		else:		p = SnoopLib.open_capture(dev, profile=capture)		# open interface for catpuring
+		filter = self.capture_filter()
+		try:	p.setfilter(SnoopLib.link_filter(filter, p.datalink()))	# set the BPF filter, see tcpdump(3)
+		except (ValueError, pcapy.PcapError):					# ... turn exception into warning
+			warnings.warn("Invalid capture filter, capturing everything.\n%s" % "\n".join(PyLib.tb_info()[2]))
+			filter = ''
+			p.setfilter(filter)						#
+		reasm = None
+		if self.settings["reasm"]: reasm = SnoopLib.StreamReassembler(regex_links)
+		try:
+			(names, ports) = SnoopLib.parse_extractors(self.settings["extractors"])
+			if not self.settings["http"]: names = [ name for name in (names or SnoopLib.extractors) if name != "http" ]
+			extractors = SnoopLib.create_extractors(names, reasm, ports)
+		except ValueError:							# ... turn exception into warning
+			warnings.warn("Invalid extractors option, running all.\n%s" % "\n".join(PyLib.tb_info()[2]))
+			extractors = SnoopLib.create_extractors(None, reasm)		#
+		sniffer = SnifferThread(p, offline, clock, extractors, self.settings["workers"], buffer, profiler, capture["timeout"] / 1000.)
+		if self.settings["auto_tune"] and not offline: sniffer.tuner = SnoopLib.CaptureTuner(dev, filter, capture)
+		return sniffer
 
 	def on_window1_destroy(self, source=None, event=None):
 		""" Window closed signal handler. """
 		self.statusbar1.push(0, "Quit.")
 		if self.sniffer:
-			self.sniffer.quit = True
+			self.sniffer.stop()
+			self.sniffer.buffer.close()
+			self.sniffer.join(self.stop_timeout)
 			del self.sniffer
 			self.sniffer = None
+		if self.metrics_server: self.metrics_server.close()
+		if self.feed: self.feed.close()
+		self.rows.close()
+		if self.exporter: self.exporter.stop()
+		if self.store: self.store.close()
 		gobject.source_remove(self.__update_timer)
 		gtk.main_quit()
 
@@ -352,13 +608,22 @@ class MainWindowGTK:
 		if response == gtk.RESPONSE_OK:
 			filename = self.filechooserdialog1.get_filename()
 
-			# write file
-			outfile = open(filename, "w")
-			for item in iter(self.treeview1.get_model()):
-				outfile.write( ",".join(map(str, item[0])) )
-				outfile.write( '\n' )
-			outfile.close()
-			self.statusbar1.push(0, "List saved.")
+			# write file (in background; format and compression by extension)
+			if self.exporter: self.exporter.stop()
+			rows = [ entry[0] + (entry[1],) for entry in self.rows.rows.itervalues() ]	# snapshot (rows listed)
+			select = None
+			if self.filter_bit:						# only rows shown by filter
+				bit = self.filter_bit
+				select = lambda row: self.categories.classify(row[1]) & bit
+			follow = self.settings["export_follow"] and bool(self.sniffer)
+			try:
+				self.exporter = SnoopLib.ExportThread(filename, [ h.lower() for h in self.column_header ], rows,
+								      follow=follow, select=select)
+				self.exporter.start()
+				self.statusbar1.push(0, "Saving list...")
+			except (IOError, ImportError, ValueError), e:
+				self.exporter = None
+				self.statusbar1.push(0, "List not saved: %s" % e)
 		self.filechooserdialog1.hide()				# just hide - not destroy - preserves settings
 
 	# thanks to http://faq.pygtk.org/index.py?req=show&file=faq13.017.htp
@@ -393,17 +658,22 @@ class MainWindowGTK:
 		clipboard.store()
 		self.statusbar1.push(0, "Copied to clipboard.")
 
+	def on_menuitem_profile_toggled(self, widget):
+		""" Statusbar menu: 'profile next capture' (see 'profile_mode' setting). """
+		self.profiling = widget.get_active()
+		if self.profiling:	self.statusbar1.push(0, "Next capture gets profiled (%s), report: %s." % (self.settings["profile_mode"], self.settings["profile_file"]))
+		else:			self.statusbar1.push(0, "Profiling off.")
+
 	# thanks to http://www.pygtk.org/pygtk2tutorial/sec-TreeViewDragAndDrop.html
 	# and http://www.pygtk.org/pygtk2tutorial/sec-DNDMethods.html
 	#def on_treeview1_drag_data_received(self, treeview, context, x, y, selection, info, timestamp):
 	def on_window1_drag_data_received(self, treeview, context, x, y, selection, info, timestamp):
 		""" Drag'n'Drog signal handler. """
-		data = selection.data
-		for i, item in enumerate(self.treeview1.get_model()):
-			if (data in str(item[0])):
-				self.treeview1.set_cursor( (i,) )
-				self.statusbar1.push(0, "Entry found and selected.")
-				return
+		path = self.search_path(selection.data)
+		if path:
+			self.treeview1.set_cursor(path)
+			self.statusbar1.push(0, "Entry found and selected.")
+			return
 		self.statusbar1.push(0, "Nothing found.")
 
 	# thanks to http://zetcode.com/tutorials/pygtktutorial/signals/
@@ -415,27 +685,40 @@ class MainWindowGTK:
 
 	def on_combobox2_changed(self, source=None, event=None):
 		""" Combobox changed signal handler. """
-		pattern = dict_filter[self.combobox2.get_model()[self.combobox2.get_active()][0]]
-		if not pattern:	self.treeview1.set_model(self.model1)		# switch used model since one supports sorting only
-		else:		self.treeview1.set_model(self.modelfilter1)	# and the other filtering only - none of them both
+		self.filter_name = self.combobox2.get_model()[self.combobox2.get_active()][0]
+		self.filter_bit  = self.categories.bits[self.filter_name]	# (looked up once, not per row)
+		if not self.filter_bit:	self.treeview1.set_model(self.model1)		# switch used model since one supports sorting only
+		else:			self.treeview1.set_model(self.modelfilter1)	# and the other filtering only - none of them both
 		self.treeview1.set_search_column(self.search_colid)		# re-enable searching in 'URL' column
 		self.modelfilter1.refilter()					# apply filter conditions
-		self.statusbar1.push(0, "Other filter selected.")
+		self.statusbar1.push(0, "Other filter selected (%i of %i rows)." % (self.categories.count(self.filter_name), self.categories.total))
 
 	def on_columnext_toggled(self, cell, path):
 		""" Sets the toggled state on the toggle button to true or false. """
-		path = self.treeview1.get_model()[path][0][0]			# get correct path where checkbox was toggled (bugfix if using filter)
+		if self.treeview1.get_model() is self.modelfilter1:		# get correct path where checkbox was toggled (bugfix if using filter)
+			path = self.modelfilter1.convert_path_to_child_path(path)
 		self.model1[path][3] = not self.model1[path][3]			# toggle cell (finally)
 		#print "Toggle '%s' to: %s" % (self.model1[path][0], self.model1[path][3],)
-		s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)		# Echo client program
-		try:								# Try to connect to the socket and ...
-			s.connect(('localhost', 50301))					# (The remote host, The same port as used by the server)
-			s.send(str( (self.model1[path][0], self.model1[path][3],) ))	# send data
-		except:								# ...  turn exception into warning
-			warnings.warn("Could not connect to socket. Is any client program running?", Warning)
-		#data = s.recv(1024)						# (recieve data)
-		s.close()							# close socket
-		#print 'Received', repr(data)					#
+		if self.feed:							# publish to subscribers (if any)
+			url = SnoopLib.store_text(self.model1[path][self.search_colid])	# ('URL' column)
+			self.feed.publish({"event": "toggle", "url": url, "ext": self.model1[path][3]})
+
+	def __feed_open(self):
+		""" (Re)start the feed server at the address of the settings
+		    ('ext_address' with 'ext' support; empty: none). Subscribers
+		    stay connected while the address is unchanged. """
+		address = self.settings["feed_address"] or (ext_sup and ext_address) or ""
+		if self.feed and (self.feed.address == address): return
+		if self.feed:
+			self.feed.close()
+			self.feed = None
+		if not address: return
+		try:
+			self.feed = SnoopLib.FeedServer(address)
+			self.feed.start()
+		except (socket.error, ValueError):					# ... turn exception into warning
+			warnings.warn("Could not publish feed, not publishing.\n%s" % "\n".join(PyLib.tb_info()[2]))
+			self.feed = None
 
 	# thanks to: http://zetcode.com/tutorials/pygtktutorial/dialogs/
 	# thanks to: http://www.pygtk.org/docs/pygtk/class-gtkwindow.html
@@ -443,16 +726,20 @@ class MainWindowGTK:
 	def on_statusbar1_button_press_event(self, *data):
 		""" Statusbar button press signal handler. """
 		widget, event = data
-		if (event.button == 3):		# show about on right-click
-			self.aboutdialog1.set_version( __version__.split(",")[1][2:5] )	# set actual
-			if not (os.name == 'nt'):
-				self.aboutdialog1.set_program_name( "PyURLSnooper" )		# (is overwritten?!?)
-				#about.set_logo(gtk.gdk.pixbuf_new_from_file("battery.png"))
-				icon_name = self.window1.get_icon_name()			# get (and set) icon from window1
-				icon = gtk.icon_theme_get_default().load_icon(icon_name, 48, 0)	#
-				self.aboutdialog1.set_logo( icon )				#
-			self.aboutdialog1.run()
-			self.aboutdialog1.hide()
+		if (event.button == 3):		# show menu (profiling, about) on right-click
+			self.menu2.popup( None, None, None, event.button, event.time )
+
+	def on_menuitem_about_activate(self, widget):
+		""" Statusbar menu: 'about'. """
+		self.aboutdialog1.set_version( __version__.split(",")[1][2:5] )	# set actual
+		if not (os.name == 'nt'):
+			self.aboutdialog1.set_program_name( "PyURLSnooper" )		# (is overwritten?!?)
+			#about.set_logo(gtk.gdk.pixbuf_new_from_file("battery.png"))
+			icon_name = self.window1.get_icon_name()			# get (and set) icon from window1
+			icon = gtk.icon_theme_get_default().load_icon(icon_name, 48, 0)	#
+			self.aboutdialog1.set_logo( icon )				#
+		self.aboutdialog1.run()
+		self.aboutdialog1.hide()
 
 	# thanks to http://bbs.archlinux.org/viewtopic.php?pid=705541
 	# and http://library.gnome.org/devel/pygtk/stable/class-gtktreeviewcolumn.html#method-gtktreeviewcolumn--set-cell-data-func
@@ -487,20 +774,48 @@ class MainWindowGTK:
 		""" Window (window2: options/settings dialog) closed signal handler. 
 		    (performs also all clean-up actions)."""
 		self.window2.hide()
-		result = []
+		result = {}
 		for item in iter(self.window2.mdl):
 			for subitem in item.iterchildren():
 				entry = [ subitem[i] for i in range(6) ]
 				colid = self.window2.type2colid[entry[0]["type"]]
-				result.append( entry[colid] )
-		self.settings = { "del_dups": result[0], "min_icon": result[1] }
+				result[entry[0]["key"]] = entry[colid]
+		self.settings = dict(self.settings)
+		self.settings.update( result )
+		self.__rows_init()
 		self.statusbar1.push(0, "New options/settings applied.")
 		return True
 
 	def on_button5_clicked(self, source=None, event=None):
 		""" Button: 'config...'. """
-		self.window2.settings =  [ 	( "result display", {"remove (direct) duplicates":("check", self.settings["del_dups"])} ),
-						( "window behaviour", {"iconify/minimize to panel/tray":("check", self.settings["min_icon"])} ),
+		self.window2.settings =  [ 	( "result display", {"remove duplicates (count hits instead)":("check", self.settings["del_dups"], "del_dups"),
+								     "duplicates window in seconds (0: whole session)":("text", self.settings["dedup_window"], "dedup_window")} ),
+						( "window behaviour", {"iconify/minimize to panel/tray":("check", self.settings["min_icon"], "min_icon")} ),
+						( "capture (on next capture)", {"find URLs split across TCP segments":("check", self.settings["reasm"], "reasm"),
+										"rebuild HTTP/RTSP request URLs, skip binary bodies":("check", self.settings["http"], "http"),
+										"URL extractors[:ports] (e.g. 'http:80,regex'; empty: all)":("text", self.settings["extractors"], "extractors"),
+										"decoder processes (0: capture thread)":("spin", self.settings["workers"], "workers"),
+										"several interfaces, merged (e.g. 'eth0, eth1'; empty: selected one)":("text", self.settings["interfaces"], "interfaces"),
+										"capture profile ('%s')" % "', '".join(SnoopLib.capture_profiles):("text", self.settings["capture_profile"], "capture_profile"),
+										"promiscuous mode":("check", self.settings["promisc"], "promisc"),
+										"on kernel drops enlarge buffer, then reduce snaplen":("check", self.settings["auto_tune"], "auto_tune"),
+										"URL buffer size (entries)":("text", self.settings["buffer_size"], "buffer_size"),
+										"URL buffer full ('%s')" % "', '".join(PyLib.RingBuffer.policies):("text", self.settings["buffer_policy"], "buffer_policy")} ),
+						( "capture store (on next capture)", {"record URLs in database file (empty: off)":("text", self.settings["store_file"], "store_file")} ),
+						( "profiling (statusbar menu or '--profile'; on next capture)",
+						  {"mode ('%s')" % "', '".join(PyLib.Profiler.modes):("text", self.settings["profile_mode"], "profile_mode"),
+						   "report file":("text", self.settings["profile_file"], "profile_file")} ),
+						( "metrics (on next capture)", {"serve Prometheus metrics at '[host:]port' or Unix socket path (empty: off)":("text", self.settings["metrics_address"], "metrics_address")} ),
+						( "feed (on next capture)", {"publish URLs as JSON lines at '[host:]port' or Unix socket path (empty: off)":("text", self.settings["feed_address"], "feed_address")} ),
+						( "save list", {"keep appending new rows while capturing":("check", self.settings["export_follow"], "export_follow")} ),
+						( "list size", {"rows at most (0: no limit)":("text", self.settings["max_rows"], "max_rows"),
+								"evict rows ('%s')" % "', '".join(SnoopLib.RowStore.policies):("text", self.settings["evict_policy"], "evict_policy"),
+								"append evicted rows to file (empty: drop them)":("text", self.settings["spill_file"], "spill_file")} ),
+						( "capture filter (on next capture)",
+						  {"TCP segments with payload only":("check", self.settings["bpf_payload"], "bpf_payload"),
+						   "protocols (e.g. 'http, rtsp, rtmp'; empty for all)":("text", self.settings["bpf_protocols"], "bpf_protocols"),
+						   "additional ports (e.g. '81, 8081')":("text", self.settings["bpf_ports"], "bpf_ports"),
+						   "extra BPF filter (see tcpdump(3))":("text", self.settings["bpf_extra"], "bpf_extra")} ),
 						#( "TESTING1", {"test11":("combo", ["a", "b"], 2), "test12":("spin", 7), "test13":("text", "xyz")} ),
 						#( "TESTING2", {"test21":("radio", False), "test22":("radio", False), "test23":("radio", False)} ),
 						]
@@ -515,7 +830,7 @@ class MainWindowGTK:
 				txt   = str(entry[1])
 				try:	num = long(entry[1])
 				except:	num = 0
-				hiddendata = {"type":entry[0]}
+				hiddendata = {"type":entry[0], "key":entry[-1]}
 				#if (entry[0]=="combo"): hiddendata["combo"] = entry[1]
 				if (entry[0]=="radio"): hiddendata.update({"type":"check","radio":True})
 				self.window2.mdl.append( parent, (hiddendata, subitem, txt, num, txt, bool(entry[1])) )
@@ -533,8 +848,8 @@ class MainWindowGTK:
 			if ( (event.new_window_state == gtk.gdk.WINDOW_STATE_ICONIFIED) or
 			     (event.new_window_state == gtk.gdk.WINDOW_STATE_ICONIFIED | gtk.gdk.WINDOW_STATE_MAXIMIZED) ):	# going to iconify
 				#self.window1.iconify()			# for smooth change with compiz
-				#while gtk.events_pending():
-				#	gtk.main_iteration()
+				#while gtk.events_pending():
+				#	gtk.main_iteration()
 				self.stateico.set_visible(True)
 				self.window1.set_property('visible', False)
 
@@ -551,29 +866,31 @@ class MainWindowGTK:
 	def __treeview_init(self):
 		""" Initialize and build treeview widget underlining structure with all its funcionality. """
 		# create list data storage element (1st model; supports sorting)
-		self.hidden_data_prepend = 4				# first ? items are hidden internal data
-		self.model1 = gtk.ListStore( gobject.TYPE_PYOBJECT,	# data: whole data tuple (hidden)	id 0
+		self.hidden_data_prepend = 4				# first ? items are hidden internal data
+		self.model1 = gtk.ListStore( gobject.TYPE_PYOBJECT,	# data: whole data tuple (hidden)	id 0
 					     str,			# color: which one	 (hidden)	id 1
 					     bool,			# color: off/on?	 (hidden)	id 2
 					     gobject.TYPE_BOOLEAN,	# ext: off/on?	 	 (hidden)	id 3
-		                             gobject.TYPE_LONG,		# column: Index				id 4 (hidden_data_prepend)
-		                             gobject.TYPE_STRING,	# column: URL				id 5
-		                             gobject.TYPE_STRING,	# column: Protocol			id 6
-		                             gobject.TYPE_STRING)	# column: Adapter			id 7
-		self.treeview1.set_model(self.model1)
-		# create filtered model element (2nd model; supports filtering, but not sorting)
-		self.modelfilter1 = self.model1.filter_new()
-		self.modelfilter1.set_visible_func(self.__url_filter, data=None)
-		# create cell renderer element for use in columns (see next block)
-		self.renderer1 = gtk.CellRendererText()
+		                             gobject.TYPE_LONG,		# column: Index				id 4 (hidden_data_prepend)
+		                             gobject.TYPE_STRING,	# column: URL				id 5
+		                             gobject.TYPE_STRING,	# column: Protocol			id 6
+		                             gobject.TYPE_STRING,	# column: Adapter			id 7
+		                             gobject.TYPE_LONG,		# column: Hits				id 8
+		                             gobject.TYPE_LONG)		# category bitmask	 (hidden)	id 9
+		self.treeview1.set_model(self.model1)
+		# create filtered model element (2nd model; supports filtering, but not sorting)
+		self.__treeview_filter_init()
+		# create cell renderer element for use in columns (see next block)
+		self.renderer1 = gtk.CellRendererText()
 		# create column elements according to given header and hidden elements (indices order has to match with model1 ids!)
-		self.column_header = [ "Index", "URL", "Protocol", "Adapter" ]
-		column = []
-		for col in range(len(self.column_header)):
+		self.column_header = [ "Index", "URL", "Protocol", "Adapter", "Hits" ]
+		self.category_colid = self.hidden_data_prepend + len(self.column_header)	# hidden bitmask after visible columns
+		column = []
+		for col in range(len(self.column_header)):
 			colid = col + self.hidden_data_prepend		# skip hidden items at beginning in id counting
 			colpreset = gtk.TreeViewColumn(self.column_header[col], self.renderer1, text=colid, foreground=1, foreground_set=2)
 			colpreset.set_resizable(True)			# enable column width resizing
-			colpreset.set_reorderable(True)			# enable column re-ordering
+			colpreset.set_reorderable(True)			# enable column re-ordering
 			colpreset.set_sort_column_id(colid)		# enable column sorting (sets also 'set_headers_clickable' and others)
 			column.append( colpreset )			# set defined column
 		if ext_sup:								# set additional column depending
@@ -586,10 +903,11 @@ class MainWindowGTK:
 			colpreset.set_sort_column_id(colid)				#
 			column.append( colpreset )					#
 		for col in column:					# append setted columns
-			self.treeview1.append_column(col)		#
+			self.treeview1.append_column(col)		#
 		# final treeview adjustments
 		self.search_colid = self.hidden_data_prepend + 1	# enable searching in 'URL' column (+1 since 2nd visible)
 		self.treeview1.set_search_column(self.search_colid)	#
+		self.treeview1.set_search_equal_func(self.__search_equal)	# (by index instead of comparing each row)
 		#self.treeview1.enable_model_drag_dest([('text/plain', 0, 0)], gtk.gdk.ACTION_DEFAULT | gtk.gdk.ACTION_MOVE)
 		self.treeview1.set_reorderable(True)			# enable row re-ordering
 		# size offset calculation
@@ -597,20 +915,103 @@ class MainWindowGTK:
 		height = self.window1.get_property('height-request') - self.scrolledwindow1.get_property('height-request')
 		self.size_offset = (width, height)
 
+	def __export_progress(self):
+		""" Show progress of running export in statusbar. """
+		if self.exporter.is_alive():
+			if (self.exporter.progress() < 1.):
+				self.statusbar1.push(0, "Saving list... %i%%" % (100*self.exporter.progress()))
+			return
+		if self.exporter.error:	self.statusbar1.push(0, "List not saved: %s" % self.exporter.error)
+		else:			self.statusbar1.push(0, "List saved (%i rows)." % self.exporter.written)
+		self.exporter = None
+
+	def __treeview_filter_init(self):
+		""" (Re-)create filtered model element. """
+		self.modelfilter1 = self.model1.filter_new()
+		self.modelfilter1.set_visible_func(self.__url_filter, data=None)
+
+	def __rows_init(self):
+		""" (Re-)create row store from options/settings, keeping the listed rows. """
+		try:	rows = SnoopLib.RowStore(int(self.settings["max_rows"]), self.settings["evict_policy"], self.settings["spill_file"] or None)
+		except ValueError:							# turn exception into warning
+			warnings.warn("Invalid list size option, using defaults.\n%s" % "\n".join(PyLib.tb_info()[2]))
+			rows = SnoopLib.RowStore()					#
+		if self.rows:
+			self.rows.close()
+			for (key, (row, hits, ref)) in self.rows.rows.items():
+				self.__rows_evict( rows.add(key, row, ref, hits) )
+		self.rows = rows
+
+	def __rows_evict(self, evicted):
+		""" Remove rows evicted from row store from list. """
+		for (key, row, hits, ref) in evicted:
+			if not ref.valid(): continue
+			iter = self.model1.get_iter(ref.get_path())
+			self.categories.remove( self.model1.get_value(iter, self.category_colid) )
+			self.search_index.remove(key)
+			self.model1.remove(iter)
+
+	def __treeview_detach(self):
+		""" Detach model from view and unsort it for bulk inserts; returns
+		    state for '__treeview_attach'. """
+		state = (self.treeview1.get_model() is self.modelfilter1, self.treeview1.get_cursor()[0], self.model1.get_sort_column_id())
+		self.treeview1.set_model(None)
+		self.modelfilter1 = None				# drop filter model (no filtering per inserted row)
+		self.model1.set_sort_column_id(-2, gtk.SORT_ASCENDING)	# GTK_TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID
+		return state
+
+	def __treeview_attach(self, state):
+		""" Sort model (once) and re-attach it to view after bulk inserts. """
+		(filtered, cursor, sort) = state
+		if (sort[0] is not None): self.model1.set_sort_column_id(*sort)
+		self.__treeview_filter_init()				# filter all rows at once
+		if filtered:	self.treeview1.set_model(self.modelfilter1)
+		else:		self.treeview1.set_model(self.model1)
+		self.treeview1.set_search_column(self.search_colid)	# re-enable searching in 'URL' column
+		if cursor: self.treeview1.set_cursor(cursor)
+
 	def __treeview_append(self, newbuffer):
 		""" Append row to treeview from extracted sniffer data buffer. """
-		new_iter = None
-		for data in newbuffer:
-			dev = self.dev_dict.get(data[1], self.dev_dict.get(data[2], "?"))	# try to get device/adapter
+		new_iter = None
+		try:	self.dedup.window = float(self.settings["dedup_window"]) or None	# (setting may have changed)
+		except ValueError: self.dedup.window = None
+		hits_colid = self.hidden_data_prepend + self.column_header.index("Hits")
+		self.search_cache = (None, ())						# (rows change)
+		exported = []								# (new rows for running export)
+		if self.store:								# record all (incl. duplicates)
+			self.store.add([ data[:4] + (self.__adapter(data),) for data in newbuffer ])
+		for data in newbuffer:
+			dev = self.__adapter(data)						# get device/adapter
 			url = data[0].replace('\\','')						# remove Backslashes from link/url (filter 1)
+			(dup, entry) = self.dedup.add(url + "\0" + dev)				# seen before (session-wide)?
+			ref = entry and entry[SnoopLib.DedupIndex.DATA]				# row of first occurrence
+			listed = (entry is None) or (ref and ref.valid())			# ... still listed (not evicted)?
+			if dup and ref and ref.valid():						# count hit there
+				row = self.model1[ref.get_path()]
+				row[hits_colid] = entry[SnoopLib.DedupIndex.HITS]
+				self.rows.hit(row[0][0], entry[SnoopLib.DedupIndex.HITS])
+			if self.settings["del_dups"] and dup and listed: continue		# if option set; skip adding of duplicates
 			urlinfo = urlparse.urlparse(url)					# get protocol
 			proto, port = urlinfo.scheme, urlinfo.port				# 
 			data = (self.capture_index, url, proto, dev)				# create enhanced data
 			self.capture_index += 1							# increase capture index
-			dup = (self.capture_last == data[1:])					# is this a duplicate of last entry?
-			self.capture_last = data[1:]						# store this entry for next duplicate check
-			if self.settings["del_dups"] and dup: continue				# if option set; skip adding of duplicates
-			new_iter = self.model1.append( (data,'#888888',dup,False,) + data[0:] )	# add data (hidden + columns) as new row
+			hits = 1
+			if not listed: hits = entry[SnoopLib.DedupIndex.HITS]			# (new first occurrence)
+			mask = self.categories.classify(url)					# classify once (for filter)
+			self.categories.add(mask)						#
+			new_iter = self.model1.append( (data,'#888888',dup,False,) + data[0:] + (hits, mask,) )	# add data (hidden + columns) as new row
+			ref = gtk.TreeRowReference(self.model1, self.model1.get_path(new_iter))
+			if not listed: entry[SnoopLib.DedupIndex.DATA] = ref
+			self.search_index.add(data[0], url)					# for substring search
+			self.__rows_evict( self.rows.add(data[0], data, ref, hits) )		# keep row cap
+			exported.append( data + (hits,) )
+		if self.exporter and exported: self.exporter.append(exported)		# (with 'export_follow' only)
+
+	def __adapter(self, data):
+		""" Return adapter of sniffer data: as tagged (by SnoopLib.CaptureMerger)
+		    or guessed from the IPs of the devices. """
+		if len(data) > 4: return data[4]
+		return self.dev_dict.get(data[1], self.dev_dict.get(data[2], "?"))	# try to get device/adapter
 
 	# thanks to http://www.pygtk.org/pygtk2tutorial/sec-CellRenderers.html
 	# and http://www.pygtk.org/pygtk2reference/
@@ -627,7 +1028,7 @@ class MainWindowGTK:
 							gobject.TYPE_LONG,		# id 3: column 2 spin
 				            		gobject.TYPE_STRING, 		# id 4: column 2 text
 				            		gobject.TYPE_BOOLEAN ) 		# id 5: column 2 check/toggle
-		self.window2.treeview2.set_model(self.window2.mdl)
+		self.window2.treeview2.set_model(self.window2.mdl)
 
 		# list store and adjustment for cell renderers
 		self.window2.m = gtk.ListStore(gobject.TYPE_STRING)
@@ -647,8 +1048,8 @@ class MainWindowGTK:
 		#self.window2.renderer2_1.set_properties(editable=True, model=self.window2.m, text_column=0)	#
 		self.window2.renderer2_1.set_property('editable',True)						#
 		self.window2.renderer2_1.set_property('model',self.window2.m)					#
-		self.window2.renderer2_1.set_property('text_column',0)						#
-		if not (os.name == 'nt'):	# not for PyGTK <= 2.14 (http://www.python-forum.de/viewtopic.php?p=138475&sid=594b72d32face545ac08801f9f10b3ba)
+		self.window2.renderer2_1.set_property('text_column',0)						#
+		if not (os.name == 'nt'):	# not for PyGTK <= 2.14 (http://www.python-forum.de/viewtopic.php?p=138475&sid=594b72d32face545ac08801f9f10b3ba)
 			self.window2.renderer2_1.connect('changed', self.on_columnvalue_modified, self.window2.mdl, ("combo",) )#
 		self.window2.renderer2_1.connect('edited',  self.on_columnvalue_modified, self.window2.mdl, ("combo",) )	#
 		self.window2.column1.pack_start(self.window2.renderer2_1, True)					#
@@ -679,58 +1080,89 @@ class MainWindowGTK:
 		self.window2.treeview2.append_column( self.window2.column0 )
 		self.window2.treeview2.append_column( self.window2.column1 )
 
+	def capture_filter(self):
+		""" Build BPF filter from the capture filter options/settings. """
+		return SnoopLib.build_filter(	SnoopLib.split_list(self.settings["bpf_protocols"]),
+						SnoopLib.split_list(self.settings["bpf_ports"]),
+						self.settings["bpf_payload"],
+						self.settings["bpf_extra"] )
+
 	# thanks to http://www.pygtk.org/pygtk2tutorial/sec-TreeModelSortAndTreeModelFilter.html#sec-TreeModelFilter
 	# and http://www.pygtk.org/pygtk2tutorial/examples/treemodelfilter.py
+	def search(self, text, limit=None):
+		""" Return Index of listed rows with URLs containing text (in
+		    capture order). """
+		return self.search_index.search(text, limit)
+
+	def search_path(self, text):
+		""" Return path (in shown model) of first row with URL containing
+		    text, or None. """
+		for key in self.search(text):
+			entry = self.rows.get(key)
+			if not (entry and entry[2].valid()): continue
+			path = entry[2].get_path()
+			if (self.treeview1.get_model() is self.modelfilter1):
+				path = self.modelfilter1.convert_child_path_to_path(path)	# (None if filtered)
+			if path: return path
+		return None
+
+	# thanks to http://www.pygtk.org/docs/pygtk/class-gtktreeview.html#method-gtktreeview--set-search-equal-func
+	def __search_equal(self, model, column, key, iter, data=None):
+		""" Interactive search: row matches if its URL contains key (note:
+		    returns False for matching rows). """
+		if (self.search_cache[0] != key):
+			self.search_cache = (key, set(self.search(key)))
+		return model.get_value(iter, self.hidden_data_prepend) not in self.search_cache[1]
+
 	def __url_filter(self, model, iter, user_data):
-		""" Filter URL (and whole tuple) for special string. """
-		pattern = dict_filter[self.combobox2.get_model()[self.combobox2.get_active()][0]]
-		return pattern in str(model.get_value(iter, 0))
+		""" Filter row by category bitmask (URL classified on insert). """
+		return bool(model.get_value(iter, self.category_colid) & self.filter_bit)
 
-	# thanks to: http://code.activestate.com/recipes/439094/
-	# thanks to: http://timgolden.me.uk/python/wmi/cookbook.html#examples
+	# thanks to: http://code.activestate.com/recipes/439094/
+	# thanks to: http://timgolden.me.uk/python/wmi/cookbook.html#examples
 	# and http://libdnet.sourceforge.net/pydoc/ (both for windows)
 	def getdevips(self, devs):
-		""" Resolve IPs assigned to given network devices and create translation dict. """
+		""" Resolve IPs assigned to given network devices and create translation dict. """
 		print "Try to detect network interface names and default adapter:"
-		result = {}
-		if   (os.name == 'posix') or (os.name == 'mac'):
-			default = 'any'
-			for dev in devs:
-				try:
-					s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-					ip = socket.inet_ntoa(fcntl.ioctl(
-						s.fileno(),
-						0x8915,  # SIOCGIFADDR
-						struct.pack('256s', dev[:15])
-					)[20:24])
-					print dev, ip
-					result[ip] = dev
-					if (default == 'any'): default = dev
-				except IOError:
-					pass
-		elif (os.name == 'nt') and ("wmi" in imported):
-			default = None
-			dev_names = {}
-			if ("dnet" in imported):
-				def store_cb(*data): dnet_devs.append( data )
-				dnet_devs = []
-				dnet.intf().loop(store_cb)
-				#dnet.intf().loop(dnet_devs.append)
-				for dev in dnet_devs:
-					if "addr" not in dev[0]: continue
-					dev_names[str(dev[0]["addr"]).rsplit("/")[0]] = dev[0]["name"]
-			for interface in wmi.WMI().Win32_NetworkAdapterConfiguration(IPEnabled=1):
-				#print interface
-				dev = "\\Device\\NPF_" + interface.SettingID
-				(ip, info) = interface.IPAddress
-				desc, mac = interface.Description, interface.MACAddress
-				print dev, ip, dev_names.get(ip, ''), "\n(", desc, ")"
-				result[ip] = dev
-				if not default: default = dev
-		else:	# 'nt' (WITHOUT wmi), 'os2', 'ce', 'java', 'riscos'
-			default = None
-			print "(none)"
-
+		result = {}
+		if   (os.name == 'posix') or (os.name == 'mac'):
+			default = 'any'
+			for dev in devs:
+				try:
+					s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+					ip = socket.inet_ntoa(fcntl.ioctl(
+						s.fileno(),
+						0x8915,  # SIOCGIFADDR
+						struct.pack('256s', dev[:15])
+					)[20:24])
+					print dev, ip
+					result[ip] = dev
+					if (default == 'any'): default = dev
+				except IOError:
+					pass
+		elif (os.name == 'nt') and ("wmi" in imported):
+			default = None
+			dev_names = {}
+			if ("dnet" in imported):
+				def store_cb(*data): dnet_devs.append( data )
+				dnet_devs = []
+				dnet.intf().loop(store_cb)
+				#dnet.intf().loop(dnet_devs.append)
+				for dev in dnet_devs:
+					if "addr" not in dev[0]: continue
+					dev_names[str(dev[0]["addr"]).rsplit("/")[0]] = dev[0]["name"]
+			for interface in wmi.WMI().Win32_NetworkAdapterConfiguration(IPEnabled=1):
+				#print interface
+				dev = "\\Device\\NPF_" + interface.SettingID
+				(ip, info) = interface.IPAddress
+				desc, mac = interface.Description, interface.MACAddress
+				print dev, ip, dev_names.get(ip, ''), "\n(", desc, ")"
+				result[ip] = dev
+				if not default: default = dev
+		else:	# 'nt' (WITHOUT wmi), 'os2', 'ce', 'java', 'riscos'
+			default = None
+			print "(none)"
+
 		return (result, default)
 
 
@@ -751,18 +1183,33 @@ def customwarn(message, category, filename, lineno, file=None, line=None):
 # Main
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- --- ---
 #
-if __name__ == '__main__':
-	# check permissions
-	try:
-		ifs = findalldevs()
-		# No interfaces available, abort.
-		if 0 == len(ifs):
-			raise pcapy.PcapError
-	except pcapy.PcapError:
-		print "You have not the permissions needed, you should be root/admin."
-		sys.exit(1)
-
-	# redirect warnings to log
+if __name__ == '__main__':
+	# command-line options
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("-r", "--replay", dest="replay", metavar="FILE",
+			  help="offer capture file FILE (.pcap/.pcapng) for replay instead of live capture")
+	parser.add_option("--realtime", dest="speed", action="store_const", const=1.0,
+			  help="replay at the original timestamps (default: as fast as possible)")
+	parser.add_option("--speed", dest="speed", type="float",
+			  help="replay at SPEED times the original pace")
+	parser.add_option("-f", "--filter", dest="filter", metavar="BPF",
+			  help="extra BPF filter (see tcpdump(3)), overrides the saved option/setting")
+	parser.add_option("--profile", dest="profile", type="choice", choices=PyLib.Profiler.modes, metavar="MODE",
+			  help="profile the captures (%s), report to the saved 'report file'" % ", ".join(PyLib.Profiler.modes))
+	(options, args) = parser.parse_args()
+
+	# check permissions (not needed for replay)
+	try:
+		ifs = findalldevs()
+		# No interfaces available, abort.
+		if 0 == len(ifs):
+			raise pcapy.PcapError
+	except pcapy.PcapError:
+		if not options.replay:
+			print "You have not the permissions needed, you should be root/admin."
+			sys.exit(1)
+
+	# redirect warnings to log
 	log = open(raw_path + ".log", 'w')
 	warnings.showwarning = customwarn
 	#warnings.simplefilter('error')		# debug/devel setting
@@ -783,9 +1230,10 @@ if __name__ == '__main__':
 		saved_settings = eval(data)
 	except:
 		saved_settings 	= {}
+	if options.filter is not None: saved_settings["bpf_extra"] = options.filter
 
 	# run main application
-	main = MainWindowGTK(saved_settings)
+	main = MainWindowGTK(saved_settings, options.replay, options.speed, options.profile)
 	main.run()
 
 	# store options/settings to config file
@@ -38,6 +38,11 @@
 #            - run "su -c 'python pyurlsnooper.py'" to execute the script with
 #              root permissions
 #            - to quit the script while it is running, press any key
+#            - run "python pyurlsnooper.py -r dump.pcap" to replay a saved capture
+#              file (no root permissions needed)
+#            - run "python pyurlsnooper.py -d -i eth0 -o /var/log/urls.log" to run
+#              without terminal (e.g. as service); quit with SIGTERM, reopen the
+#              output file (after log rotation) with SIGHUP
 #   windows: - open command-line as administrator (to execute the script with
 #              admin permissions)
 #            - run "python pyurlsnooper.py"
@@ -51,19 +56,21 @@
 
 
 import sys
+import time
+import signal
 import string
-from threading import Thread
+import optparse
+from threading import Thread, Event
 
 import pcapy
 from pcapy import findalldevs, open_live
 import impacket
-from impacket.ImpactDecoder import EthDecoder, LinuxSLLDecoder
 
-import re, PyLib
+import re, PyLib, SnoopLib
 
 
-# this regex should be improoved, because it already caused some problems (e.g. on southpark.de, ...)
-regex_links = re.compile("((https?|ftp|gopher|telnet|file|notes|ms-help|rtmp|rtmpe):((//)|(\\\\))[\w\d:#%/;$()~_?\-=\\\.&!]*)")
+# shared by both scripts (see SnoopLib.RegexExtractor)
+regex_links = SnoopLib.regex_links
 
 
 class DecoderThread(Thread):
@@ -71,43 +78,131 @@ class DecoderThread(Thread):
     Main decoder/network sniffer class (running in separate thread).
     """
 
-    def __init__(self, pcapObj):
-        """ Query the type of the link and instantiate a decoder accordingly. """
-        datalink = pcapObj.datalink()
-        if pcapy.DLT_EN10MB == datalink:
-            self.decoder = EthDecoder()
-        elif pcapy.DLT_LINUX_SLL == datalink:
-            self.decoder = LinuxSLLDecoder()
-        else:
-            raise Exception("Datalink type not supported: " % datalink)
+    packets = 0                                         # packets seen
+    bytes = 0                                           # bytes seen
+    tuner = None                                        # SnoopLib.CaptureTuner (live capture)
+    error = None                                        # SnoopLib.PcapError the capture stopped with
+
+    def __init__(self, pcapObj, clock=None, extractors=None, workers=0, buffer=None, profiler=None, offline=False,
+                 idle=0.05):
+        """ Query the type of the link and instantiate a decoder accordingly.
+            For replay of a capture file set offline, and give a
+            SnoopLib.ReplayClock to replay at the original pace. Give the
+            URL extractors to run (list, see
+            SnoopLib.create_extractors; default: regex only). With workers > 0
+            packets get decoded by a SnoopLib.DecodePool of that many
+            processes. Found URLs go to buffer (PyLib.RingBuffer, default
+            capacity if None). With a PyLib.Profiler the capture loop gets
+            profiled and the hot path stages timed; the report is written
+            when the loop returns. A quiet live capture is polled every
+            idle seconds. """
+        if profiler: self.processor = SnoopLib.ProfiledProcessor(pcapObj.datalink(), extractors)
+        else:        self.processor = SnoopLib.PacketProcessor(pcapObj.datalink(), extractors)
+        self.pool = None
+        self.profiler = profiler
+        self.buffer = buffer
+        if buffer is None: self.buffer = PyLib.RingBuffer()
 
         self.pcap = pcapObj
+        self.handler = self.packetHandler
+        if workers:
+            self.pool = SnoopLib.DecodePool(pcapObj.datalink(), self.processor.extractors, workers,
+                                            output=self.buffer.extend)
+            self.handler = self.submitHandler
+        if profiler: self.handler = self.profiledHandler
+        if clock: self.handler = clock.wrap(self.handler)
+        self.clock = clock
+        self.offline = offline
+        self.idle = idle
+        self.pending = None                             # capture to go on with (see 'swap')
+        self.stopped = Event()                          # quit thread?
+        self.wakeup = Event()                           # leave the current capture loop
         Thread.__init__(self)
+        self.setDaemon(True)
 
     def run(self):
-        """ Sniff ad infinitum.
-            PacketHandler shall be invoked by pcap for every packet. """
-        self.pcap.loop(0, self.packetHandler)
+        """ Sniff ad infinitum (or until the end of a capture file or 'stop').
+            PacketHandler shall be invoked by pcap for every packet, pcap
+            gets called for batches of packets (SnoopLib.dispatch_loop).
+            A capture error stops the thread, see 'error'. """
+        if self.pool: self.pool.start()
+        try:
+            if self.profiler: self.profiler.runcall(self.capture)
+            else:             self.capture()
+        except SnoopLib.PcapError, e:
+            self.error = e
+        if self.pool:
+            self.pool.close()				# wait for the workers to finish
+        else:
+            self.buffer.extend(self.processor.flush())	# URLs still held by stream reassembly
+        if self.profiler:
+            self.profiler.dump(self.processor.timers.report() + [""] + SnoopLib.describe_extractors(self.stats()))
+
+    def capture(self):
+        """ Dispatch packets of pcap (and of the captures swapped in)
+            until stopped or the end of the capture file. """
+        while not self.stopped.is_set():
+            SnoopLib.dispatch_loop(self.pcap, self.handler, self.wakeup, not self.offline, idle=self.idle)
+            if self.pending is None: break              # stopped or end of capture file
+            self.wakeup.clear()
+            (self.pcap, self.pending) = (self.pending, None)
+
+    def swap(self, pcapObj):
+        """ Go on capturing with pcapObj (same device and link type, e.g.
+            reopened by a SnoopLib.CaptureTuner) after the current batch. """
+        self.pending = pcapObj
+        self.wakeup.set()
+
+    def stop(self):
+        """ Let the thread return (after the current batch of packets;
+            within 'SnoopLib.dispatch_loop' idle time on a quiet link). """
+        self.stopped.set()
+        self.wakeup.set()
+        if self.clock: self.clock.stop()
+
+    def stats(self):
+        """ Return extractor stats (summed over the workers, if any). """
+        return (self.pool or self.processor).stats()
 
     def packetHandler(self, hdr, data):
-        """ Use the ImpactDecoder to turn the rawpacket into a hierarchy
-            of ImpactPacket instances.
-            Display the packet in human-readable form.
-            http://d.hatena.ne.jp/shoe16i/mobile?date=20090203&section=p1 """
-        decoded_data = self.decoder.decode(data)
-        tcp = decoded_data.child().child()
-        data = tcp.get_packet()
-        decoded_data = data
-        for item in regex_links.finditer(str(decoded_data)):
-            if not item: continue
-            pos = item.start()
-            print item.groups()[0], "\n"
-
-
-def getInterface():
+        """ Let the SnoopLib.PacketProcessor decode the rawpacket (payload
+            by fixed header offsets, or ImpactDecoder for unusual packets)
+            and search for URLs in packet (stream); buffer them. """
+        self.packets += 1
+        self.bytes += len(data)
+        found = self.processor.process(hdr, data)
+        if found: self.buffer.extend(found)
+
+    def submitHandler(self, hdr, data):
+        """ Hand the rawpacket to the SnoopLib.DecodePool (results get
+            buffered by the pool). """
+        self.packets += 1
+        self.bytes += len(data)
+        self.pool.submit(hdr, data)
+
+    def profiledHandler(self, hdr, data):
+        """ Like 'packetHandler' (or 'submitHandler'), timing the buffer
+            push (or hand-over to the pool) too. """
+        self.packets += 1
+        self.bytes += len(data)
+        timers = self.processor.timers
+        if self.pool:
+            t = time.time()
+            self.pool.submit(hdr, data)
+            timers.add("submit", time.time() - t)
+            return
+        found = self.processor.process(hdr, data)
+        if found:
+            t = time.time()
+            self.buffer.extend(found)
+            timers.add("buffer", time.time() - t)
+
+
+def getInterface(prompt=True):
     """  Grab a list of interfaces that pcap is able to listen on.
          The current user will be able to listen from all returned interfaces,
-         using open_live to open them. """
+         using open_live to open them. Without prompt (no terminal) choosing
+         among several interfaces is an error. """
     ifs = findalldevs()
 
     # No interfaces available, abort.
@@ -120,6 +215,10 @@ def getInterface():
         print 'Only one interface present, defaulting to it.'
         return ifs[0]
 
+    if not prompt:
+        print >> sys.stderr, "Several interfaces present (%s), select one with --interface." % ", ".join(ifs)
+        sys.exit(1)
+
     # Ask the user to choose an interface from the list.
     count = 0
     for iface in ifs:
@@ -129,31 +228,351 @@ def getInterface():
 
     return ifs[idx]
 
-def main(filter):
-    dev = getInterface()
+def message(output, text):
+    """ Write time stamped message line (prefixed by '# ') to output; to
+        stderr if output is stdout only ('-o -'), so the URL stream stays clean. """
+    line = "# %s %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), text)
+    if not output.names and (output.streams == [sys.stdout]): sys.stderr.write(line)
+    else:                                                     output.write(line)
+
+def parse_time(text):
+    """ Parse time given as 'YYYY-MM-DD[ HH:MM[:SS]]' (local time) or seconds
+        since epoch; None passes. """
+    if text is None: return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, format))
+        except ValueError:
+            pass
+    raise ValueError("invalid time '%s'" % text)
+
+def main(filter, filename=None, clock=None, extractors=None, workers=0, buffer=None, dev=None, prompt=True, output=None,
+         profiler=None, holdback=0.5, capture=None, tune=False):
+    """ Capture on interface dev, on several (comma separated list; one
+        DecoderThread each, merged by a SnoopLib.CaptureMerger into buffer)
+        or replay capture file filename. extractors is a callable returning
+        the URL extractors of one sniffer (default: regex only); profiler
+        profiles the first sniffer. Live captures get the capture profile
+        settings (see SnoopLib.capture_profile; default if None), and with
+        tune a SnoopLib.CaptureTuner each. Returns (sniffer or merger, dev);
+        ValueError if the BPF filter does not work on a capture. """
+    if filename:
+        devs = [ filename ]
+    else:
+        devs = SnoopLib.split_list(dev or "") or [ getInterface(prompt) ]
+    if buffer is None: buffer = PyLib.RingBuffer()
+    if capture is None: capture = SnoopLib.capture_profile("default")
+
+    sniffers = []
+    for dev in devs:
+        # Open interface for catpuring (or capture file for replay).
+        p = SnoopLib.open_capture(dev, filename, capture)
+
+        # Set the BPF filter (adapted to the link type). See tcpdump(3).
+        try:
+            p.setfilter(SnoopLib.link_filter(filter, p.datalink()))
+        except SnoopLib.PcapError, e:
+            raise ValueError("cannot set BPF filter on %s: %s" % (dev, e))
+
+        info = "Listening on %s: net=%s, mask=%s, linktype=%d" % (dev, p.getnet(), p.getmask(), p.datalink())
+        if output: message(output, info)
+        else:      print info
+
+        own = buffer
+        if len(devs) > 1: own = PyLib.RingBuffer(buffer.capacity, buffer.policy, buffer.timeout)
+        sniffers.append( DecoderThread(p, clock, extractors and extractors(), workers, own, profiler, bool(filename),
+                                       capture["timeout"] / 1000.) )
+        if tune and not filename: sniffers[-1].tuner = SnoopLib.CaptureTuner(dev, filter, capture)
+        profiler = None
+
+    # Start sniffing thread(s) and finish main thread.
+    for sniffer in sniffers: sniffer.start()
+    if len(sniffers) == 1: return (sniffers[0], devs[0])
+    merger = SnoopLib.CaptureMerger(sniffers, devs, buffer, holdback)
+    merger.start()
+    return (merger, ",".join(devs))
+
+def serve(sniffer, output, store=None, adapter="", stats_interval=0, prompt=True, metrics=None, feed=None):
+    """ Write the URLs found by sniffer to output (PyLib.AsyncWriter, and
+        store) until the
+        sniffer finishes, a key is pressed (with prompt) or SIGTERM/SIGINT
+        is received; SIGHUP reopens the output file. A stats line is
+        written every stats_interval seconds (0: never). The delay of the
+        URLs gets reported to metrics (SnoopLib.CaptureMetrics), if any;
+        the URLs get published by feed (SnoopLib.FeedServer), if any. """
+    state = {"stop": False, "reopen": False, "store_error": None}
+    def on_stop(signum, frame): state["stop"] = True
+    def on_hangup(signum, frame): state["reopen"] = True
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    if hasattr(signal, "SIGHUP"): signal.signal(signal.SIGHUP, on_hangup)
+    if prompt:
+        def wait_key():
+            raw_input("Press any key to quit...\n")	# wait until key pressed...
+            state["stop"] = True
+        key = Thread(target=wait_key)
+        key.setDaemon(True)
+        key.start()
+
+    found = 0
+    last = (time.time(), 0, 0)
+    while sniffer.isAlive() and not state["stop"]:
+        items = sniffer.buffer.drain(timeout=0.5)
+        if items:
+            found += len(items)
+            if metrics: metrics.observe_output(items)
+            output.write("".join([ item[0] + "\n" for item in items ]))
+            if store: store.add(tagged(items, adapter))
+            if feed: feed.publish_urls(items, adapter)
+        if state["reopen"]:
+            state["reopen"] = False
+            output.reopen()
+            message(output, "output reopened")
+        if store and store.error and not state["store_error"]:
+            state["store_error"] = store.error                  # (once, when it happens)
+            message(output, "Error recording URLs, recording stopped: %s" % store.error)
+        for source in sources(sniffer):
+            info = source.tuner and source.tuner.check(source)
+            if info: message(output, "%s: %s" % (source.tuner.dev, info))
+        now = time.time()
+        if stats_interval and (now - last[0] >= stats_interval):
+            message(output, stats_line(sniffer, output, found, store, now - last[0], sniffer.packets - last[1], found - last[2]))
+            last = (now, sniffer.packets, found)
+
+    sniffer.stop()
+    sniffer.join(5.)                                    # (returns after the current batch)
+    items = sniffer.buffer.drain()
+    if items:
+        found += len(items)
+        output.write("".join([ item[0] + "\n" for item in items ]))
+        if store: store.add(tagged(items, adapter))
+        if feed: feed.publish_urls(items, adapter)
+    return found
+
+def tagged(items, adapter):
+    """ Return URLs (link, src, dst, ts[, adapter]) tagged with adapter,
+        unless tagged already (by SnoopLib.CaptureMerger). """
+    return [ item if len(item) > 4 else item + (adapter,) for item in items ]
+
+def sources(sniffer):
+    """ Return the DecoderThreads of sniffer (or SnoopLib.CaptureMerger). """
+    if isinstance(sniffer, SnoopLib.CaptureMerger): return sniffer.sniffers
+    return [ sniffer ]
 
-    # Open interface for catpuring.
-    p = open_live(dev, 1500, 0, 100)
+def buffers(sniffer):
+    """ Return the URL buffers of sniffer (merged output and per interface). """
+    return set([ sniffer.buffer ] + [ source.buffer for source in sources(sniffer) ])
 
-    # Set the BPF filter. See tcpdump(3).
-    p.setfilter(filter)
+def stats_line(sniffer, output, found, store, elapsed, packets, urls):
+    """ Format periodic stats: totals and rates since last line. """
+    info = "stats: %i packets (%.1f/s), %i URLs (%.1f/s), %i buffered, %i dropped" % \
+           (sniffer.packets, packets / elapsed, found, urls / elapsed, sum(map(len, buffers(sniffer))),
+            sum([ buf.dropped for buf in buffers(sniffer) ]))
+    (queued, lag) = output.lag()
+    info += "; output: %i queued, %.1f s behind, %i dropped" % (queued, lag, output.dropped)
+    pools = [ source.pool for source in sources(sniffer) if source.pool ]
+    if pools: info += ", %i frames dropped (workers busy), %i truncated" % (sum([ pool.dropped for pool in pools ]),
+                                                                          sum([ pool.truncated for pool in pools ]))
+    if isinstance(sniffer, SnoopLib.CaptureMerger): info += ", %i held back for merging" % sniffer.held
+    kernel = [ stats[:3] for stats in [ SnoopLib.pcap_stats(source.pcap) for source in sources(sniffer) ] if stats ]
+    if kernel: info += "; kernel: %i received, %i dropped, %i dropped by interface" % tuple(map(sum, zip(*kernel)))
+    if store: info += ", %i recorded, %i not recorded" % (store.written, store.dropped)
+    if store and store.error: info += " (recording failed: %s)" % store.error
+    return info
 
-    print "Listening on %s: net=%s, mask=%s, linktype=%d" % (dev, p.getnet(), p.getmask(), p.datalink())
 
-    # Start sniffing thread and finish main thread.
-    DecoderThread(p).start()
 
+if __name__ == '__main__':
+    # Process command-line arguments. Take everything else as an extra BPF
+    # filter to pass onto pcap (combined with the protocol/port selection).
+    # Default to TCP segments with payload.
+    parser = optparse.OptionParser(usage="%prog [options] [BPF filter]")
+    parser.add_option("-i", "--interface", dest="interface", metavar="IF",
+                      help="capture on interface IF (default: ask, if there are several), or on a list of "
+                           "interfaces, e.g. 'eth0,eth1' (URLs merged in timestamp order)")
+    parser.add_option("--holdback", dest="holdback", type="float", default=0.5, metavar="SEC",
+                      help="hold URLs back up to SEC seconds for merging several interfaces in timestamp "
+                           "order [%default]")
+    parser.add_option("--capture-profile", dest="capture_profile", type="choice",
+                      choices=list(SnoopLib.capture_profiles), default="default", metavar="NAME",
+                      help="pcap settings of live captures: %s [%%default]" % ", ".join(SnoopLib.capture_profiles))
+    parser.add_option("--snaplen", dest="snaplen", type="int", metavar="BYTES",
+                      help="capture up to BYTES of each packet (default: by capture profile)")
+    parser.add_option("--buffer-size", dest="buffer_size", type="int", metavar="BYTES",
+                      help="kernel capture buffer size (default: by capture profile)")
+    parser.add_option("--promisc", dest="promisc", action="store_true",
+                      help="capture in promiscuous mode")
+    parser.add_option("--auto-tune", dest="auto_tune", action="store_true", default=False,
+                      help="on kernel drops reopen the capture with a larger buffer, then a smaller snaplen")
+    parser.add_option("-o", "--output", dest="output", default="urlsnooper", metavar="FILE",
+                      help="append found URLs and messages to FILE, '-' for stdout [%default]")
+    parser.add_option("-d", "--daemon", dest="daemon", action="store_true", default=False,
+                      help="run without terminal: no prompt and console echo, quit on SIGTERM/SIGINT, "
+                           "reopen output on SIGHUP")
+    parser.add_option("--stats", dest="stats", type="float", default=0., metavar="SEC",
+                      help="write a stats line every SEC seconds (0: never) [%default]")
+    parser.add_option("--metrics", dest="metrics", metavar="ADDR",
+                      help="serve live metrics (Prometheus text format) over HTTP at ADDR: '[host:]port' "
+                           "(default host: localhost) or path of a Unix socket")
+    parser.add_option("--feed", dest="feed", metavar="ADDR",
+                      help="publish found URLs as JSON lines to subscribers connecting to ADDR: '[host:]port' "
+                           "(default host: localhost) or path of a Unix socket")
+    parser.add_option("--profile", dest="profile", type="choice", choices=PyLib.Profiler.modes, metavar="MODE",
+                      help="profile the capture thread: %s (every call, slow) or %s (low overhead); "
+                           "also times the stages of the hot path" % PyLib.Profiler.modes)
+    parser.add_option("--profile-file", dest="profile_file", default="urlsnooper-profile.txt", metavar="FILE",
+                      help="write the profile report to FILE at the end of capture [%default]")
+    parser.add_option("-r", "--replay", dest="replay", metavar="FILE",
+                      help="replay capture file FILE (.pcap/.pcapng) instead of live capture")
+    parser.add_option("--realtime", dest="speed", action="store_const", const=1.0,
+                      help="replay at the original timestamps (default: as fast as possible)")
+    parser.add_option("--speed", dest="speed", type="float",
+                      help="replay at SPEED times the original pace")
+    parser.add_option("-p", "--protocols", dest="protocols", default="", metavar="LIST",
+                      help="capture well known ports of LIST only, e.g. 'http,rtsp,rtmp' (known: %s)" % ", ".join(sorted(SnoopLib.protocol_ports)))
+    parser.add_option("--ports", dest="ports", default="", metavar="LIST",
+                      help="capture additional TCP ports in LIST, e.g. '81,8081'")
+    parser.add_option("-a", "--all-packets", dest="payload_only", action="store_false", default=True,
+                      help="capture all packets (default: TCP segments with payload only)")
+    parser.add_option("--no-reassembly", dest="reassembly", action="store_false", default=True,
+                      help="scan each packet on its own (default: find URLs split across TCP segments)")
+    parser.add_option("-x", "--extractors", dest="extractors", default="", metavar="LIST",
+                      help="run URL extractors of LIST only, optionally with their ports, e.g. 'http:80:8080,regex' "
+                           "(known, with the URL schemes they find: %s; default: all); without ports an extractor "
+                           "runs on the payloads naming its schemes, e.g. 'http:'" % ", ".join(SnoopLib.list_extractors()))
+    parser.add_option("--no-http", dest="http", action="store_false", default=True,
+                      help="do not rebuild URLs of HTTP/RTSP requests (from request line and Host header) "
+                           "and scan binary response bodies too (same as leaving 'http' out of --extractors)")
+    parser.add_option("--flow-bytes", dest="flow_bytes", type="int", default=4096, metavar="N",
+                      help="longest URL held per TCP flow in bytes [%default]")
+    parser.add_option("--total-bytes", dest="total_bytes", type="int", default=4*1024*1024, metavar="N",
+                      help="bytes held by all TCP flows [%default]")
+    parser.add_option("--flow-timeout", dest="flow_timeout", type="float", default=30., metavar="SEC",
+                      help="evict TCP flows idle for SEC seconds [%default]")
+    parser.add_option("-w", "--workers", dest="workers", type="int", default=0, metavar="N",
+                      help="decode packets in N worker processes (0: in the capture thread) [%default]")
+    parser.add_option("--buffer", dest="buffer", type="int", default=100000, metavar="N",
+                      help="buffer up to N URLs between capture and output [%default]")
+    parser.add_option("--buffer-policy", dest="buffer_policy", type="choice", choices=PyLib.RingBuffer.policies,
+                      default=PyLib.RingBuffer.DROP_OLDEST, metavar="POLICY",
+                      help="when the buffer is full: %s [%%default]" % ", ".join(PyLib.RingBuffer.policies))
+    group = optparse.OptionGroup(parser, "Capture store",
+                                 "Record URLs in a SQLite database FILE (with --store). With any of the query "
+                                 "options given, print the matching URLs recorded in FILE instead of capturing.")
+    group.add_option("--store", dest="store", metavar="FILE",
+                     help="record URLs (scheme, host, src/dst, adapter, first/last time, hits) in FILE")
+    group.add_option("--search", dest="search", metavar="TEXT",
+                     help="query: URLs containing TEXT")
+    group.add_option("--host", dest="host", help="query: URLs of HOST (or its subdomains)")
+    group.add_option("--scheme", dest="scheme", help="query: URLs with SCHEME, e.g. 'rtmp'")
+    group.add_option("--since", dest="since", metavar="TIME",
+                     help="query: URLs seen since TIME ('YYYY-MM-DD[ HH:MM[:SS]]' or seconds since epoch)")
+    group.add_option("--until", dest="until", metavar="TIME",
+                     help="query: URLs seen until TIME")
+    parser.add_option_group(group)
+    (options, args) = parser.parse_args()
+    if options.search or options.host or options.scheme or options.since or options.until:
+        if not options.store: parser.error("query options need --store FILE")
+        try:
+            since, until = parse_time(options.since), parse_time(options.until)
+        except ValueError, e:
+            parser.error(str(e))
+        for row in SnoopLib.query_store(options.store, since, until, options.host, options.scheme, options.search):
+            print "%s\t%s\t%i\t%s\t%s -> %s\t%s" % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["first_ts"])),
+                                                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["last_ts"])),
+                                                row["hits"], row["url"], row["src"], row["dst"], row["adapter"])
+        sys.exit()
+    try:
+        filter = SnoopLib.build_filter(SnoopLib.split_list(options.protocols), SnoopLib.split_list(options.ports),
+                                       options.payload_only, ' '.join(args))
+    except ValueError, e:
+        parser.error(str(e))
+    clock = None
+    if options.speed: clock = SnoopLib.ReplayClock(options.speed)
+    try:
+        (names, ports) = SnoopLib.parse_extractors(options.extractors)
+        if not options.http: names = [ name for name in (names or SnoopLib.extractors) if name != "http" ]
+        SnoopLib.create_extractors(names, None, ports)                  # (check names)
+    except ValueError, e:
+        parser.error(str(e))
+    def extractors():
+        """ URL extractors for one sniffer (own stream reassembly). """
+        reasm = None
+        if options.reassembly:
+            reasm = SnoopLib.StreamReassembler(regex_links, options.flow_bytes, options.total_bytes,
+                                               timeout=options.flow_timeout)
+        return SnoopLib.create_extractors(names, reasm, ports)
 
+    try:
+        buffer = PyLib.RingBuffer(options.buffer, options.buffer_policy, timeout=1.)
+    except ValueError, e:
+        parser.error(str(e))
+    tty = sys.stdin.isatty() and not options.daemon
+    if options.output == '-': streams = [sys.stdout]
+    elif options.daemon:      streams = [options.output]
+    else:                     streams = [options.output, sys.stdout]      # (echo on console)
+    output = PyLib.AsyncWriter(streams)
+    output.start()
 
-#logfile = open('urlsnooper','w')
-logfile = open('urlsnooper','a')
-sys.stdout = PyLib.RedirStream(logfile)#, stdstream=False)
-sys.stderr = PyLib.RedirStream(logfile)#, stdstream=False)
+    store = None
+    if options.store:
+        store = SnoopLib.CaptureStore(options.store)
+        store.start()
 
-main('')
-raw_input("Press any key to quit...\n")		# wait until key pressed...
+    profiler = None
+    if options.profile: profiler = PyLib.Profiler(options.profile, options.profile_file)
+    capture = SnoopLib.capture_profile(options.capture_profile, snaplen=options.snaplen,
+                                       buffer_size=options.buffer_size, promisc=options.promisc)
+    try:
+        (sniffer, dev) = main(filter, options.replay, clock, extractors, options.workers, buffer,
+                              options.interface, tty, output, profiler, options.holdback, capture, options.auto_tune)
+    except ValueError, e:
+        parser.error(str(e))
+    metrics = server = None
+    if options.metrics:
+        metrics = SnoopLib.CaptureMetrics(sniffer, dev, live=not options.replay, store=store)
+        try:
+            server = SnoopLib.MetricsServer(metrics, options.metrics)
+        except (SnoopLib.socket.error, ValueError), e:
+            sniffer.stop()
+            parser.error("cannot serve metrics at '%s': %s" % (options.metrics, e))
+        server.start()
+        message(output, "serving metrics at %s" % options.metrics)
+    feed = None
+    if options.feed:
+        try:
+            feed = SnoopLib.FeedServer(options.feed)
+        except (SnoopLib.socket.error, ValueError), e:
+            sniffer.stop()
+            parser.error("cannot publish feed at '%s': %s" % (options.feed, e))
+        feed.start()
+        message(output, "publishing URLs at %s" % options.feed)
+    found = serve(sniffer, output, store, dev, options.stats, prompt=tty and not options.replay, metrics=metrics,
+                  feed=feed)
+    if server: server.close()
+    if feed:
+        feed.close()
+        if feed.dropped: message(output, "feed lines dropped (subscribers too slow): %i" % feed.dropped)
+    for line in SnoopLib.describe_extractors(sniffer.stats()):
+        message(output, "extractor %s" % line)
+    message(output, "URLs found: %i, dropped: %i" % (found, sum([ buf.dropped for buf in buffers(sniffer) ])))
+    errors = [ source for source in sources(sniffer) if source.error ]
+    for source in errors:
+        message(output, "capture error%s: %s" % (source.tuner and " on %s" % source.tuner.dev or "", source.error))
+    if profiler:
+        if sniffer.isAlive(): message(output, "profile not written (capture thread still busy)")
+        else:                 message(output, "profile written to %s" % options.profile_file)
+    if store:
+        store.close()
+        message(output, "URLs recorded in %s: %i, not recorded: %i" % (options.store, store.written, store.dropped))
+        if store.error: message(output, "Error recording URLs: %s" % store.error)
 
-del sys.stdout, sys.stderr
-logfile.close()
-sys.exit()
+    output.close()
+    if output.dropped: print >> sys.stderr, "Output lines dropped (writer too slow): %i" % output.dropped
+    if output.error: print >> sys.stderr, "Error writing output: %s" % output.error
+    sys.exit(errors and 1 or None)
 
@@ -0,0 +1,43 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Synthetic frames for the unit tests (Ethernet or Linux SLL, optionally
+# VLAN tagged, IPv4 or IPv6, TCP or UDP).
+
+import struct, socket
+
+DLT_EN10MB	= 1		# same values as pcapy.DLT_EN10MB and pcapy.DLT_LINUX_SLL
+DLT_LINUX_SLL	= 113
+
+SRC, DST	= "10.0.0.1", "192.168.0.2"
+SRC6, DST6	= "2001:db8::1", "2001:db8::2"
+
+def tcp_header(sport=1234, dport=80, seq=1, flags=0x18, options=""):
+	""" TCP header (data offset includes options, padded to 4 bytes). """
+	options += "\x00" * (-len(options) % 4)
+	return struct.pack("!HHLLBBHHH", sport, dport, seq, 0, (5 + len(options)//4) << 4, flags, 65535, 0, 0) + options
+
+def udp_header(sport=1234, dport=53, payload=""):
+	return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0)
+
+def frame(payload="", proto=6, datalink=DLT_EN10MB, vlans=(), ipv6=False, frag=0x4000, padding="",
+	  src=None, dst=None, **kwargs):
+	""" Wrap payload into TCP (proto 6) or UDP (17), IPv4/IPv6 and link
+	    layer headers; kwargs go to 'tcp_header'/'udp_header'. """
+	if proto == 6:	transport = tcp_header(**kwargs)
+	else:		transport = udp_header(payload=payload, **kwargs)
+	if ipv6:
+		ip = struct.pack("!LHBB16s16s", 6 << 28, len(transport) + len(payload), proto, 64,
+				 socket.inet_pton(socket.AF_INET6, src or SRC6), socket.inet_pton(socket.AF_INET6, dst or DST6))
+		ethertype = 0x86dd
+	else:
+		ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(transport) + len(payload), 1, frag, 64, proto, 0,
+				 socket.inet_aton(src or SRC), socket.inet_aton(dst or DST))
+		ethertype = 0x0800
+	tags = "".join([ struct.pack("!HH", tpid, vid) for (tpid, vid) in vlans ])
+	if datalink == DLT_LINUX_SLL:
+		link = struct.pack("!HHH8s", 0, 1, 6, "\x00\x11\x22\x33\x44\x55\x00\x00") + tags + struct.pack("!H", ethertype)
+	else:
+		link = "\x00\x11\x22\x33\x44\x55" + "\x66\x77\x88\x99\xaa\xbb" + tags + struct.pack("!H", ethertype)
+	return link + ip + transport + payload + padding
@@ -0,0 +1,97 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Unit tests of the multi-process decoding ('SnoopLib.SharedRing' and
+# 'SnoopLib.DecodePool').
+#
+# Run from the top directory: "python -m unittest discover tests"
+
+import unittest
+import SnoopLib
+from frames import frame, DLT_EN10MB
+
+class SharedRingTest(unittest.TestCase):
+
+	def test_put_get(self):
+		ring = SnoopLib.SharedRing(slots=4, size=64)
+		self.assertEqual(ring.get(block=False), None)
+		self.assertTrue(ring.put(7, 1.5, "abc"))
+		self.assertEqual(ring.get(), (7, 1.5, "abc"))
+		self.assertEqual(ring.get(block=False), None)
+
+	def test_slots_full(self):
+		ring = SnoopLib.SharedRing(slots=2, size=64)
+		self.assertTrue(ring.put(0, 0., "a"))
+		self.assertTrue(ring.put(1, 0., "b"))
+		self.assertTrue(ring.full())
+		self.assertFalse(ring.put(2, 0., "c"))
+		self.assertEqual(ring.get()[2], "a")
+		self.assertTrue(ring.put(2, 0., "c"))
+
+	def test_wrap_boundary(self):
+		ring = SnoopLib.SharedRing(slots=8, size=64, frame_size=32)
+		frames = [ chr(ord("a") + i) * 20 for i in range(6) ]
+		for (seq, data) in enumerate(frames[:3]): self.assertTrue(ring.put(seq, 0., data))	# 0..60
+		self.assertFalse(ring.put(3, 0., frames[3]))		# (would wrap: starts at 64, data not freed)
+		self.assertEqual(ring.get(), (0, 0., frames[0]))
+		self.assertEqual(ring.freed.value, 20)
+		self.assertTrue(ring.put(3, 0., frames[3]))		# 64..84 (i.e. 0..20)
+		self.assertFalse(ring.put(4, 0., frames[4]))
+		for seq in (1, 2):
+			self.assertEqual(ring.get(), (seq, 0., frames[seq]))
+		self.assertEqual(ring.freed.value, 60)
+		self.assertTrue(ring.put(4, 0., frames[4]))		# 84..104
+		self.assertTrue(ring.put(5, 0., frames[5]))		# 104..124
+		for seq in (3, 4, 5):
+			self.assertEqual(ring.get(), (seq, 0., frames[seq]))
+		self.assertEqual(ring.freed.value, 124)
+		self.assertEqual(ring.get(block=False), None)
+
+	def test_truncated(self):
+		ring = SnoopLib.SharedRing(slots=4, size=64, frame_size=100)
+		self.assertEqual(ring.frame_size, 32)			# (half the data area at most)
+		self.assertTrue(ring.put(0, 0., "x" * 40))
+		self.assertEqual(ring.get()[2], "x" * 32)
+		self.assertEqual(ring.truncated, 1)
+
+	def test_stop(self):
+		ring = SnoopLib.SharedRing(slots=4, size=64)
+		ring.put(0, 0., "a")
+		ring.stop()
+		self.assertEqual(ring.get()[2], "a")
+		self.assertTrue(ring.get() is ring.STOP)
+
+class DecodePoolTest(unittest.TestCase):
+
+	def run_pool(self, frames, extractors, workers=3):
+		found = []
+		pool = SnoopLib.DecodePool(DLT_EN10MB, extractors, workers, output=found.extend, slots=16, ring_size=4096)
+		pool.start()
+		try:
+			for (i, data) in enumerate(frames):
+				while not pool.submit(SnoopLib.PcapHeader(float(i)), data): pass	# (ring full: retry)
+		finally:
+			pool.close()
+		return (pool, found)
+
+	def test_capture_order(self):
+		frames = [ frame("see http://example.com/%i.ts here" % i, sport=1000 + i) for i in range(200) ]
+		(pool, found) = self.run_pool(frames, [ SnoopLib.RegexExtractor() ])
+		self.assertEqual([ item[0] for item in found ], [ "http://example.com/%i.ts" % i for i in range(200) ])
+		self.assertEqual([ item[3] for item in found ], [ float(i) for i in range(200) ])
+		self.assertEqual(pool.stats()["regex"]["hits"], 200)
+
+	def test_flows_stay_on_one_worker(self):
+		frames = []
+		for i in range(20):						# URLs split across two segments per flow
+			first = "GET x http://example.com/flow%i/" % i
+			frames.append( frame(first, sport=2000 + i, seq=1) )
+			frames.append( frame("b.ts done", sport=2000 + i, seq=1 + len(first)) )
+		reasm = SnoopLib.StreamReassembler(SnoopLib.regex_links)
+		(pool, found) = self.run_pool(frames, [ SnoopLib.RegexExtractor(reasm) ])
+		self.assertEqual([ item[0] for item in found ], [ "http://example.com/flow%i/b.ts" % i for i in range(20) ])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Unit tests of the background export of the URL list ('SnoopLib.ExportThread').
+#
+# Run from the top directory: "python -m unittest discover tests"
+
+import unittest, os, shutil, tempfile, gzip, json
+import SnoopLib
+
+FIELDS = ("index", "url", "hits")
+ROWS = [ (i, "http://example.com/%i.ts" % i, i % 3 + 1) for i in range(2500) ]
+
+class ExportTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def export(self, name, rows=ROWS, **kwargs):
+		filename = os.path.join(self.dir, name)
+		export = SnoopLib.ExportThread(filename, FIELDS, rows, **kwargs)
+		export.start()
+		return (export, filename)
+
+	def test_format_by_extension(self):
+		for (name, format) in (("a.csv", "csv"), ("a.txt", "csv"), ("a.jsonl", "jsonl"), ("a.ndjson.gz", "jsonl"),
+				       ("a.csv.zst", "csv")):
+			self.assertEqual(SnoopLib.export_format(name), format)
+		self.assertRaises(ValueError, SnoopLib.ExportThread, os.path.join(self.dir, "a"), FIELDS, format="xml")
+		self.assertRaises(ValueError, SnoopLib.export_open, os.path.join(self.dir, "a"), "lzma")
+
+	def test_csv_snapshot(self):
+		(export, filename) = self.export("urls.csv")
+		export.stop()
+		self.assertEqual((export.error, export.written, export.progress()), (None, 2500, 1.))
+		lines = open(filename).read().splitlines()
+		self.assertEqual(lines[:2], [ "index,url,hits", "0,http://example.com/0.ts,1" ])
+		self.assertEqual(len(lines), 2501)
+		(export, filename) = self.export("urls.csv", ROWS[:1])		# appended, no second header
+		export.stop()
+		self.assertEqual(open(filename).read().splitlines()[-2:], [ lines[-1], lines[1] ])
+
+	def test_jsonl_gzip_follow(self):
+		(export, filename) = self.export("urls.jsonl.gz", ROWS[:2], follow=True)
+		export.append( [ (2, "http://example.com/\xff.ts", 1) ] )	# (not UTF-8, from a packet)
+		export.stop()
+		self.assertEqual(export.error, None)
+		rows = [ json.loads(line) for line in gzip.open(filename).read().splitlines() ]
+		self.assertEqual(rows[0], { "index": 0, "url": "http://example.com/0.ts", "hits": 1 })
+		self.assertEqual([ row["index"] for row in rows ], [ 0, 1, 2 ])
+		self.assertEqual(rows[2]["url"], u"http://example.com/\ufffd.ts")
+
+	def test_select(self):
+		(export, filename) = self.export("urls.csv", select=lambda row: row[2] == 1)
+		export.stop()
+		self.assertEqual(len(open(filename).read().splitlines()), 1 + 834)
+
+	@unittest.skipIf(not SnoopLib.zstandard, "needs the 'zstandard' module")
+	def test_zstd(self):
+		(export, filename) = self.export("urls.csv.zst")
+		export.stop()
+		self.assertEqual(export.error, None)
+		data = SnoopLib.zstandard.ZstdDecompressor().decompressobj().decompress(open(filename, "rb").read())
+		self.assertEqual(len(data.splitlines()), 2501)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,147 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Unit tests of the URL extractors run by 'SnoopLib.PacketProcessor'
+# (stream reassembly, HTTP/RTSP request URLs, routing by ports/schemes).
+#
+# Run from the top directory: "python -m unittest discover tests"
+
+import unittest
+import SnoopLib
+from frames import frame, DLT_EN10MB, DST
+
+TH_ACK, TH_FIN = 0x10, 0x01
+
+def processor(names=None, ports={}, **reasm):
+	""" PacketProcessor with the extractors 'names' (default: all) and
+	    stream reassembly (options 'reasm' for the StreamReassembler). """
+	reassembler = SnoopLib.StreamReassembler(SnoopLib.regex_links, **reasm)
+	return SnoopLib.PacketProcessor(DLT_EN10MB, SnoopLib.create_extractors(names, reassembler, ports))
+
+def run(processor, frames):
+	""" Return the links found in frames (list of frame data), incl. flush. """
+	found = []
+	for (i, data) in enumerate(frames): found += processor.process(SnoopLib.PcapHeader(float(i)), data)
+	return [ item[0] for item in found + processor.flush() ]
+
+def segments(parts, seq=1000, **kwargs):
+	""" TCP segments of one flow with payloads parts (in order). """
+	result = []
+	for part in parts:
+		result.append( frame(part, seq=seq, **kwargs) )
+		seq += len(part)
+	return result
+
+class ReassemblyTest(unittest.TestCase):
+
+	def test_split_url(self):
+		frames = segments([ "see http://example.com/vid", "eo/a.flv and more" ], sport=5000, dport=1935)
+		self.assertEqual(run(processor(["regex"]), frames), [ "http://example.com/video/a.flv" ])
+
+	def test_split_scheme(self):
+		frames = segments([ "see http://example.com/ and ht", "tp://example.com/a.flv " ], sport=5000, dport=1935)
+		self.assertEqual(run(processor(["regex"]), frames), [ "http://example.com/", "http://example.com/a.flv" ])
+
+	def test_retransmit(self):
+		parts = [ "see http://example.com/vid", "eo/a.flv and more" ]
+		frames = segments(parts, sport=5000, dport=1935)
+		frames.insert(1, frames[0])					# (retransmitted segment)
+		frames.insert(3, frame(parts[1][:4] + "XXX", seq=1000 + len(parts[0]), sport=5000, dport=1935))	# (partly)
+		proc = processor(["regex"])
+		self.assertEqual(run(proc, frames), [ "http://example.com/video/a.flv" ])
+		self.assertEqual(proc.reassembler.gaps, 0)
+
+	def test_gap(self):
+		frames = segments([ "see http://example.com/vid", "eo/a.flv and more" ], sport=5000, dport=1935)
+		frames[1] = frame("eo/a.flv and more", seq=5000, sport=5000, dport=1935)	# (segment lost before)
+		proc = processor(["regex"])
+		self.assertEqual(run(proc, frames), [ "http://example.com/vid" ])	# (held part returned)
+		self.assertEqual(proc.reassembler.gaps, 1)
+
+	def test_fin(self):
+		frames = segments([ "see http://example.com/a.flv" ], sport=5000, dport=1935, flags=TH_ACK | TH_FIN)
+		proc = processor(["regex"])
+		self.assertEqual([ item[0] for item in proc.process(SnoopLib.PcapHeader(0.), frames[0]) ],
+				 [ "http://example.com/a.flv" ])
+		self.assertEqual(len(proc.reassembler.flows), 0)
+
+	def test_evicted_memory(self):
+		frames = [ frame("see http://example.com/%i" % i, sport=5000 + i, dport=1935) for i in range(3) ]
+		proc = processor(["regex"], max_flows=2)
+		found = []
+		for data in frames: found += proc.process(SnoopLib.PcapHeader(0.), data)
+		self.assertEqual([ item[0] for item in found ], [ "http://example.com/0" ])	# (not lost)
+		self.assertEqual((len(proc.reassembler.flows), proc.reassembler.evicted_memory), (2, 1))
+
+	def test_evicted_idle(self):
+		proc = processor(["regex"], timeout=10.)
+		found = proc.process(SnoopLib.PcapHeader(0.), frame("see http://example.com/a", sport=5000, dport=1935))
+		found += proc.process(SnoopLib.PcapHeader(20.), frame("see http://example.com/b ", sport=5001, dport=1935))
+		self.assertEqual([ item[0] for item in found ], [ "http://example.com/a", "http://example.com/b" ])
+		self.assertEqual(proc.reassembler.evicted_idle, 1)
+
+	def test_truncated(self):
+		frames = segments([ "see http://example.com/" + "a"*40, "b"*40 ], sport=5000, dport=1935)
+		proc = processor(["regex"], flow_bytes=64)
+		self.assertEqual(run(proc, frames), [ "http://example.com/" + "a"*40 + "b"*40 ])
+		self.assertEqual(proc.reassembler.truncated, 1)
+
+class HttpExtractorTest(unittest.TestCase):
+
+	def test_request_url(self):
+		data = frame("GET /a.ts?x=1 HTTP/1.1\r\nUser-Agent: t\r\nHost: example.com\r\n\r\n")
+		self.assertEqual(run(processor(), [ data ]), [ "http://example.com/a.ts?x=1" ])
+
+	def test_rtsp_request(self):
+		data = frame("DESCRIBE /cam RTSP/1.0\r\nCSeq: 1\r\n\r\n", dport=554)
+		self.assertEqual(run(processor(), [ data ]), [ "rtsp://%s/cam" % DST ])	# (no Host: server address)
+
+	def test_server_port(self):
+		data = frame("GET /x HTTP/1.0\r\n\r\n", dport=8080)
+		self.assertEqual(run(processor(), [ data ]), [ "http://%s:8080/x" % DST ])
+
+	def test_absolute_url_left_to_regex(self):
+		data = frame("GET http://example.com/a.ts HTTP/1.1\r\nHost: example.com\r\n\r\n")
+		proc = processor()
+		self.assertEqual(run(proc, [ data ]), [ "http://example.com/a.ts" ])
+		self.assertEqual(proc.stats()["http"]["requests"], 0)
+
+	def test_binary_body_skipped(self):
+		body = "x http://hidden.com/1 " + "\x00"*70 + "http://hidden.com/2 "
+		head = "HTTP/1.1 200 OK\r\nContent-Type: video/mp4\r\nContent-Length: %i\r\n\r\n" % len(body)
+		frames = segments([ head + body[:40], body[40:] + "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n"
+				   "<a href='http://example.com/page'>" ], sport=80, dport=5000)
+		proc = processor()
+		self.assertEqual(run(proc, frames), [ "http://example.com/page" ])
+		self.assertEqual(proc.stats()["http"]["skipped"], len(body))
+
+	def test_text_body_scanned(self):
+		data = frame("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<a href='http://example.com/page'>", sport=80, dport=5000)
+		self.assertEqual(run(processor(), [ data ]), [ "http://example.com/page" ])
+
+class RoutingTest(unittest.TestCase):
+
+	def test_ports(self):
+		proc = processor(["http", "regex"], {"http": ["8080"]})
+		self.assertEqual(run(proc, [ frame("GET /a HTTP/1.1\r\nHost: h\r\n\r\n", dport=80) ]), [])
+		self.assertEqual(run(proc, [ frame("GET /a HTTP/1.1\r\nHost: h\r\n\r\n", dport=8080) ]), [ "http://h/a" ])
+		self.assertEqual(proc.stats()["http"]["calls"], 1)
+
+	def test_schemes_without_ports(self):
+		proc = processor(["http", "regex"], {"http": []})
+		self.assertEqual(run(proc, [ frame("GET /a HTTP/1.1\r\nHost: h\r\n\r\n", dport=9999) ]), [ "http://h/a" ])
+		self.assertEqual(run(proc, [ frame("binary \x00\x01 data", dport=9999) ]), [])
+		self.assertEqual(proc.stats()["http"]["calls"], 1)			# (not for payloads without its schemes)
+		self.assertEqual(proc.stats()["regex"]["calls"], 2)
+
+	def test_scheme_filter(self):
+		(http, regex) = SnoopLib.create_extractors(["http", "regex"])
+		self.assertEqual((SnoopLib.scheme_filter(http), SnoopLib.scheme_filter(regex)), (None, None))
+		http.ports = ()
+		self.assertTrue(SnoopLib.scheme_filter(http).search("RTSP/1.0 200 OK"))
+		self.assertFalse(SnoopLib.scheme_filter(http).search("ftp://example.com/"))
+
+
+if __name__ == '__main__':
+	unittest.main()
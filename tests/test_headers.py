@@ -0,0 +1,69 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Unit tests of the fixed offset header parser ('SnoopLib.parse_frame').
+#
+# Run from the top directory: "python -m unittest discover tests"
+
+import unittest
+import SnoopLib
+from frames import frame, DLT_EN10MB, DLT_LINUX_SLL, SRC, DST, SRC6, DST6
+
+PAYLOAD = "GET /index.html HTTP/1.1\r\n\r\n"
+
+class ParseFrameTest(unittest.TestCase):
+
+	def check(self, data, src=SRC, dst=DST, proto=6, ports=(1234, 80), datalink=DLT_EN10MB, payload=PAYLOAD):
+		info = SnoopLib.parse_frame(datalink, data)
+		self.assertNotEqual(info, None)
+		(isrc, idst, iproto, sport, dport, start, end) = info[:7]
+		self.assertEqual((SnoopLib.addr_str(isrc), SnoopLib.addr_str(idst)), (src, dst))
+		self.assertEqual((iproto, sport, dport), (proto, ) + ports)
+		self.assertEqual(data[start:end], payload)
+		return info
+
+	def test_ethernet_ipv4_tcp(self):
+		info = self.check(frame(PAYLOAD, seq=4711, flags=0x18))
+		self.assertEqual(info[7:], (4711, 0x18))
+
+	def test_tcp_options(self):
+		self.check(frame(PAYLOAD, options="\x01\x01\x08\x0a" + "\x00"*8))
+
+	def test_ethernet_padding_stripped(self):
+		self.check(frame("", padding="\x00"*6), payload="")
+
+	def test_vlan(self):
+		self.check(frame(PAYLOAD, vlans=[ (SnoopLib.ETH_P_8021Q, 7) ]))
+
+	def test_qinq(self):
+		self.check(frame(PAYLOAD, vlans=[ (SnoopLib.ETH_P_8021AD, 100), (SnoopLib.ETH_P_8021Q, 7) ]))
+
+	def test_ipv6(self):
+		self.check(frame(PAYLOAD, ipv6=True), src=SRC6, dst=DST6)
+
+	def test_linux_sll(self):
+		self.check(frame(PAYLOAD, datalink=DLT_LINUX_SLL), datalink=DLT_LINUX_SLL)
+
+	def test_linux_sll_ipv6(self):
+		self.check(frame(PAYLOAD, datalink=DLT_LINUX_SLL, ipv6=True), src=SRC6, dst=DST6, datalink=DLT_LINUX_SLL)
+
+	def test_udp(self):
+		info = self.check(frame(PAYLOAD, proto=17, dport=554), proto=17, ports=(1234, 554))
+		self.assertEqual(info[7:], (None, None))
+
+	def test_unusual_frames(self):
+		for data in (frame(PAYLOAD, frag=0x2000),		# more fragments
+			     frame(PAYLOAD, frag=0x0010),		# fragment offset
+			     frame(PAYLOAD)[:40],			# truncated TCP header
+			     frame(PAYLOAD, proto=1)):			# ICMP
+			self.assertEqual(SnoopLib.parse_frame(DLT_EN10MB, data), None)
+		self.assertEqual(SnoopLib.parse_frame(12345, frame(PAYLOAD)), None)	# unknown link
+
+	def test_parse_headers(self):
+		(src, dst, payload) = SnoopLib.parse_headers(DLT_EN10MB, frame(PAYLOAD))
+		self.assertEqual((src, dst, str(payload)), (SRC, DST, PAYLOAD))
+
+
+if __name__ == '__main__':
+	unittest.main()
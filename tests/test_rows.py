@@ -0,0 +1,122 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Unit tests of the URL list bookkeeping ('SnoopLib.RowStore',
+# 'SnoopLib.DedupIndex' and 'SnoopLib.NgramIndex').
+#
+# Run from the top directory: "python -m unittest discover tests"
+
+import unittest, os, tempfile
+import SnoopLib
+
+class RowStoreTest(unittest.TestCase):
+
+	def test_unlimited(self):
+		store = SnoopLib.RowStore()
+		for key in range(100): self.assertEqual(store.add(key, (key, "u%i" % key)), [])
+		self.assertEqual(len(store), 100)
+
+	def test_fifo(self):
+		store = SnoopLib.RowStore(3, SnoopLib.RowStore.FIFO)
+		for key in range(3): store.add(key, (key,), data="d%i" % key)
+		store.hit(0, 10)						# (hits do not matter)
+		self.assertEqual(store.add(3, (3,)), [ (0, (0,), 10, "d0") ])
+		self.assertEqual(sorted(store.rows), [1, 2, 3])
+		self.assertEqual(store.evicted, 1)
+
+	def test_least_hit(self):
+		store = SnoopLib.RowStore(3, SnoopLib.RowStore.LEAST_HIT)
+		for key in range(3): store.add(key, (key,))
+		store.hit(0, 5)							# (leaves a stale heap item)
+		store.hit(1, 2)
+		self.assertEqual([ item[0] for item in store.add(3, (3,)) ], [ 2 ])	# least hit
+		self.assertEqual([ item[0] for item in store.add(4, (4,)) ], [ 3 ])	# oldest of equal hits
+		store.remove(1)
+		self.assertEqual(store.add(5, (5,)), [])
+		self.assertEqual(sorted(store.rows), [0, 4, 5])
+
+	def test_spill(self):
+		(handle, filename) = tempfile.mkstemp()
+		os.close(handle)
+		try:
+			store = SnoopLib.RowStore(1, spill=filename)
+			store.add(0, (0, "http://a/"))
+			store.add(1, (1, "http://b/"))
+			store.close()
+			self.assertEqual(open(filename).read(), "0\thttp://a/\t1\n")
+			self.assertEqual(store.spilled, 1)
+		finally:
+			os.remove(filename)
+
+	def test_unknown_policy(self):
+		self.assertRaises(ValueError, SnoopLib.RowStore, 10, "random")
+
+class DedupIndexTest(unittest.TestCase):
+
+	def test_hits(self):
+		index = SnoopLib.DedupIndex(10)
+		(dup, entry) = index.add("http://a/", 1.)
+		self.assertFalse(dup)
+		entry[index.DATA] = "row"
+		(dup, entry) = index.add("http://a/", 2.)
+		self.assertTrue(dup)
+		self.assertEqual(entry, [ 2, 1., 2., "row" ])
+		self.assertEqual(index.hits, 1)
+
+	def test_evicted_to_bloom(self):
+		index = SnoopLib.DedupIndex(2, bloom_bits=2**16)
+		for key in ("a", "b", "c"): index.add(key, 0.)
+		self.assertEqual((len(index), index.evicted), (2, 1))
+		self.assertEqual(index.add("a", 1.), (True, None))		# known to the Bloom filter only
+		self.assertEqual(index.bloom_hits, 1)
+		index = SnoopLib.DedupIndex(2, bloom_bits=0)
+		for key in ("a", "b", "c"): index.add(key, 0.)
+		self.assertFalse(index.add("a", 1.)[0])				# forgotten
+
+	def test_window(self):
+		index = SnoopLib.DedupIndex(10, window=10.)
+		index.add("a", 0.)
+		self.assertTrue(index.add("a", 9.)[0])
+		self.assertTrue(index.add("a", 18.)[0])				# (window counts from last seen)
+		self.assertFalse(index.add("a", 30.)[0])
+
+	def test_bloom_rotation(self):
+		index = SnoopLib.DedupIndex(1, window=10., bloom_bits=2**16)
+		index.add("a", 0.)
+		index.add("b", 1.)						# 'a' evicted to Bloom filter
+		self.assertEqual(index.add("a", 2.), (True, None))
+		index.add("c", 12.)						# rotated; 'a' in previous generation
+		self.assertEqual(index.add("a", 13.), (True, None))
+		index.add("d", 25.)						# rotated again; 'a' dropped
+		self.assertFalse(index.add("a", 26.)[0])
+
+class NgramIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.index = SnoopLib.NgramIndex()
+		for (key, url) in enumerate([ "http://example.com/Video.flv", "rtsp://cam.local/live", "http://example.org/a.flv" ]):
+			self.index.add(key, url)
+
+	def test_search(self):
+		self.assertEqual(self.index.search("video"), [ 0 ])
+		self.assertEqual(self.index.search(".FLV"), [ 0, 2 ])
+		self.assertEqual(self.index.search(".flv", limit=1), [ 0 ])
+		self.assertEqual(self.index.search("example.net"), [])
+		self.assertEqual(self.index.search("a"), [ 0, 1, 2 ])		# (shorter than n: scan all)
+
+	def test_lazy_remove(self):
+		postings = self.index.postings
+		self.index.remove(0)
+		self.index.remove(0)						# (unknown key: ignored)
+		self.assertTrue(postings is self.index.postings)			# stale, not purged yet
+		self.assertEqual(list(postings[".fl"]), [ 0, 2 ])
+		self.assertEqual(self.index.search(".flv"), [ 2 ])
+		self.index.remove(1)						# more than half stale: purged
+		self.assertEqual(list(self.index.postings[".fl"]), [ 2 ])
+		self.assertFalse("vid" in self.index.postings)
+		self.assertEqual((len(self.index), self.index.search("example")), (1, [ 2 ]))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,116 @@
+# This software is provided under under Public Domain. See the accompanying
+# license on https://sourceforge.net/projects/pyurlsnooper/ for more
+# information.
+#
+# Unit tests of the capture profiles and the drop-driven auto-tuning
+# ('SnoopLib.capture_profile' and 'SnoopLib.CaptureTuner').
+#
+# Run from the top directory: "python -m unittest discover tests"
+
+import unittest
+import SnoopLib
+from frames import DLT_EN10MB, DLT_LINUX_SLL
+
+class Capture:
+	""" Live capture handle as seen by the tuner (pcap stats and filter). """
+
+	def __init__(self, datalink=DLT_EN10MB, profile=None):
+		(self.received, self.dropped, self.link, self.profile, self.filter) = (0, 0, datalink, profile, None)
+
+	def stats(self):
+		return (self.received, self.dropped, 0)
+
+	def datalink(self):
+		return self.link
+
+	def setfilter(self, filter):
+		self.filter = filter
+
+class Sniffer:
+	""" Sniffer thread as seen by the tuner ('pcap' and 'swap'). """
+
+	def __init__(self, pcap):
+		self.pcap = pcap
+
+	def swap(self, pcap):
+		self.pcap = pcap
+
+class CaptureProfileTest(unittest.TestCase):
+
+	def test_profile(self):
+		profile = SnoopLib.capture_profile("low-latency", snaplen=None, promisc=True)
+		self.assertEqual(profile["snaplen"], SnoopLib.capture_profiles["low-latency"]["snaplen"])
+		self.assertEqual((profile["promisc"], profile["immediate"]), (True, True))
+		self.assertFalse(SnoopLib.capture_profiles["low-latency"]["promisc"])	# (not changed)
+		self.assertRaises(ValueError, SnoopLib.capture_profile, "fastest")
+
+class CaptureTunerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.opened = []
+		def open_capture(dev=None, filename=None, profile=None):
+			if profile["buffer_size"] > 32*1024*1024: raise SnoopLib.PcapError("buffer too large")
+			self.opened.append( Capture(self.datalink, profile) )
+			return self.opened[-1]
+		(self.open_capture, SnoopLib.open_capture) = (SnoopLib.open_capture, open_capture)
+		self.datalink = DLT_EN10MB
+
+	def tearDown(self):
+		SnoopLib.open_capture = self.open_capture
+
+	def tuner(self, buffer_size=0, snaplen=65535, **kwargs):
+		profile = SnoopLib.capture_profile("default", buffer_size=buffer_size, snaplen=snaplen)
+		return SnoopLib.CaptureTuner("eth0", "tcp", profile, interval=0., min_packets=100, **kwargs)
+
+	def test_next_profile(self):
+		tuner = self.tuner(max_buffer=8*1024*1024, min_snaplen=16384)
+		steps = []
+		while True:
+			profile = tuner.next_profile()
+			if profile is None: break
+			tuner.profile = profile
+			steps.append( (profile["buffer_size"], profile["snaplen"]) )
+		self.assertEqual(steps, [ (4*1024*1024, 65535), (8*1024*1024, 65535), (8*1024*1024, 32767), (8*1024*1024, 16384) ])
+
+	def test_no_drops(self):
+		sniffer = Sniffer(Capture())
+		tuner = self.tuner()
+		sniffer.pcap.received = 10000
+		self.assertEqual(tuner.check(sniffer), None)
+		self.assertEqual(self.opened, [])
+
+	def test_retune(self):
+		first = Capture()
+		sniffer = Sniffer(first)
+		tuner = self.tuner()
+		first.received = 40						# (too few packets to judge)
+		first.dropped = 50
+		self.assertEqual(tuner.check(sniffer), None)
+		first.received = 1000
+		self.assertTrue("reopened with buffer 4194304 bytes" in tuner.check(sniffer))
+		self.assertTrue(sniffer.pcap is self.opened[0])
+		self.assertEqual(sniffer.pcap.filter, "(tcp) or (vlan and tcp)")	# (adapted to the link type)
+		self.assertEqual((tuner.retuned, tuner.profile["buffer_size"]), (1, 4*1024*1024))
+
+	def test_linux_sll_filter(self):
+		self.datalink = DLT_LINUX_SLL
+		sniffer = Sniffer(Capture(DLT_LINUX_SLL))
+		tuner = self.tuner()
+		(sniffer.pcap.received, sniffer.pcap.dropped) = (1000, 100)
+		self.assertTrue(tuner.check(sniffer))
+		self.assertEqual(sniffer.pcap.filter, "tcp")
+
+	def test_retune_failed(self):
+		sniffer = Sniffer(Capture())
+		tuner = self.tuner(buffer_size=32*1024*1024)
+		(sniffer.pcap.received, sniffer.pcap.dropped) = (1000, 100)
+		self.assertTrue("retuning failed: buffer too large" in tuner.check(sniffer))
+		self.assertEqual(tuner.max_buffer, 32*1024*1024)			# (next time: snaplen)
+		sniffer.pcap.received += 1000
+		sniffer.pcap.dropped += 100
+		self.assertTrue("snaplen 32767" in tuner.check(sniffer))
+		self.assertEqual(tuner.retuned, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()